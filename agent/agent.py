@@ -1,32 +1,206 @@
 import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
 import yaml
 import dotenv
-from smolagents import ToolCallingAgent, HfApiModel
+from smolagents import ToolCallingAgent
+from agent.llm import PooledChatModel, create_model
 from tools.retriever_tool import RetrieverTool
 from tools.sql_tool import sql_engine
-from db.rag_store import vector_store
-from smolagents.default_tools import PythonInterpreterTool
+from db.rag_store import get_vector_store
+from telemetry import span
 
 dotenv.load_dotenv()
 
-# Load prompt templates
-with open("agent/agent_prompts.yaml", "r") as f:
-    prompt_templates = yaml.safe_load(f)
-
-# Initialize the retriever tool with our vector store
-retriever_tool = RetrieverTool(vector_store)
-
-# Initialize the model and agent
-model = HfApiModel(token=os.getenv("HF_TOKEN"))
-
-# ToolCalling seems to work much better than CodeAgent
-agent = ToolCallingAgent(
-    tools=[
-        retriever_tool, 
-        sql_engine,
-    ],
-    model=model,
-    max_steps=4,
-    verbosity_level=2,
-    prompt_templates=prompt_templates
-) 
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+# A model id on the HF Inference API, or the URL of any OpenAI-compatible
+# chat completions server (e.g. bench/mock_servers.py). See agent/llm.py for
+# the LLM_BACKEND=openai alternative and the timeout, retry and hedging settings.
+LLM_MODEL_ID = os.getenv("LLM_MODEL_ID", "Qwen/Qwen2.5-Coder-32B-Instruct")
+
+# Everything below is built on first use rather than at import, so the API can
+# start serving (and report its warm-up state) straight away.
+_prompt_templates = None
+_model = None
+_tools = None
+_init_lock = threading.Lock()
+
+def get_prompt_templates() -> dict:
+    global _prompt_templates
+    with _init_lock:
+        if _prompt_templates is None:
+            with open(os.path.join(os.path.dirname(__file__), "agent_prompts.yaml"), "r") as f:
+                _prompt_templates = yaml.safe_load(f)
+        return _prompt_templates
+
+class TracedToolCallingAgent(ToolCallingAgent):
+    """ToolCallingAgent with a span per step and per tool call."""
+
+    def step(self, memory_step):
+        with span("agent.step", {"agent.step_number": memory_step.step_number}):
+            return super().step(memory_step)
+
+    def execute_tool_call(self, tool_name, arguments):
+        # The name comes from the model; an invented one must not add a span name (and metric series) per call
+        known = tool_name in self.tools or tool_name in (getattr(self, "managed_agents", None) or {})
+        with span(f"tool.{tool_name if known else 'unknown'}", {
+            "tool.name": str(tool_name)[:100],
+            "tool.arguments": json.dumps(arguments, default=str)[:1000],
+        }):
+            return super().execute_tool_call(tool_name, arguments)
+
+def get_model() -> PooledChatModel:
+    """The model is a stateless HTTP client with a shared connection pool, so every agent uses it."""
+    global _model
+    with _init_lock:
+        if _model is None:
+            _model = create_model(LLM_MODEL_ID)
+        return _model
+
+def get_tools() -> list:
+    global _tools
+    if _tools is None:
+        # Retriever tool over the active collection (built outside the lock, it can take a while)
+        get_vector_store()
+        tools = [RetrieverTool(), sql_engine]
+        with _init_lock:
+            if _tools is None:
+                _tools = tools
+    return _tools
+
+def create_agent() -> TracedToolCallingAgent:
+    """
+    Builds a new agent. Agents keep the step memory of the run in progress,
+    so two requests must never run on the same instance at the same time.
+    """
+    # ToolCalling seems to work much better than CodeAgent
+    return TracedToolCallingAgent(
+        tools=get_tools(),
+        model=get_model(),
+        max_steps=4,
+        verbosity_level=2,
+        prompt_templates=get_prompt_templates()
+    )
+
+class AgentPoolFull(Exception):
+    """Raised when no agent becomes available in time or the wait queue is full."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AgentPool:
+    """
+    Bounded pool of agents. At most `size` runs happen at once, at most
+    `max_waiting` requests queue for a free agent, and a queued request gives
+    up after `acquire_timeout` seconds.
+    """
+
+    def __init__(self, factory, size: int, max_waiting: int, acquire_timeout: float, retry_after: int):
+        self.size = size
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self.retry_after = retry_after
+        self._factory = factory
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired_total = 0
+        self._rejected_total = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+        self._recent_waits = deque(maxlen=1000)
+
+    def acquire(self) -> ToolCallingAgent:
+        """Checks out an agent, raising AgentPoolFull instead of waiting forever."""
+        with span("agent.acquire"):
+            return self._acquire()
+
+    def _acquire(self) -> ToolCallingAgent:
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_waiting:
+                    self._rejected_total += 1
+                    raise AgentPoolFull("Too many requests waiting for an agent", self.retry_after)
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.acquire_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self._rejected_total += 1
+                raise AgentPoolFull("Timed out waiting for an agent", self.retry_after)
+
+        try:
+            agent = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                agent = self._factory()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._created += 1
+
+        wait = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired_total += 1
+            self._wait_seconds_total += wait
+            self._wait_seconds_max = max(self._wait_seconds_max, wait)
+            self._recent_waits.append(wait)
+        return agent
+
+    def release(self, agent: ToolCallingAgent) -> None:
+        """Returns an agent to the pool."""
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(agent)
+        self._slots.release()
+
+    @contextmanager
+    def checkout(self):
+        agent = self.acquire()
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def stats(self) -> dict:
+        """Occupancy and wait time figures for monitoring."""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            acquired = self._acquired_total
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "occupancy": self._in_use / self.size,
+                "waiting": self._waiting,
+                "max_waiting": self.max_waiting,
+                "acquired_total": acquired,
+                "rejected_total": self._rejected_total,
+                "wait_seconds_avg": self._wait_seconds_total / acquired if acquired else 0.0,
+                "wait_seconds_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "wait_seconds_max": self._wait_seconds_max,
+            }
+
+agent_pool = AgentPool(
+    create_agent,
+    size=int(os.getenv("AGENT_POOL_SIZE", "4")),
+    max_waiting=int(os.getenv("AGENT_POOL_MAX_WAITING", "16")),
+    acquire_timeout=float(os.getenv("AGENT_POOL_TIMEOUT", "30")),
+    retry_after=int(os.getenv("AGENT_POOL_RETRY_AFTER", "5")),
+)
@@ -0,0 +1,288 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import httpx
+from smolagents.models import Model, ChatMessage, parse_tool_args_if_needed
+from telemetry import span, set_attributes
+
+logger = logging.getLogger(__name__)
+
+# hf: HF Inference API (or a TGI endpoint given as LLM_MODEL_ID URL), authenticated with HF_TOKEN.
+# openai: any OpenAI-compatible server at LLM_API_BASE (vLLM, llama.cpp, Ollama...), authenticated with LLM_API_KEY.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "hf")
+# Base URL ending before /chat/completions, e.g. http://localhost:8080/v1. Overrides the backend default.
+LLM_API_BASE = os.getenv("LLM_API_BASE", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Retries after a connection error, timeout, 429 or 5xx, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+# Send a second, identical request when the first hasn't answered after this many ms
+# and keep whichever answers first. 0 disables hedging.
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+# Keep-alive connections shared by all agents
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+HF_ROUTER_URL = "https://router.huggingface.co/hf-inference/models"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """Raised when the chat completions server can't be reached or keeps failing."""
+
+def describe(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return str(error) or type(error).__name__
+
+def hf_endpoint(model_id: str, api_base: str) -> tuple:
+    if api_base:
+        base = api_base
+    elif model_id.startswith(("http://", "https://")):
+        base = model_id.rstrip("/")
+        base = base if base.endswith("/v1") else base + "/v1"
+    else:
+        base = f"{HF_ROUTER_URL}/{model_id}/v1"
+    return base.rstrip("/") + "/chat/completions", os.getenv("HF_TOKEN")
+
+def openai_endpoint(model_id: str, api_base: str) -> tuple:
+    if not api_base:
+        raise ValueError("LLM_API_BASE is required with LLM_BACKEND=openai")
+    return api_base.rstrip("/") + "/chat/completions", os.getenv("LLM_API_KEY")
+
+# backend name -> function(model_id, api_base) returning (chat completions URL, bearer token or None)
+BACKENDS = {"hf": hf_endpoint, "openai": openai_endpoint}
+
+class PooledChatModel(Model):
+    """
+    smolagents Model talking to an OpenAI-style chat completions endpoint
+    through shared keep-alive httpx clients. Calls time out, retry transient
+    failures with jittered backoff and can be hedged. __call__ is what the
+    agents use; acall() is the same call for async code.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        backend: str = "hf",
+        api_base: str = "",
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        hedge_after_ms: float = 0,
+        max_connections: int = 20,
+        custom_role_conversions: dict = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        self.model_id = model_id
+        self.backend = backend
+        self.url, token = BACKENDS[backend](model_id, api_base)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.hedge_after = hedge_after_ms / 1000
+        self.custom_role_conversions = custom_role_conversions
+        self._client_options = {
+            "headers": {"Authorization": f"Bearer {token}"} if token else {},
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        }
+        self.client = httpx.Client(**self._client_options)
+        self._async_client = None
+        # Runs the hedged copies of synchronous calls
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "retries": 0, "hedged": 0, "hedge_wins": 0,
+                       "input_tokens": 0, "output_tokens": 0}
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # Created on first use, inside the event loop that will use it
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options)
+        return self._async_client
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def _payload(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs) -> dict:
+        payload = self._prepare_completion_kwargs(
+            messages=messages,
+            stop_sequences=stop_sequences,
+            tools_to_call_from=tools_to_call_from,
+            convert_images_to_image_urls=True,
+            custom_role_conversions=self.custom_role_conversions,
+            model=self.model_id,
+            **kwargs,
+        )
+        if grammar is not None:
+            payload["response_format"] = grammar
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: a random delay up to retry_backoff * 2^attempt."""
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    def _parse(self, response: httpx.Response, tools_to_call_from) -> ChatMessage:
+        data = response.json()
+        usage = data.get("usage") or {}
+        # Shared by concurrent agents, so only indicative; the span carries this call's counts
+        self.last_input_token_count = usage.get("prompt_tokens")
+        self.last_output_token_count = usage.get("completion_tokens")
+        self._count("input_tokens", usage.get("prompt_tokens") or 0)
+        self._count("output_tokens", usage.get("completion_tokens") or 0)
+        set_attributes({"llm.input_tokens": usage.get("prompt_tokens"), "llm.output_tokens": usage.get("completion_tokens")})
+
+        message = data["choices"][0]["message"]
+        tool_calls = [
+            {
+                "id": tool_call.get("id") or f"call_{i}",
+                "type": tool_call.get("type") or "function",
+                "function": {
+                    "name": tool_call["function"]["name"],
+                    "arguments": tool_call["function"].get("arguments"),
+                },
+            }
+            for i, tool_call in enumerate(message.get("tool_calls") or [])
+        ]
+        chat_message = ChatMessage.from_dict({
+            "role": message.get("role", "assistant"),
+            "content": message.get("content"),
+            "tool_calls": tool_calls or None,
+        })
+        chat_message.raw = data
+        if tools_to_call_from is not None and chat_message.tool_calls:
+            return parse_tool_args_if_needed(chat_message)
+        return chat_message
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUS
+        return isinstance(error, httpx.TransportError)
+
+    def _post(self, payload: dict) -> httpx.Response:
+        response = self.client.post(self.url, json=payload)
+        response.raise_for_status()
+        return response
+
+    def _post_hedged(self, payload: dict) -> httpx.Response:
+        """Posts once and, if no answer comes within hedge_after, once more; the first success wins."""
+        first = self._hedge_executor.submit(self._post, payload)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        self._count("hedged")
+        set_attributes({"llm.hedged": True})
+        second = self._hedge_executor.submit(self._post, payload)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count("hedge_wins")
+                    # The other request can't be interrupted; it finishes on its worker and is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def __call__(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs) -> ChatMessage:
+        payload = self._payload(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        with span("llm.generate", {"llm.model": self.model_id, "llm.backend": self.backend, "llm.messages": len(messages)}):
+            self._count("calls")
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self._post_hedged(payload) if self.hedge_after > 0 else self._post(payload)
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                    if not self._should_retry(error, attempt):
+                        self._count("errors")
+                        raise LLMError(f"Chat completion failed after {attempt + 1} attempts: {describe(error)}") from error
+                    delay = self._backoff(attempt)
+                    logger.warning(f"Chat completion failed ({describe(error)}), retrying in {delay:.2f}s")
+                    self._count("retries")
+                    time.sleep(delay)
+            set_attributes({"llm.attempts": attempt + 1})
+            return self._parse(response, tools_to_call_from)
+
+    async def _apost(self, payload: dict) -> httpx.Response:
+        response = await self.async_client.post(self.url, json=payload)
+        response.raise_for_status()
+        return response
+
+    async def _apost_hedged(self, payload: dict) -> httpx.Response:
+        first = asyncio.ensure_future(self._apost(payload))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        self._count("hedged")
+        set_attributes({"llm.hedged": True})
+        second = asyncio.ensure_future(self._apost(payload))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs) -> ChatMessage:
+        """Async version of __call__: waits on the event loop instead of holding a thread."""
+        payload = self._payload(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        with span("llm.generate", {"llm.model": self.model_id, "llm.backend": self.backend, "llm.messages": len(messages)}):
+            self._count("calls")
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await (self._apost_hedged(payload) if self.hedge_after > 0 else self._apost(payload))
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                    if not self._should_retry(error, attempt):
+                        self._count("errors")
+                        raise LLMError(f"Chat completion failed after {attempt + 1} attempts: {describe(error)}") from error
+                    delay = self._backoff(attempt)
+                    logger.warning(f"Chat completion failed ({describe(error)}), retrying in {delay:.2f}s")
+                    self._count("retries")
+                    await asyncio.sleep(delay)
+            set_attributes({"llm.attempts": attempt + 1})
+            return self._parse(response, tools_to_call_from)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": self.backend, "url": self.url, "hedge_after_ms": self.hedge_after * 1000, **self._stats}
+
+    def close(self) -> None:
+        self.client.close()
+        self._hedge_executor.shutdown(wait=False)
+
+def create_model(model_id: str) -> PooledChatModel:
+    """PooledChatModel configured from the LLM_* environment variables."""
+    return PooledChatModel(
+        model_id=model_id,
+        backend=LLM_BACKEND,
+        api_base=LLM_API_BASE,
+        timeout=LLM_TIMEOUT,
+        connect_timeout=LLM_CONNECT_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        retry_backoff=LLM_RETRY_BACKOFF,
+        hedge_after_ms=LLM_HEDGE_AFTER_MS,
+        max_connections=LLM_MAX_CONNECTIONS,
+    )
@@ -0,0 +1,334 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+import numpy as np
+from datetime import date, timedelta
+from sqlalchemy import select
+from db.db import read_engine, gym_classes, class_occurrences, gym_classes_version, day_of_week
+from telemetry import span, set_attributes
+
+logger = logging.getLogger(__name__)
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# Intents answered without the agent
+ROUTER_INTENTS = {i.strip() for i in os.getenv("ROUTER_INTENTS", "schedule,faq").split(",") if i.strip()}
+# Min cosine similarity to an intent's examples when no rule matched
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.6"))
+# ...and how much closer than the nearest "other" example it must be
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))
+# Longer messages usually ask for more than one thing; leave them to the agent
+ROUTER_MAX_WORDS = int(os.getenv("ROUTER_MAX_WORDS", "25"))
+ROUTER_FAQ_CHUNKS = int(os.getenv("ROUTER_FAQ_CHUNKS", "2"))
+# Classes listed in one schedule answer; the rest are summarised in a "showing N of M" note
+ROUTER_MAX_CLASSES = int(os.getenv("ROUTER_MAX_CLASSES", "20"))
+
+# Patterns run on normalize()d text: lowercase, no accents
+SCHEDULE_PATTERN = re.compile(
+    r"\b(a que hora|cuando (es|son|hay|empieza)|horarios?|que clases|cuales son las clases|que hay (hoy|esta)"
+    r"|what time|when (is|are|does)|schedule|what classes|which classes|any classes|classes (are|is) there)\b"
+)
+CLASS_WORD = re.compile(r"\b(clases?|class|classes|sesion(es)?)\b")
+# Only forms that ask about a gym policy: "cancel", "open" or "cost" on their own
+# also appear in requests to do something ("cancel my booking", "I can't open the app")
+FAQ_PATTERN = re.compile(
+    r"\b(taquillas?|lockers?|precios?|tarifas?|fees?|prices?|pricing|membership|membresia|matricula"
+    r"|invitad[oa]s?|guests?|toallas?|towels?|duchas?|showers?|aparcamiento|normas del \w+|politica de \w+"
+    r"|\w+ polic(y|ies)|(gym|house) rules|opening (hours|times)|horarios? de apertura"
+    r"|(a que hora|cuando) (abre|abren|abris|cierra|cierran|cerrais)|(what time|when) (do|does) (you|it|the \w+) (open|close)"
+    r"|how much (is|does|do|are)|cuanto (cuesta|cuestan|vale|valen)|cuanto es la cuota"
+    r"|how (do|can) i cancel|como (cancelo|se cancela|puedo cancelar)|is there parking|hay parking|se puede aparcar)\b"
+)
+# Requests to act on the user's account or bookings, and problem reports: the agent's job
+ACTION_PATTERN = re.compile(
+    r"\b(quiero|quisiera|necesito|reservame|reservar|apuntame|apuntarme|book me|book a|sign me up"
+    r"|cancela|cancelame|cancelar mi|cancel my|anula\w*|cambia|cambiame|change my|close my|delete my"
+    r"|darme de baja|unsubscribe|mi (cuenta|reserva|plaza)|my (account|booking|reservation|spot)"
+    r"|can t|cant|cannot|no puedo|no me deja|no funciona|doesn t work|app)\b"
+)
+# "Is the pool open tomorrow?" asks about the live status, not the usual hours
+OPEN_STATUS = re.compile(r"\b(open|closed|abiert[oa]s?|cerrad[oa]s?|abre|abren|cierra|cierran)\b")
+NOW = re.compile(r"\b(now|ahora)\b")
+TIMES_OF_DAY = [
+    (re.compile(r"\b(por la manana|de la manana|esta manana|mananas|morning)\b"), ("00:00", "12:00"), " por la mañana"),
+    (re.compile(r"\b(por la tarde|de la tarde|esta tarde|tardes|afternoon)\b"), ("12:00", "20:00"), " por la tarde"),
+    (re.compile(r"\b(por la noche|de la noche|esta noche|noches|tonight|evening|night)\b"), ("18:00", "24:00"), " por la noche"),
+]
+# day_of_week numbering of db.db: 0 = Sunday
+DAY_NAMES = ["domingo", "lunes", "martes", "miércoles", "jueves", "viernes", "sábado"]
+WEEKDAYS = [
+    re.compile(r"\b(domingos?|sundays?)\b"), re.compile(r"\b(lunes|mondays?)\b"),
+    re.compile(r"\b(martes|tuesdays?)\b"), re.compile(r"\b(miercoles|wednesdays?)\b"),
+    re.compile(r"\b(jueves|thursdays?)\b"), re.compile(r"\b(viernes|fridays?)\b"),
+    re.compile(r"\b(sabados?|saturdays?)\b"),
+]
+TODAY = re.compile(r"\b(hoy|today|tonight|esta manana|esta tarde|esta noche)\b")
+# "mañana" on its own is tomorrow; "por/de/esta la mañana" is the morning
+TOMORROW = re.compile(r"\b(tomorrow|pasado manana)\b|(?<!la )(?<!esta )\bmanana\b")
+# Words in class names that don't identify a class on their own
+GENERIC_WORDS = {"class", "clase", "flow", "session", "sesion"}
+
+EXAMPLES = {
+    "schedule": [
+        "what time is the yoga class", "when is pilates", "what classes are there tonight",
+        "which classes does Sarah teach", "class schedule for the morning",
+        "a qué hora es la clase de spin", "qué clases hay esta tarde", "cuándo es hiit",
+        "horario de las clases", "qué clases da Mike",
+    ],
+    "faq": [
+        "what is the cancellation policy", "are lockers free", "what are the opening hours",
+        "how much is the membership", "can I bring a guest",
+        "a qué hora abre el gimnasio", "cómo cancelo una reserva", "cuánto cuesta la cuota",
+        "hay taquillas", "se puede aparcar",
+    ],
+    "other": [
+        "hola", "gracias", "tell me a joke", "what should I eat before training",
+        "book me a spot in yoga tomorrow and tell me the cancellation policy",
+        "recomiéndame una rutina para perder peso", "quiero darme de baja", "cambia mi reserva",
+        "me duele la rodilla, qué clase me recomiendas", "cuál es mejor, pilates o yoga",
+    ],
+}
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w:]+", " ", text).split())
+
+class IntentRouter:
+    """
+    Answers plain schedule and FAQ questions without running the agent.
+    Intents are recognised by regex rules first, then by embedding similarity
+    to the EXAMPLES; anything unrecognised or unanswerable returns None so
+    the caller falls back to the agent.
+    """
+
+    def __init__(self, embed_query, embed_documents, intents: set, threshold: float, margin: float):
+        self.intents = intents
+        self.threshold = threshold
+        self.margin = margin
+        self._embed_query = embed_query
+        self._embed_documents = embed_documents
+        self._examples = None  # intent -> normalized example vectors
+        self._classes = (None, [])  # (gym_classes version, rows)
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "answered": 0, "unmatched": 0, "intents": {}}
+
+    def _example_vectors(self):
+        with self._lock:
+            if self._examples is None:
+                names = [name for name, examples in EXAMPLES.items() for _ in examples]
+                texts = [text for examples in EXAMPLES.values() for text in examples]
+                vectors = np.array(self._embed_documents(texts), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                self._examples = {name: vectors[[i for i, n in enumerate(names) if n == name]] for name in EXAMPLES}
+            return self._examples
+
+    def _class_rows(self) -> list:
+        """The gym_classes table, re-read only after it changes."""
+        version = gym_classes_version()
+        with self._lock:
+            if self._classes[0] == version:
+                return self._classes[1]
+        with read_engine.connect() as con:
+            rows = [dict(row._mapping) for row in con.execute(
+                select(gym_classes).order_by(gym_classes.c.start_time, gym_classes.c.day_of_week)
+            )]
+        with self._lock:
+            self._classes = (version, rows)
+        return rows
+
+    def _mentioned_rows(self, text: str, rows: list) -> list:
+        """Rows whose class name (or a distinctive word of it) or instructor is mentioned in `text`."""
+        mentioned = []
+        for row in rows:
+            class_name = normalize(row["class_name"])
+            instructor = normalize(row["instructor_name"])
+            keys = {class_name, instructor, *instructor.split()}
+            keys |= {word for word in class_name.split() if len(word) > 2 and word not in GENERIC_WORDS}
+            if any(re.search(rf"\b{re.escape(key)}\b", text) for key in keys if key):
+                mentioned.append(row)
+        return mentioned
+
+    def prepare(self) -> None:
+        """Embeds the examples and loads the class table ahead of the first query."""
+        self._example_vectors()
+        self._class_rows()
+
+    def _scores(self, query: str):
+        """Best cosine similarity of `query` to each intent's examples, or None if embeddings are unavailable."""
+        try:
+            examples = self._example_vectors()
+            vector = np.array(self._embed_query(query), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Router embedding classifier unavailable: {e}")
+            return None
+        vector /= np.linalg.norm(vector)
+        return {name: float((vectors @ vector).max()) for name, vectors in examples.items()}
+
+    def classify(self, query: str) -> tuple:
+        """Returns (intent, source, score): source is "rule" or "embedding", intent None if unrecognised."""
+        text = normalize(query)
+        if len(text.split()) > ROUTER_MAX_WORDS or ACTION_PATTERN.search(text):
+            return None, None, 0.0
+        if OPEN_STATUS.search(text) and (NOW.search(text) or self._requested_day(text)[0] is not None):
+            return None, None, 0.0
+        schedule_rule = bool(SCHEDULE_PATTERN.search(text)) and bool(
+            CLASS_WORD.search(text) or self._mentioned_rows(text, self._class_rows())
+            or any(pattern.search(text) for pattern, _, _ in TIMES_OF_DAY)
+            or self._requested_day(text)[0] is not None
+        )
+        faq_rule = bool(FAQ_PATTERN.search(text))
+        if schedule_rule and faq_rule:
+            # Asks about both; the agent can combine them
+            return None, None, 0.0
+
+        if schedule_rule:
+            return "schedule", "rule", 1.0
+        if faq_rule:
+            return "faq", "rule", 1.0
+
+        scores = self._scores(query)
+        if scores is None:
+            return None, None, 0.0
+        intent = max((name for name in scores if name != "other"), key=scores.get)
+        if scores[intent] >= self.threshold and scores[intent] - scores["other"] >= self.margin:
+            return intent, "embedding", scores[intent]
+        return None, None, scores[intent]
+
+    def _requested_day(self, text: str):
+        """(day_of_week, label, date) of the day the query asks about, or (None, "", None). A weekday is its next date."""
+        today = date.today()
+        if TOMORROW.search(text):
+            offset = 2 if "pasado" in text else 1
+            on = today + timedelta(days=offset)
+            return day_of_week(on), " mañana" if offset == 1 else " pasado mañana", on
+        for day, pattern in enumerate(WEEKDAYS):
+            if pattern.search(text):
+                return day, f" el {DAY_NAMES[day]}", today + timedelta(days=(day - day_of_week(today)) % 7)
+        if TODAY.search(text):
+            return day_of_week(today), " hoy", today
+        return None, "", None
+
+    def _cancelled_on(self, on: date) -> set:
+        """class_ids whose occurrence on `on` is cancelled."""
+        with read_engine.connect() as con:
+            return set(con.execute(
+                select(class_occurrences.c.class_id).where(
+                    class_occurrences.c.starts_at >= on.isoformat(),
+                    class_occurrences.c.starts_at < (on + timedelta(days=1)).isoformat(),
+                    class_occurrences.c.status != "scheduled",
+                )
+            ).scalars())
+
+    def answer_schedule(self, query: str):
+        text = normalize(query)
+        rows = self._class_rows()
+        mentioned = self._mentioned_rows(text, rows)
+        selected = mentioned or rows
+        day, label, on = self._requested_day(text)
+        if day is not None:
+            cancelled = self._cancelled_on(on)
+            selected = [
+                row for row in selected if row["day_of_week"] in (None, day) and row["class_id"] not in cancelled
+            ]
+        for pattern, (start, end), time_label in TIMES_OF_DAY:
+            if pattern.search(text):
+                selected = [row for row in selected if start <= row["start_time"] < end]
+                label += time_label
+                break
+        if not selected:
+            return None
+        if mentioned:
+            names = sorted({row["class_name"] for row in selected})
+            header = f"Horario de {', '.join(names)}{label}:"
+        else:
+            header = f"Clases disponibles{label}:"
+        several_locations = len({row["location"] for row in selected}) > 1
+        lines = []
+        for row in selected[:ROUTER_MAX_CLASSES]:
+            when = row["start_time"]
+            if row["day_of_week"] is not None and day is None:
+                when = f"{DAY_NAMES[row['day_of_week']]} {when}"
+            where = f" en {row['location']}" if several_locations else ""
+            lines.append(
+                f"- {row['class_name']}: {when} con {row['instructor_name']}{where} ({row['duration_mins']} min)"
+            )
+        if len(selected) > ROUTER_MAX_CLASSES:
+            lines.append(
+                f"(Mostrando {ROUTER_MAX_CLASSES} de {len(selected)} clases; pregunta por un día, "
+                "una franja horaria o una clase concreta para ver el resto.)"
+            )
+        return header + "\n" + "\n".join(lines)
+
+    def answer_faq(self, query: str):
+        from db.rag_store import get_vector_store
+        from db.retrieval import retrieve
+        docs = retrieve(get_vector_store(), query, k=ROUTER_FAQ_CHUNKS)
+        if not docs:
+            return None
+        return "Esto es lo que dicen nuestras normas:\n\n" + "\n\n".join(doc.page_content.strip() for doc in docs)
+
+    def route(self, query: str):
+        """Returns {"intent", "source", "response"} when the query can be answered directly, else None."""
+        with span("router.route") as router_span:
+            intent, source, score = self.classify(query)
+            response = None
+            if intent in self.intents:
+                try:
+                    response = self.answer_schedule(query) if intent == "schedule" else self.answer_faq(query)
+                except Exception as e:
+                    logger.warning(f"Router failed to answer {intent} intent, falling back to the agent: {e}")
+            set_attributes({"router.intent": intent, "router.source": source, "router.score": score,
+                             "router.answered": response is not None})
+            router_span.update_name(f"router.{intent or 'unmatched'}")
+
+        with self._lock:
+            self._stats["queries"] += 1
+            if intent is None:
+                self._stats["unmatched"] += 1
+            else:
+                counts = self._stats["intents"].setdefault(
+                    intent, {"rule": 0, "embedding": 0, "answered": 0, "fallback": 0}
+                )
+                counts[source] += 1
+                counts["answered" if response is not None else "fallback"] += 1
+            if response is not None:
+                self._stats["answered"] += 1
+        if response is None:
+            return None
+        logger.info(f"Router answered {intent} intent ({source}, score {score:.2f}) without the agent")
+        return {"intent": intent, "source": source, "response": response}
+
+    def stats(self) -> dict:
+        with self._lock:
+            queries = self._stats["queries"]
+            intents = {
+                name: {**counts, "hit_rate": counts["answered"] / queries if queries else 0.0}
+                for name, counts in self._stats["intents"].items()
+            }
+            return {
+                "enabled": True,
+                "intents_answered": sorted(self.intents),
+                "queries": queries,
+                "answered": self._stats["answered"],
+                "unmatched": self._stats["unmatched"],
+                "hit_rate": self._stats["answered"] / queries if queries else 0.0,
+                "intents": intents,
+            }
+
+def _embed_query(text: str) -> list:
+    from db.embeddings import get_embeddings
+    return get_embeddings().embed_query(text)
+
+def _embed_documents(texts: list) -> list:
+    from db.embeddings import get_embeddings
+    return get_embeddings().embed_documents(texts)
+
+intent_router = IntentRouter(
+    _embed_query,
+    _embed_documents,
+    intents=ROUTER_INTENTS,
+    threshold=ROUTER_THRESHOLD,
+    margin=ROUTER_MARGIN,
+)
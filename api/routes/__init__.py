@@ -2,8 +2,14 @@ from fastapi import APIRouter
 from .agent_routes import router as agent_router
 from .class_routes import router as class_router
 from .document_routes import router as document_router
+from .health_routes import router as health_router
+from .metrics_routes import router as metrics_router
+from .whatsapp_routes import router as whatsapp_router
 
 router = APIRouter()
 router.include_router(agent_router)
 router.include_router(class_router)
-router.include_router(document_router) 
\ No newline at end of file
+router.include_router(document_router)
+router.include_router(health_router)
+router.include_router(metrics_router)
+router.include_router(whatsapp_router) 
\ No newline at end of file
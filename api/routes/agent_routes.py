@@ -1,8 +1,16 @@
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from agent.agent import agent
-from api.utils.conversation import load_conversation_memory, save_conversation_memory
+from smolagents.memory import ActionStep, MemoryStep, PlanningStep
+from agent.agent import agent_pool, AgentPoolFull, get_model
+from agent.router import intent_router, ROUTER_ENABLED
+from api.utils.answer_cache import answer_cache
+from api.utils.chat import run_chat, prepare_chat, finish_chat, used_volatile_sql
+from tools.formatting import tool_output_stats
 import os
+import json
+import threading
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -11,39 +19,166 @@ class ChatRequest(BaseModel):
     conversation_id: str = None
     api_key: str = Field(..., description="API key for authentication")
 
-@router.post("/", response_model=dict, status_code=status.HTTP_200_OK)
-def chat_agent(request: ChatRequest):
-    """
-    Chat Agent endpoint that accepts a query and an optional conversation_id.
-    Requires API key authentication.
-    """
-    # Check API key
+def check_api_key(request: ChatRequest) -> None:
     if request.api_key != os.getenv("API_KEY"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
 
-    conversation_id = request.conversation_id
+def pool_full_error(error: AgentPoolFull) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
 
-    if conversation_id:
-        conversation_memory = load_conversation_memory(conversation_id)
-        history_prompt = ""
-        for msg in conversation_memory:
-            history_prompt += f"{msg['role']}: {msg['content']}\n"
-        prompt = history_prompt + f"User: {request.query}\n"
-    else:
-        prompt = request.query
+@router.post("/", response_model=dict, status_code=status.HTTP_200_OK)
+def chat_agent(request: ChatRequest):
+    """
+    Chat Agent endpoint that accepts a query and an optional conversation_id.
+    Requires API key authentication.
+    """
+    check_api_key(request)
 
     try:
-        response = agent.run(prompt)
+        response = run_chat(request.query, request.conversation_id)
+    except AgentPoolFull as e:
+        raise pool_full_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    if conversation_id:
-        conversation_memory = load_conversation_memory(conversation_id)
-        conversation_memory.append({"role": "User", "content": request.query})
-        conversation_memory.append({"role": "Assistant", "content": response})
-        save_conversation_memory(conversation_id, conversation_memory)
+    return {"conversation_id": request.conversation_id, "response": response}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def step_events(step):
+    """Translates one smolagents step log into (event, data) pairs."""
+    if isinstance(step, ActionStep):
+        for tool_call in step.tool_calls or []:
+            if tool_call.name == "final_answer":
+                continue
+            yield "tool_call", {
+                "step": step.step_number,
+                "tool": tool_call.name,
+                "arguments": tool_call.arguments,
+            }
+        if step.observations:
+            yield "observation", {"step": step.step_number, "content": step.observations}
+        if step.error:
+            yield "step_error", {"step": step.step_number, "error": str(step.error)}
+    elif isinstance(step, PlanningStep):
+        yield "plan", {"content": step.plan}
+
+def final_answer_of(item):
+    """
+    Returns the final answer if `item` is the last value of a streamed run.
+    Older smolagents yield the answer itself, newer ones wrap it in a FinalAnswerStep.
+    """
+    if type(item).__name__ == "FinalAnswerStep":
+        return getattr(item, "final_answer", getattr(item, "output", None))
+    if isinstance(item, MemoryStep):
+        return None
+    return item
+
+def immediate_stream(*events: str) -> StreamingResponse:
+    """SSE response whose events are all known up front."""
+    return StreamingResponse(iter(events), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def immediate_answer_stream(response: str, conversation_id: str) -> StreamingResponse:
+    """SSE response for an answer known up front (answer cache or router)."""
+    return immediate_stream(
+        sse_event("final_answer", {"content": response}),
+        sse_event("done", {"conversation_id": conversation_id}),
+    )
+
+@router.post("/stream", status_code=status.HTTP_200_OK)
+def chat_agent_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat. Sends Server-Sent Events as the agent works:
+    `tool_call` and `observation` for each tool use, `final_answer` with the
+    response and a closing `done` event. Errors arrive as an `error` event.
+    """
+    check_api_key(request)
+
+    conversation_id = request.conversation_id
+    try:
+        prepared = prepare_chat(request.query, conversation_id)
+    except Exception as e:
+        return immediate_stream(sse_event("error", {"detail": str(e)}))
+    if prepared["response"] is not None:
+        return immediate_answer_stream(prepared["response"], conversation_id)
+
+    try:
+        agent = agent_pool.acquire()
+    except AgentPoolFull as e:
+        raise pool_full_error(e)
+
+    # Whichever of the generator and the background task runs first owns the agent's release
+    owner = {"claimed": False}
+    owner_lock = threading.Lock()
+
+    def claim() -> bool:
+        with owner_lock:
+            first, owner["claimed"] = not owner["claimed"], True
+            return first
+
+    def release_unstarted_agent():
+        # Background task, for a client that disconnected before the generator
+        # started. Once started, only the generator's finally releases the agent:
+        # a disconnect doesn't stop a step already running on a threadpool thread.
+        if claim():
+            agent_pool.release(agent)
 
-    return {"conversation_id": conversation_id, "response": response}
+    def events():
+        if not claim():
+            return
+        try:
+            response = None
+            for item in agent.run(prepared["prompt"], stream=True):
+                answer = final_answer_of(item)
+                if answer is not None:
+                    response = str(answer)
+                    yield sse_event("final_answer", {"content": response})
+                    continue
+                for event, data in step_events(item):
+                    yield sse_event(event, data)
+            if response is not None:
+                finish_chat(request.query, conversation_id, prepared, response, used_volatile_sql(agent))
+            yield sse_event("done", {"conversation_id": conversation_id})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            agent_pool.release(agent)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_unstarted_agent)
+    )
+
+@router.get("/pool", response_model=dict)
+def agent_pool_stats():
+    """
+    Agent pool occupancy and wait times, LLM client call, retry and hedging
+    counts, and the tokens each tool's observations added to prompts.
+    """
+    return {**agent_pool.stats(), "llm": get_model().stats(), "tool_outputs": tool_output_stats()}
+
+@router.get("/cache", response_model=dict)
+def answer_cache_stats():
+    """
+    Answer cache size and hit/miss counts.
+    """
+    return answer_cache.stats()
+
+@router.get("/router", response_model=dict)
+def intent_router_stats():
+    """
+    Intent router hit rates: how many messages each intent answered without the agent.
+    """
+    if not ROUTER_ENABLED:
+        return {"enabled": False}
+    return intent_router.stats()
@@ -1,16 +1,39 @@
-from fastapi import APIRouter, HTTPException, status
-from pydantic import BaseModel, Field
-from sqlalchemy import insert, text
-from db import engine, gym_classes
+import base64
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, JSONResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from sqlalchemy import insert, select, or_, and_
+from sqlalchemy.exc import IntegrityError
+from db import engine, gym_classes, gym_classes_version, mark_gym_classes_changed, generate_occurrences
+from db.db import normalize_time, DEFAULT_LOCATION, DEFAULT_CAPACITY
+from db.shared_state import store_id
+from db.schedule_io import export_classes, parse_classes, parse_day, upsert_classes
+from api.utils.answer_cache import answer_cache
 
 router = APIRouter(prefix="/classes", tags=["classes"])
 
+TIME_PATTERN = "^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$"
+# Rows accepted by one POST /classes/bulk
+BULK_MAX_ROWS = 5000
+
 class GymClass(BaseModel):
     class_id: int = Field(..., description="Unique identifier for the class")
-    instructor_name: str = Field(..., description="Name of the instructor", max_length=32)
-    class_name: str = Field(..., description="Name of the class", max_length=32)
+    instructor_name: str = Field(..., description="Name of the instructor", max_length=64)
+    class_name: str = Field(..., description="Name of the class", max_length=64)
+    location: str = Field(DEFAULT_LOCATION, description="Gym location the class is held at", max_length=64)
+    day_of_week: Optional[int] = Field(None, description="0 = Sunday ... 6 = Saturday; null for every day", ge=0, le=6)
     start_time: str = Field(..., description="Start time in HH:MM format", pattern="^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$")
     duration_mins: int = Field(..., description="Duration in minutes", gt=0, le=180)
+    capacity: Optional[int] = Field(DEFAULT_CAPACITY, description="Places per occurrence", gt=0)
+
+    @field_validator("start_time")
+    @classmethod
+    def pad_start_time(cls, value: str) -> str:
+        # Stored zero-padded so string comparisons order times correctly
+        return normalize_time(value)
 
     class Config:
         json_schema_extra = {
@@ -18,37 +41,195 @@ class GymClass(BaseModel):
                 "class_id": 5,
                 "instructor_name": "John Smith",
                 "class_name": "CrossFit",
+                "location": "Main",
+                "day_of_week": 2,
                 "start_time": "14:30",
-                "duration_mins": 60
+                "duration_mins": 60,
+                "capacity": 15
             }
         }
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def add_gym_class(gym_class: GymClass):
+def add_gym_class(gym_class: GymClass):
     try:
-        with engine.connect() as connection:
-            stmt = insert(gym_classes).values(**gym_class.dict())
-            with connection.begin() as transaction:
-                transaction.execute(stmt)
+        stmt = insert(gym_classes).values(**gym_class.dict())
+        with engine.begin() as connection:
+            connection.execute(stmt)
+        mark_gym_classes_changed()
+        generate_occurrences()
+        answer_cache.clear("gym_classes changed")
         return {
             "message": "Gym class added successfully",
             "class": gym_class.dict()
         }
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A class with class_id {gym_class.class_id} already exists"
+        )
     except Exception as error:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(error)
         )
 
-@router.get("/", response_model=dict)
-async def get_classes():
+def encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(f"{row['start_time']}|{row['class_id']}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
     try:
+        start_time, class_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return start_time, int(class_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@router.get("/", response_model=dict)
+async def get_classes(
+    request: Request,
+    instructor: Optional[str] = Query(None, description="Exact instructor name"),
+    class_name: Optional[str] = Query(None, description="Exact class name"),
+    location: Optional[str] = Query(None),
+    day_of_week: Optional[int] = Query(None, ge=0, le=6, description="Classes on this day, including daily ones"),
+    start_from: Optional[str] = Query(None, pattern=TIME_PATTERN, description="Classes starting at or after HH:MM"),
+    start_to: Optional[str] = Query(None, pattern=TIME_PATTERN, description="Classes starting before HH:MM"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    compact: bool = Query(False, description="Rows as lists under a single columns header"),
+):
+    # The version changes on every write, so an unchanged poll is answered without touching SQLite
+    query_key = hashlib.sha1(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:12]
+    etag = f'W/"{store_id()}-{gym_classes_version()}-{query_key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Ordered by (start_time, class_id), the key the cursor continues from
+    stmt = select(gym_classes).order_by(gym_classes.c.start_time, gym_classes.c.class_id).limit(limit + 1)
+    if instructor:
+        stmt = stmt.where(gym_classes.c.instructor_name == instructor)
+    if class_name:
+        stmt = stmt.where(gym_classes.c.class_name == class_name)
+    if location:
+        stmt = stmt.where(gym_classes.c.location == location)
+    if day_of_week is not None:
+        stmt = stmt.where(or_(gym_classes.c.day_of_week == day_of_week, gym_classes.c.day_of_week.is_(None)))
+    if start_from:
+        stmt = stmt.where(gym_classes.c.start_time >= normalize_time(start_from))
+    if start_to:
+        stmt = stmt.where(gym_classes.c.start_time < normalize_time(start_to))
+    if cursor:
+        start_time, class_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            gym_classes.c.start_time > start_time,
+            and_(gym_classes.c.start_time == start_time, gym_classes.c.class_id > class_id),
+        ))
+    def fetch() -> list:
         with engine.connect() as connection:
-            result = connection.execute(text("SELECT * FROM gym_classes ORDER BY start_time"))
-            classes = [dict(row._mapping) for row in result]
-        return {"classes": classes}
+            return [dict(row._mapping) for row in connection.execute(stmt)]
+
+    try:
+        classes = await run_in_threadpool(fetch)
+    except Exception as error:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(error)
+        )
+
+    next_cursor = encode_cursor(classes[limit - 1]) if len(classes) > limit else None
+    classes = classes[:limit]
+    if compact:
+        columns = [column.name for column in gym_classes.columns]
+        body = {"columns": columns, "rows": [[row[name] for name in columns] for row in classes]}
+    else:
+        body = {"classes": classes}
+    body["next_cursor"] = next_cursor
+    return JSONResponse(content=body, headers=headers)
+
+def validate_bulk_rows(raw_rows: list) -> tuple:
+    """Validates each row with GymClass. Returns (valid rows, [{"row", "class_id", "error"}]); rows count from 1."""
+    rows, errors, seen = [], [], set()
+    for number, raw in enumerate(raw_rows, start=1):
+        if not isinstance(raw, dict):
+            errors.append({"row": number, "class_id": None, "error": "expected an object"})
+            continue
+        # CSV leaves empty cells as "": treat them as missing so defaults apply
+        values = {key: value for key, value in raw.items() if key and value not in ("", None)}
+        try:
+            if "day_of_week" in values:
+                values["day_of_week"] = parse_day(values["day_of_week"])
+            row = GymClass(**values).dict()
+        except ValidationError as error:
+            message = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+            errors.append({"row": number, "class_id": raw.get("class_id"), "error": message})
+            continue
+        except ValueError as error:
+            errors.append({"row": number, "class_id": raw.get("class_id"), "error": f"day_of_week: {error}"})
+            continue
+        if row["class_id"] in seen:
+            errors.append({"row": number, "class_id": row["class_id"], "error": "duplicate class_id in this batch"})
+            continue
+        seen.add(row["class_id"])
+        rows.append(row)
+    return rows, errors
+
+@router.post("/bulk")
+async def bulk_upsert_classes(request: Request, replace: bool = Query(False, description="Delete classes not in the batch")):
+    """
+    Inserts or updates (by class_id) many classes in one transaction. Takes a
+    JSON array, a CSV body (Content-Type: text/csv) or a multipart "file"
+    upload (.csv or .json). Invalid rows are reported and skipped.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        upload = (await request.form()).get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a file field")
+        data = (await upload.read()).decode("utf-8-sig")
+        format = "json" if (upload.filename or "").lower().endswith(".json") else "csv"
+    else:
+        data = (await request.body()).decode("utf-8-sig")
+        format = "csv" if "csv" in content_type else "json"
+    try:
+        raw_rows = parse_classes(data, format)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse {format}: {error}")
+    if len(raw_rows) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {BULK_MAX_ROWS} classes per request"
+        )
+
+    # Thousands of rows and the occurrence regeneration would block the event loop
+    rows, errors = await run_in_threadpool(validate_bulk_rows, raw_rows)
+    if replace and errors:
+        # Replacing with a partial batch would delete the classes of the invalid rows
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "Nothing was written: replace needs every row to be valid", "errors": errors}
+        )
+    if rows or replace:
+        try:
+            await run_in_threadpool(upsert_classes, rows, replace)
+        except Exception as error:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(error)
+            )
+        answer_cache.clear("gym_classes changed")
+    return {"received": len(raw_rows), "upserted": len(rows), "failed": len(errors), "errors": errors}
+
+@router.get("/export")
+def export_schedule(format: str = Query("csv", pattern="^(csv|json)$")):
+    try:
+        content = export_classes(format)
     except Exception as error:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(error)
         )
+    media_type = "text/csv" if format == "csv" else "application/json"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="gym_classes.{format}"'}
+    )
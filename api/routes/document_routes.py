@@ -1,14 +1,42 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 import os
-from db import add_document
+import uuid
+from db import sync_directory, get_vector_store
+from db.ingest_queue import ingest_queue, IngestQueueFull
+from db.embeddings import get_embedding_cache, EMBEDDING_CACHE_ENABLED, MULTILINGUAL_EMBEDDING_MODEL
+from db.rag_store import load_registry, active_collection, activate_collection
+from db.reindex import reindexer, ReindexInProgress
+from db.retrieval import retrieve_many, retrieval_stats
+from api.utils.answer_cache import answer_cache
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
+# Max queries in one POST /documents/search
+SEARCH_MAX_QUERIES = int(os.getenv("SEARCH_MAX_QUERIES", "32"))
+
+class SearchRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1, description="Queries to run as one batch")
+    k: int = Field(None, ge=1, le=50, description="Chunks per query, defaults to RETRIEVAL_K")
+
+class ReindexRequest(BaseModel):
+    model: str = Field(MULTILINGUAL_EMBEDDING_MODEL, description="Embedding model of the new collection")
+
+def write_file(file_path: str, contents: bytes) -> None:
+    with open(file_path, "wb") as f:
+        f.write(contents)
+
+def remove_file(file_path: str) -> None:
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(file: UploadFile = File(...)):
     """
     Upload a document (PDF or TXT) to be processed by the RAG system.
-    The document will be saved to the data directory and added to the vector store.
+    The document is saved to the data directory and queued for ingestion;
+    poll GET /documents/jobs/{job_id} for progress.
     """
     allowed_extensions = {".pdf", ".txt"}
     file_ext = os.path.splitext(file.filename)[1].lower()
@@ -19,20 +47,154 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Unsupported file type. Allowed types: {', '.join(allowed_extensions)}"
         )
     
+    file_path = os.path.join("data", file.filename)
+    # Written under a name ingestion ignores and moved into place only once the queue
+    # accepts the job, so a 429 leaves neither a new file nor a changed one in data/
+    upload_path = os.path.join("data", f".{file.filename}.{uuid.uuid4().hex}.part")
     try:
-        file_path = os.path.join("data", file.filename)
         contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        num_chunks = add_document(file_path)
-        return {
-            "message": "Document processed successfully",
-            "filename": file.filename,
-            "chunks_added": num_chunks
-        }
+        await run_in_threadpool(write_file, upload_path, contents)
+
+        def on_complete(result):
+            if result["status"] != "unchanged":
+                answer_cache.clear(f"document uploaded: {file.filename}")
+
+        job = ingest_queue.submit(
+            file_path, on_complete=on_complete, on_accept=lambda: os.replace(upload_path, file_path)
+        )
+    except IngestQueueFull as e:
+        remove_file(upload_path)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "10"}
+        )
     except Exception as e:
+        remove_file(upload_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing document: {str(e)}"
         )
+    return {
+        "message": "Document queued for processing",
+        "filename": file.filename,
+        "job_id": job["id"],
+        "status_url": f"/documents/jobs/{job['id']}"
+    }
+
+@router.get("/jobs", response_model=dict)
+async def ingest_queue_stats():
+    """
+    Number of pending ingestion jobs and recent jobs by status.
+    """
+    return ingest_queue.stats()
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_ingest_job(job_id: str):
+    """
+    Status and progress of a document ingestion job.
+    """
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@router.post("/sync", response_model=dict)
+def sync_documents():
+    """
+    Re-syncs the vector store with the data directory: new and changed files
+    are ingested, chunks of deleted files are removed, unchanged files are skipped.
+    """
+    try:
+        results = sync_directory()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error syncing documents: {str(e)}"
+        )
+    if any(r["status"] not in ("unchanged", "failed") for r in results):
+        answer_cache.clear("documents synced")
+    return {"files": results}
+
+@router.post("/search", response_model=dict)
+def search_documents(request: SearchRequest):
+    """
+    Runs several queries against the knowledge base in one batch (one embedding
+    call, one vector query). Each result lists chunk ids; the chunks themselves
+    are returned once in `documents`, however many queries matched them.
+    """
+    if len(request.queries) > SEARCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {SEARCH_MAX_QUERIES} queries per request"
+        )
+    try:
+        results = retrieve_many(get_vector_store(), request.queries, request.k)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching documents: {str(e)}"
+        )
+    documents = {}
+    for docs in results:
+        for doc in docs:
+            documents.setdefault(doc.id, {"content": doc.page_content, "metadata": doc.metadata})
+    return {
+        "results": [
+            {"query": query, "ids": [doc.id for doc in docs]}
+            for query, docs in zip(request.queries, results)
+        ],
+        "documents": documents,
+    }
+
+@router.get("/embedding-cache", response_model=dict)
+async def embedding_cache_stats():
+    """
+    Size and hit/miss counts of the embedding cache shared by ingestion and retrieval.
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_embedding_cache().stats()}
+
+@router.get("/retrieval", response_model=dict)
+async def retrieval_stage_stats():
+    """
+    Retrieval configuration and average time spent in each stage (vector, keyword, fusion, rerank).
+    """
+    return retrieval_stats()
+
+@router.get("/collections", response_model=dict)
+async def list_collections():
+    """
+    The served collection and its embedding model, the other collections
+    (the previous one is kept for a rollback) and the last re-index job.
+    """
+    return {**load_registry(), "active_model": active_collection()["model"],
+            "multilingual": active_collection()["multilingual"], "reindex": reindexer.get()}
+
+@router.post("/reindex", status_code=status.HTTP_202_ACCEPTED)
+async def reindex_documents(request: ReindexRequest):
+    """
+    Re-embeds every document into a new collection with another embedding
+    model in the background. The current collection keeps serving until the
+    new one is complete; poll GET /documents/collections for progress.
+    """
+    try:
+        job = reindexer.start(request.model, on_complete=lambda job: answer_cache.clear(f"re-indexed with {job['model']}"))
+    except ReindexInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"message": "Re-index started", "job": job, "status_url": "/documents/collections"}
+
+@router.post("/collections/{name}/activate", response_model=dict)
+def activate(name: str):
+    """
+    Serves another registered collection, e.g. the previous one to roll back a re-index.
+    """
+    registry = load_registry()
+    if name not in registry["collections"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Collection not found")
+    if registry["collections"][name]["status"] == "building":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Collection is still being built")
+    registry = activate_collection(name)
+    answer_cache.clear(f"collection {name} activated")
+    return registry
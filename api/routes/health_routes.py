@@ -0,0 +1,31 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from api.utils import warmup
+from db.shared_state import shared_state_stats
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live", response_model=dict)
+async def liveness():
+    """
+    The process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+@router.get("/ready", response_model=dict)
+async def readiness():
+    """
+    Vector store and agent are built, or WARMUP_MODE=off leaves them to the
+    first request. Answers 503 with the warm-up state until then.
+    """
+    if warmup.state["status"] in ("ready", "off"):
+        return warmup.state
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=warmup.state)
+
+@router.get("/worker", response_model=dict)
+async def worker():
+    """
+    The worker process that answered, its warm-up status, and the events it
+    published to and received from the other workers.
+    """
+    return {**shared_state_stats(), "warmup": warmup.state["status"]}
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from telemetry import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics: latency histograms of every traced operation and LLM token counts.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,5 +1,68 @@
-from fastapi import APIRouter
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from api.utils.whatsapp import (
+    dispatcher, deduplicator, parse_messages, verify_signature, WHATSAPP_VERIFY_TOKEN, WHATSAPP_APP_SECRET,
+)
+from telemetry import set_attributes
+from telemetry.metrics import whatsapp_messages
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 
-# Placeholder for future WhatsApp webhook endpoints
+@router.get("/webhook", response_class=PlainTextResponse)
+async def verify_webhook(
+    mode: str = Query(None, alias="hub.mode"),
+    verify_token: str = Query(None, alias="hub.verify_token"),
+    challenge: str = Query("", alias="hub.challenge"),
+):
+    """
+    Subscription handshake: Meta calls this with WHATSAPP_VERIFY_TOKEN and expects the challenge back.
+    """
+    if mode != "subscribe" or not WHATSAPP_VERIFY_TOKEN or verify_token != WHATSAPP_VERIFY_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Verification failed")
+    return challenge
+
+@router.post("/webhook", response_model=dict)
+async def receive_webhook(request: Request):
+    """
+    Incoming WhatsApp messages. Checks the X-Hub-Signature-256 signature, drops
+    redelivered message ids and hands the rest to the dispatcher, answering at
+    once; replies are sent when the agent is done (see api/utils/whatsapp.py).
+    """
+    if not WHATSAPP_APP_SECRET:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="WHATSAPP_APP_SECRET is not set")
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("X-Hub-Signature-256")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
+
+    accepted = duplicates = 0
+    for message in parse_messages(payload):
+        if not message["id"] or not message["sender"]:
+            continue
+        # With the sqlite/redis backend the claim is a blocking round trip
+        if await run_in_threadpool(deduplicator.seen, message["id"]):
+            duplicates += 1
+            whatsapp_messages.labels("duplicate").inc()
+            continue
+        whatsapp_messages.labels("received" if message["text"] else "unsupported").inc()
+        dispatcher.submit(message)
+        accepted += 1
+    set_attributes({"whatsapp.accepted": accepted, "whatsapp.duplicates": duplicates})
+    if duplicates:
+        logger.info(f"Dropped {duplicates} redelivered WhatsApp messages")
+    return {"status": "ok", "accepted": accepted, "duplicates": duplicates}
+
+@router.get("/stats", response_model=dict)
+def whatsapp_stats():
+    """
+    Messages received, coalesced and rejected, queue depth and average time to reply.
+    """
+    return {**dispatcher.stats(), "dedup_entries": len(deduplicator)}
@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import logging
+import threading
+from datetime import date
+from collections import OrderedDict
+import numpy as np
+from db.db import gym_classes_version
+from db.embeddings import get_embeddings
+from db.shared_state import subscribe
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+# Questions about the current moment ("is the gym open now", "next yoga class"): their answer
+# changes within the day. Today/tomorrow ones are covered by the date in the data version.
+TIME_DEPENDENT = re.compile(
+    r"\b(now|right now|currently|at the moment|next|upcoming|still"
+    r"|ahora|ahorita|en este momento|siguientes?|próxim[oa]s?|todavía|aún)\b"
+)
+
+def normalize_query(query: str) -> str:
+    """Lowercases, strips punctuation and collapses whitespace so trivial variations match exactly."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+def is_time_dependent(query: str) -> bool:
+    return bool(TIME_DEPENDENT.search(normalize_query(query)))
+
+def data_version() -> tuple:
+    """Changes with every write to gym_classes (including the daily occurrence rollover) and every day."""
+    return gym_classes_version(), date.today().isoformat()
+
+class AnswerCache:
+    """
+    Two-tier cache of agent answers for stateless questions.
+    The exact tier matches normalized query text; the semantic tier matches any
+    cached question whose embedding has cosine similarity >= `threshold`.
+    Entries expire after `ttl` seconds, or once `data_version()` changes, and
+    the least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, embed_query, max_entries: int, ttl: float, threshold: float, data_version=lambda: None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._embed_query = embed_query
+        self._data_version = data_version
+        self._entries = OrderedDict()  # normalized query -> (response, vector, created_at, data version)
+        self._generation = 0  # bumped by clear()
+        self._lock = threading.Lock()
+        self._stats = {
+            "exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "stale_puts": 0,
+        }
+
+    def _embed(self, text: str):
+        try:
+            vector = np.asarray(self._embed_query(text), dtype=np.float32)
+        except Exception as e:
+            # The exact tier still works without embeddings.
+            logger.warning(f"Answer cache could not embed query: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _drop_expired(self, now: float, version) -> None:
+        expired = [
+            key for key, (_, _, created, entry_version) in self._entries.items()
+            if now - created > self.ttl or entry_version != version
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def stamp(self) -> tuple:
+        """
+        Taken before the agent reads any data and passed to `put`: an answer
+        computed across a clear() or a data change is not stored.
+        """
+        with self._lock:
+            return self._generation, self._data_version()
+
+    def lookup(self, query: str):
+        """
+        Returns (response, vector). `response` is None on a miss; pass `vector`
+        back to `put` so the query is not embedded twice.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        version = self._data_version()
+        with self._lock:
+            self._drop_expired(now, version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return self._entries[key][0], self._entries[key][1]
+            candidates = [(k, v) for k, (_, v, _, _) in self._entries.items() if v is not None]
+
+        vector = self._embed(query)
+        if vector is not None and candidates:
+            matrix = np.stack([v for _, v in candidates])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                with self._lock:
+                    entry = self._entries.get(candidates[best][0])
+                    if entry is not None:
+                        self._entries.move_to_end(candidates[best][0])
+                        self._stats["semantic_hits"] += 1
+                        return entry[0], vector
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, vector
+
+    def put(self, query: str, response: str, vector=None, stamp: tuple = None) -> None:
+        key = normalize_query(query)
+        if vector is None:
+            vector = self._embed(query)
+        with self._lock:
+            current = (self._generation, self._data_version())
+            if stamp is not None and stamp != current:
+                self._stats["stale_puts"] += 1
+                return
+            self._entries[key] = (response, vector, time.time(), current[1])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self, reason: str = "") -> None:
+        """Drops every entry; called when documents or classes change."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats["invalidations"] += 1
+        logger.info(f"Answer cache cleared{': ' + reason if reason else ''}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["exact_hits"] + self._stats["semantic_hits"] + self._stats["misses"]
+            hits = lookups - self._stats["misses"]
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                **self._stats,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+answer_cache = AnswerCache(
+    lambda text: get_embeddings().embed_query(text),
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    data_version=data_version,
+)
+
+# Writes made by the other workers invalidate this one's answers too. Chunks added to a
+# collection being re-indexed don't, the switch to it does.
+subscribe("documents", lambda payload: payload["active"] and answer_cache.clear("documents changed in another worker"))
+subscribe("classes", lambda payload: answer_cache.clear("gym_classes changed in another worker"))
+subscribe("collections", lambda payload: answer_cache.clear(f"collection {payload['active']} activated in another worker"))
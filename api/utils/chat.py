@@ -0,0 +1,79 @@
+"""
+The chat flow shared by /chat, /chat/stream and the WhatsApp webhook: intent
+router, conversation history, answer cache, then an agent from the pool.
+"""
+from agent.agent import agent_pool
+from agent.router import intent_router, ROUTER_ENABLED
+from api.utils.conversation import append_conversation_messages
+from api.utils.history import build_prompt
+from api.utils.answer_cache import answer_cache, is_time_dependent, ANSWER_CACHE_ENABLED
+from tools.sql_tool import is_volatile_sql
+from telemetry import span, set_attributes
+
+def record_turn(conversation_id: str, query: str, response: str) -> None:
+    """Appends a user/assistant exchange to the stored conversation."""
+    if not conversation_id:
+        return
+    append_conversation_messages(conversation_id, [
+        {"role": "User", "content": query},
+        {"role": "Assistant", "content": str(response)},
+    ])
+
+def prepare_chat(query: str, conversation_id: str = None) -> dict:
+    """
+    Everything before the agent run. Returns {"response": ...} when the router
+    or the answer cache answered (the turn is already recorded), otherwise
+    {"prompt", "cacheable", "query_vector", "stamp"} to run the agent with and pass to finish_chat().
+    """
+    # Before anything reads the data, so an answer built across a change isn't cached
+    stamp = answer_cache.stamp()
+    with span("chat.build_prompt", {"chat.conversation_id": conversation_id}):
+        prompt = build_prompt(query, conversation_id)
+
+    # Only messages that don't depend on earlier turns ("¿y a qué hora?") are
+    # safe to answer on their own, by the router or from the shared cache.
+    stateless = prompt == query
+    routed = intent_router.route(query) if ROUTER_ENABLED and stateless else None
+    if routed is not None:
+        record_turn(conversation_id, query, routed["response"])
+        return {"response": routed["response"]}
+
+    cacheable = ANSWER_CACHE_ENABLED and stateless and not is_time_dependent(query)
+    query_vector = None
+    if cacheable:
+        cached, query_vector = answer_cache.lookup(query)
+        set_attributes({"chat.answer_cache_hit": cached is not None})
+        if cached is not None:
+            record_turn(conversation_id, query, cached)
+            return {"response": cached}
+    return {"response": None, "prompt": prompt, "cacheable": cacheable, "query_vector": query_vector, "stamp": stamp}
+
+def used_volatile_sql(agent) -> bool:
+    """Whether the agent's last run queried the clock or random(); call before releasing the agent."""
+    for step in agent.memory.steps:
+        for tool_call in getattr(step, "tool_calls", None) or []:
+            arguments = tool_call.arguments
+            query = arguments.get("query", "") if isinstance(arguments, dict) else arguments
+            if tool_call.name == "sql_engine" and is_volatile_sql(str(query)):
+                return True
+    return False
+
+def finish_chat(query: str, conversation_id: str, prepared: dict, response: str, volatile: bool = False) -> None:
+    """Caches the agent's answer if the question was stateless and records the turn."""
+    if prepared["cacheable"] and not volatile:
+        answer_cache.put(query, str(response), prepared["query_vector"], prepared["stamp"])
+    record_turn(conversation_id, query, response)
+
+def run_chat(query: str, conversation_id: str = None) -> str:
+    """
+    Answers one message, from the router or the answer cache when possible,
+    otherwise with an agent from the pool. Raises AgentPoolFull when none is free in time.
+    """
+    prepared = prepare_chat(query, conversation_id)
+    if prepared["response"] is not None:
+        return prepared["response"]
+    with agent_pool.checkout() as agent, span("agent.run"):
+        response = agent.run(prepared["prompt"])
+        volatile = used_volatile_sql(agent)
+    finish_chat(query, conversation_id, prepared, response, volatile)
+    return response
@@ -1,28 +1,419 @@
 import os
+import sys
 import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from telemetry import span, set_attributes
+from db.shared_state import REDIS_URL, file_lock, publish, subscribe
+
+logger = logging.getLogger(__name__)
 
 # Directory to store conversation memory files.
 CONVERSATION_DIR = "data/conversations"
 os.makedirs(CONVERSATION_DIR, exist_ok=True)
+# Written once the legacy JSON files were copied into the store at startup
+MIGRATION_MARKER = os.path.join(CONVERSATION_DIR, ".json_migrated")
+
+# "sqlite" keeps every conversation in one WAL-mode database, "jsonl" keeps an
+# append-only log file per conversation, "redis" (REDIS_URL) a list per conversation
+# that replicas on several hosts share.
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "sqlite").lower()
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "data/conversations.db")
+# Conversations idle for longer than this are deleted (0 disables expiry)
+CONVERSATION_TTL_DAYS = float(os.getenv("CONVERSATION_TTL_DAYS", "30"))
+# Hot conversations kept in memory
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "1024"))
+# Expired conversations are purged at most this often
+EXPIRY_INTERVAL_SECONDS = 3600
+LOCK_STRIPES = 64
+
+class ConversationStore:
+    """
+    Base class for conversation backends. Adds per-conversation locking, an
+    LRU of recently used conversations and periodic TTL expiry on top of the
+    backend's _read/_append/_replace/_delete_idle methods. Backends also keep
+    one rolling summary per conversation (see api/utils/history.py).
+    """
+
+    def __init__(self, cache_size: int, ttl_seconds: float):
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # A fixed set of locks keeps memory bounded however many ids we see.
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._last_expiry = 0.0
+
+    def _lock_for(self, conversation_id: str) -> threading.Lock:
+        return self._locks[hash(conversation_id) % LOCK_STRIPES]
+
+    def _cache_get(self, conversation_id: str):
+        with self._cache_lock:
+            memory = self._cache.get(conversation_id)
+            if memory is not None:
+                self._cache.move_to_end(conversation_id)
+            return memory
+
+    def _cache_put(self, conversation_id: str, memory: list) -> None:
+        with self._cache_lock:
+            self._cache[conversation_id] = memory
+            self._cache.move_to_end(conversation_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _span(self, operation: str, conversation_id: str):
+        return span(f"conversation.{operation}", {
+            "conversation.backend": type(self).__name__,
+            "conversation.id": conversation_id,
+        })
+
+    def load(self, conversation_id: str) -> list:
+        """Returns a copy of the conversation's messages (empty if unknown)."""
+        with self._span("load", conversation_id):
+            memory = self._cache_get(conversation_id)
+            set_attributes({"conversation.cache_hit": memory is not None})
+            if memory is None:
+                with self._lock_for(conversation_id):
+                    memory = self._cache_get(conversation_id)
+                    if memory is None:
+                        memory = self._read(conversation_id)
+                        self._cache_put(conversation_id, memory)
+            set_attributes({"conversation.messages": len(memory)})
+            return list(memory)
+
+    def append(self, conversation_id: str, messages: list) -> None:
+        """Appends messages without rewriting what is already stored."""
+        with self._span("append", conversation_id):
+            with self._lock_for(conversation_id):
+                self._append(conversation_id, messages)
+                memory = self._cache_get(conversation_id)
+                if memory is not None:
+                    self._cache_put(conversation_id, memory + list(messages))
+            publish("conversation", conversation_id)
+            self._maybe_expire()
+
+    def replace(self, conversation_id: str, memory: list) -> None:
+        """Overwrites the whole conversation."""
+        with self._span("replace", conversation_id):
+            with self._lock_for(conversation_id):
+                self._replace(conversation_id, memory)
+                self._cache_put(conversation_id, list(memory))
+            publish("conversation", conversation_id)
+
+    def forget(self, conversation_id: str) -> None:
+        """Drops the cached copy after another worker wrote to the conversation."""
+        with self._cache_lock:
+            self._cache.pop(conversation_id, None)
+
+    def load_summary(self, conversation_id: str):
+        """Returns (summary, messages_covered), or None if no summary was saved."""
+        with self._span("load_summary", conversation_id):
+            return self._read_summary(conversation_id)
+
+    def save_summary(self, conversation_id: str, summary: str, covered: int) -> None:
+        with self._span("save_summary", conversation_id):
+            self._write_summary(conversation_id, summary, covered)
+
+    def expire(self) -> int:
+        """Deletes conversations idle for longer than the TTL. Returns how many were deleted."""
+        if self.ttl_seconds <= 0:
+            return 0
+        expired = self._delete_idle(time.time() - self.ttl_seconds)
+        with self._cache_lock:
+            for conversation_id in expired:
+                self._cache.pop(conversation_id, None)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle conversations")
+        return len(expired)
+
+    def _maybe_expire(self) -> None:
+        now = time.time()
+        if now - self._last_expiry < EXPIRY_INTERVAL_SECONDS:
+            return
+        self._last_expiry = now
+        try:
+            self.expire()
+        except Exception as e:
+            logger.warning(f"Conversation expiry failed: {e}")
+
+class SQLiteConversationStore(ConversationStore):
+    """Stores one row per message in SQLite (WAL mode), so a turn is a single small insert."""
+
+    def __init__(self, path: str, cache_size: int, ttl_seconds: float):
+        super().__init__(cache_size, ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS summaries (
+                    conversation_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    covered INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, seq);
+                CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers proceed while a writer commits.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, conversation_id: str) -> list:
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def _append(self, conversation_id: str, messages: list) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+                [(conversation_id, m["role"], m["content"]) for m in messages],
+            )
+            conn.execute(
+                "INSERT INTO conversations VALUES (?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, time.time()),
+            )
+
+    def _replace(self, conversation_id: str, memory: list) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+                [(conversation_id, m["role"], m["content"]) for m in memory],
+            )
+            conn.execute(
+                "INSERT INTO conversations VALUES (?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, time.time()),
+            )
+
+    def _delete_idle(self, cutoff: float) -> list:
+        with self._connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT conversation_id FROM conversations WHERE updated_at < ?", (cutoff,)
+            )]
+            conn.executemany("DELETE FROM messages WHERE conversation_id = ?", [(c,) for c in expired])
+            conn.executemany("DELETE FROM summaries WHERE conversation_id = ?", [(c,) for c in expired])
+            conn.executemany("DELETE FROM conversations WHERE conversation_id = ?", [(c,) for c in expired])
+        return expired
+
+    def _read_summary(self, conversation_id: str):
+        row = self._connect().execute(
+            "SELECT summary, covered FROM summaries WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _write_summary(self, conversation_id: str, summary: str, covered: int) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (conversation_id, summary, covered))
+
+class JsonlConversationStore(ConversationStore):
+    """Keeps one append-only JSON Lines file per conversation; a turn appends two lines."""
+
+    def __init__(self, directory: str, cache_size: int, ttl_seconds: float):
+        super().__init__(cache_size, ttl_seconds)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}.jsonl")
+
+    def _read(self, conversation_id: str) -> list:
+        path = self._path(conversation_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _append(self, conversation_id: str, messages: list) -> None:
+        with open(self._path(conversation_id), "a") as f:
+            f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages))
+
+    def _summary_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}.summary.json")
+
+    def _replace(self, conversation_id: str, memory: list) -> None:
+        path = self._path(conversation_id)
+        with open(path + ".tmp", "w") as f:
+            f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in memory))
+        os.replace(path + ".tmp", path)
+        if os.path.exists(self._summary_path(conversation_id)):
+            os.remove(self._summary_path(conversation_id))
+
+    def _delete_idle(self, cutoff: float) -> list:
+        expired = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+                conversation_id = entry.name[:-len(".jsonl")]
+                os.remove(entry.path)
+                if os.path.exists(self._summary_path(conversation_id)):
+                    os.remove(self._summary_path(conversation_id))
+                expired.append(conversation_id)
+        return expired
+
+    def _read_summary(self, conversation_id: str):
+        path = self._summary_path(conversation_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        return data["summary"], data["covered"]
+
+    def _write_summary(self, conversation_id: str, summary: str, covered: int) -> None:
+        path = self._summary_path(conversation_id)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"summary": summary, "covered": covered}, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+class RedisConversationStore(ConversationStore):
+    """Keeps each conversation as a Redis list of JSON messages; Redis expires idle ones itself."""
+
+    def __init__(self, url: str, cache_size: int, ttl_seconds: float):
+        super().__init__(cache_size, ttl_seconds)
+        import redis  # optional dependency: pip install redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, conversation_id: str) -> str:
+        return f"gym:conversation:{conversation_id}"
+
+    def _summary_key(self, conversation_id: str) -> str:
+        return f"gym:conversation_summary:{conversation_id}"
+
+    def _touch(self, pipe, conversation_id: str) -> None:
+        if self.ttl_seconds > 0:
+            pipe.expire(self._key(conversation_id), int(self.ttl_seconds))
+            pipe.expire(self._summary_key(conversation_id), int(self.ttl_seconds))
+
+    def _read(self, conversation_id: str) -> list:
+        return [json.loads(m) for m in self._redis.lrange(self._key(conversation_id), 0, -1)]
+
+    def _append(self, conversation_id: str, messages: list) -> None:
+        pipe = self._redis.pipeline()
+        pipe.rpush(self._key(conversation_id), *[json.dumps(m, ensure_ascii=False) for m in messages])
+        self._touch(pipe, conversation_id)
+        pipe.execute()
+
+    def _replace(self, conversation_id: str, memory: list) -> None:
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key(conversation_id), self._summary_key(conversation_id))
+        if memory:
+            pipe.rpush(self._key(conversation_id), *[json.dumps(m, ensure_ascii=False) for m in memory])
+        self._touch(pipe, conversation_id)
+        pipe.execute()
+
+    def _delete_idle(self, cutoff: float) -> list:
+        return []  # keys expire CONVERSATION_TTL_DAYS after their last write
+
+    def _read_summary(self, conversation_id: str):
+        data = self._redis.hgetall(self._summary_key(conversation_id))
+        return (data["summary"], int(data["covered"])) if data else None
+
+    def _write_summary(self, conversation_id: str, summary: str, covered: int) -> None:
+        pipe = self._redis.pipeline()
+        pipe.hset(self._summary_key(conversation_id), mapping={"summary": summary, "covered": covered})
+        self._touch(pipe, conversation_id)
+        pipe.execute()
+
+def create_store() -> ConversationStore:
+    ttl_seconds = CONVERSATION_TTL_DAYS * 86400
+    if CONVERSATION_BACKEND == "sqlite":
+        return SQLiteConversationStore(CONVERSATION_DB_PATH, CONVERSATION_CACHE_SIZE, ttl_seconds)
+    if CONVERSATION_BACKEND == "jsonl":
+        return JsonlConversationStore(CONVERSATION_DIR, CONVERSATION_CACHE_SIZE, ttl_seconds)
+    if CONVERSATION_BACKEND == "redis":
+        return RedisConversationStore(REDIS_URL, CONVERSATION_CACHE_SIZE, ttl_seconds)
+    raise ValueError(f"Unknown CONVERSATION_BACKEND: {CONVERSATION_BACKEND}")
+
+conversation_store = create_store()
+# Turns other workers add would otherwise be missing from this worker's cached copy
+subscribe("conversation", conversation_store.forget)
 
 def memory_file_path(conversation_id: str) -> str:
-    """Returns the file path for the conversation memory JSON file."""
+    """Returns the file path of a legacy conversation memory JSON file."""
     return os.path.join(CONVERSATION_DIR, f"{conversation_id}.json")
 
 def load_conversation_memory(conversation_id: str) -> list:
     """
-    Loads the conversation memory from a JSON file.
-    Returns a list of dicts with keys "role" and "content". If the file does not exist,
-    returns an empty history list.
+    Loads the conversation memory.
+    Returns a list of dicts with keys "role" and "content". If the conversation
+    does not exist, returns an empty history list.
     """
-    path = memory_file_path(conversation_id)
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    return []  # No history yet
+    return conversation_store.load(conversation_id)
 
 def save_conversation_memory(conversation_id: str, memory: list) -> None:
-    """Stores the conversation memory (a list of messages) into a JSON file."""
-    path = memory_file_path(conversation_id)
-    with open(path, "w") as f:
-        json.dump(memory, f, indent=2)
+    """Replaces the stored conversation memory with `memory` (a list of messages)."""
+    conversation_store.replace(conversation_id, memory)
+
+def append_conversation_messages(conversation_id: str, messages: list) -> None:
+    """Appends messages to the conversation; cost does not grow with history length."""
+    conversation_store.append(conversation_id, messages)
+
+def migrate_json_conversations(directory: str = CONVERSATION_DIR, delete: bool = False,
+                               skip_existing: bool = False) -> int:
+    """
+    Copies legacy `<conversation_id>.json` files into the configured store,
+    leaving conversations the store already holds alone if `skip_existing`.
+    Returns the number of conversations migrated.
+    """
+    migrated = 0
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json") or entry.name.endswith(".summary.json"):
+            continue
+        conversation_id = entry.name[:-len(".json")]
+        try:
+            if skip_existing and conversation_store.load(conversation_id):
+                continue
+            with open(entry.path, "r") as f:
+                memory = json.load(f)
+            conversation_store.replace(conversation_id, memory)
+            if delete:
+                os.remove(entry.path)
+            migrated += 1
+        except Exception as e:
+            logger.error(f"Could not migrate {entry.name}: {e}")
+    logger.info(f"Migrated {migrated} conversations to the {CONVERSATION_BACKEND} store")
+    return migrated
+
+def migrate_legacy_conversations() -> int:
+    """
+    Run at startup: on the first start after an upgrade, one worker copies the
+    legacy JSON conversations into the store so they stay visible. Returns the
+    number migrated.
+    """
+    with file_lock(MIGRATION_MARKER + ".lock"):
+        if os.path.exists(MIGRATION_MARKER):
+            return 0
+        migrated = migrate_json_conversations(skip_existing=True)
+        open(MIGRATION_MARKER, "w").close()
+        return migrated
+
+if __name__ == "__main__":
+    # python -m api.utils.conversation migrate [--delete]
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("usage: python -m api.utils.conversation migrate [--delete]")
+        sys.exit(1)
+    print(migrate_json_conversations(delete="--delete" in sys.argv[2:]))
@@ -0,0 +1,91 @@
+import os
+import logging
+from api.utils.conversation import load_conversation_memory, conversation_store
+from tools.formatting import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Max tokens of conversation history (summary + recent turns) put in the prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Max tokens of the rolling summary of older turns
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+
+SUMMARY_PROMPT = (
+    "Update the summary of a conversation between a gym member (User) and the gym assistant (Assistant). "
+    "Keep names, dates, classes, preferences and open requests; drop small talk. "
+    "Answer with the updated summary only, in the language of the conversation, "
+    "in at most {max_tokens} tokens.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}"
+)
+
+def format_message(message: dict) -> str:
+    return f"{message['role']}: {message['content']}\n"
+
+def summarize_with_model(summary: str, messages: list) -> str:
+    """Folds `messages` into `summary` with one LLM call."""
+    from agent.agent import get_model
+    prompt = SUMMARY_PROMPT.format(
+        max_tokens=HISTORY_SUMMARY_TOKENS,
+        summary=summary or "(empty)",
+        messages="".join(format_message(m) for m in messages),
+    )
+    reply = get_model()([{"role": "user", "content": [{"type": "text", "text": prompt}]}])
+    return reply.content.strip()
+
+def summarize_extractive(summary: str, messages: list) -> str:
+    """Fallback when the model is unavailable: keeps the start of each message."""
+    lines = [summary] if summary else []
+    lines += [f"{m['role']}: {m['content'][:120]}" for m in messages]
+    return "\n".join(lines)
+
+def recent_start(memory: list, budget: int) -> int:
+    """Index of the oldest message such that memory[index:] fits in `budget` tokens."""
+    used = 0
+    for index in range(len(memory) - 1, -1, -1):
+        used += count_tokens(format_message(memory[index]))
+        if used > budget:
+            return index + 1
+    return 0
+
+def build_history(conversation_id: str, memory: list, summarize=summarize_with_model) -> str:
+    """
+    Renders `memory` within HISTORY_TOKEN_BUDGET tokens: the newest messages
+    verbatim and, when older ones don't fit, a rolling summary of them.
+
+    The summary is stored with the number of messages it covers and only
+    extended when messages fall out of the window. When that happens the
+    window is shrunk to half the budget, so the next several turns reuse the
+    same summary instead of triggering a new LLM call each.
+    """
+    recent_budget = HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS
+    start = recent_start(memory, recent_budget)
+    if start == 0:
+        return "".join(format_message(m) for m in memory)
+
+    saved = conversation_store.load_summary(conversation_id)
+    summary, covered = saved if saved and saved[1] <= len(memory) else ("", 0)
+    if covered < start:
+        new_covered = max(start, recent_start(memory, recent_budget // 2))
+        try:
+            summary = summarize(summary, memory[covered:new_covered])
+        except Exception as e:
+            logger.warning(f"Summarizing conversation {conversation_id} failed, using extractive summary: {e}")
+            summary = summarize_extractive(summary, memory[covered:new_covered])
+        summary = truncate_tokens(summary, HISTORY_SUMMARY_TOKENS)
+        covered = new_covered
+        conversation_store.save_summary(conversation_id, summary, covered)
+
+    return (
+        f"Summary of the earlier conversation: {summary}\n"
+        + "".join(format_message(m) for m in memory[covered:])
+    )
+
+def build_prompt(query: str, conversation_id: str = None) -> str:
+    """Prepends the stored conversation history (if any), kept within the token budget, to the query."""
+    if not conversation_id:
+        return query
+    memory = load_conversation_memory(conversation_id)
+    if not memory:
+        return query
+    return build_history(conversation_id, memory) + f"User: {query}\n"
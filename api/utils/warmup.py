@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# "background" warms up after the server starts accepting requests, "blocking"
+# before, "off" leaves everything to be built by the first request that needs it.
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+# A failed warm-up is retried after this many seconds, doubling up to WARMUP_RETRY_MAX_SECONDS (0 disables retries)
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+
+state = {
+    "status": "pending",  # pending, warming, ready, failed, or off (WARMUP_MODE=off: ready, built on first use)
+    "started_at": None,
+    "finished_at": None,
+    "attempts": 0,
+    "components": {},  # component name -> seconds it took to build
+    "error": None,
+}
+_lock = threading.Lock()
+
+def warm_up() -> bool:
+    """
+    Builds the vector store, vector and keyword indexes, reranker, router and one
+    agent ahead of the first request. Returns False if it failed.
+    """
+    from db.rag_store import get_vector_store
+    from db.keyword_index import get_keyword_index
+    from db.mmap_store import get_vector_index
+    from db.rag_store import VECTOR_BACKEND
+    from db.retrieval import RETRIEVAL_MODE, RERANKER_MODEL, get_reranker
+    from agent.agent import agent_pool
+    from agent.router import intent_router, ROUTER_ENABLED
+
+    with _lock:
+        if state["status"] in ("warming", "ready"):
+            return True
+        state.update(status="warming", started_at=time.time(), error=None, attempts=state["attempts"] + 1)
+
+    def timed(name, build):
+        start = time.perf_counter()
+        build()
+        state["components"][name] = round(time.perf_counter() - start, 3)
+
+    try:
+        timed("vector_store", get_vector_store)
+        if VECTOR_BACKEND == "mmap":
+            timed("vector_index", lambda: get_vector_index(get_vector_store()))
+        if RETRIEVAL_MODE in ("keyword", "hybrid"):
+            timed("keyword_index", lambda: get_keyword_index(get_vector_store()))
+        if RERANKER_MODEL:
+            timed("reranker", get_reranker)
+        if ROUTER_ENABLED:
+            timed("router", intent_router.prepare)
+        timed("agent", lambda: agent_pool.release(agent_pool.acquire()))
+        state.update(status="ready", finished_at=time.time())
+        logger.info(f"Warm-up finished: {state['components']}")
+        return True
+    except Exception as e:
+        logger.error(f"Warm-up failed (attempt {state['attempts']}): {e}")
+        state.update(status="failed", finished_at=time.time(), error=str(e))
+        return False
+
+def retry_warm_up() -> None:
+    """Retries a failed warm-up with exponential backoff until it succeeds."""
+    delay = WARMUP_RETRY_SECONDS
+    while delay > 0:
+        logger.info(f"Retrying warm-up in {delay:.0f}s")
+        time.sleep(delay)
+        if warm_up():
+            return
+        delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+
+def warm_up_until_ready() -> None:
+    if not warm_up():
+        retry_warm_up()
+
+def start_warm_up() -> None:
+    if WARMUP_MODE == "blocking":
+        # Start serving after a failure too; /health/ready stays 503 until a retry succeeds
+        if not warm_up():
+            threading.Thread(target=retry_warm_up, name="warm-up", daemon=True).start()
+    elif WARMUP_MODE == "background":
+        threading.Thread(target=warm_up_until_ready, name="warm-up", daemon=True).start()
+    elif WARMUP_MODE == "off":
+        state["status"] = "off"
@@ -0,0 +1,316 @@
+"""
+WhatsApp Cloud API channel. The webhook only verifies, deduplicates and queues
+(Meta redelivers any webhook not acknowledged within a few seconds); replies are
+produced by a WhatsAppDispatcher on its own threads and sent through a sender.
+"""
+import os
+import hmac
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import httpx
+from api.utils.chat import run_chat
+from db.shared_state import SHARED_STATE_BACKEND, get_shared_state
+from telemetry.metrics import whatsapp_messages, whatsapp_queue_depth, whatsapp_reply_seconds
+
+logger = logging.getLogger(__name__)
+
+# Token Meta sends back when subscribing the webhook (GET /whatsapp/webhook)
+WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN")
+# App secret signing every webhook (X-Hub-Signature-256); webhooks are refused while it is unset
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
+# cloud sends replies with the Cloud API, log only logs them
+WHATSAPP_SENDER = os.getenv("WHATSAPP_SENDER", "cloud").lower()
+# Graph API base URL, or a local mock such as bench/mock_servers.py
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v21.0").rstrip("/")
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_SEND_RETRIES = int(os.getenv("WHATSAPP_SEND_RETRIES", "2"))
+# Messages from one sender less than this many seconds apart are answered in one agent run...
+WHATSAPP_COALESCE_SECONDS = float(os.getenv("WHATSAPP_COALESCE_SECONDS", "2"))
+# ...but a batch waits at most this long after its first message
+WHATSAPP_COALESCE_MAX_SECONDS = float(os.getenv("WHATSAPP_COALESCE_MAX_SECONDS", "6"))
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", os.getenv("AGENT_POOL_SIZE", "4")))
+# Batches waiting for a worker before senders get BUSY_REPLY instead
+WHATSAPP_QUEUE_SIZE = int(os.getenv("WHATSAPP_QUEUE_SIZE", "64"))
+# Message ids remembered to drop redeliveries (Meta retries for up to 7 days)
+WHATSAPP_DEDUP_SIZE = int(os.getenv("WHATSAPP_DEDUP_SIZE", "100000"))
+WHATSAPP_DEDUP_TTL = float(os.getenv("WHATSAPP_DEDUP_TTL", str(7 * 24 * 3600)))
+# Longest text message the Cloud API accepts
+MAX_TEXT_LENGTH = 4096
+
+BUSY_REPLY = "Ahora mismo estamos recibiendo muchos mensajes. Por favor, vuelve a escribirnos en unos minutos."
+ERROR_REPLY = "Lo siento, ha ocurrido un error al procesar tu mensaje. Inténtalo de nuevo más tarde."
+UNSUPPORTED_REPLY = "Por ahora solo puedo responder a mensajes de texto."
+
+def verify_signature(body: bytes, signature: str) -> bool:
+    """Checks X-Hub-Signature-256 ("sha256=<hex HMAC of the raw body>") against WHATSAPP_APP_SECRET."""
+    if not WHATSAPP_APP_SECRET or not signature:
+        return False
+    expected = "sha256=" + hmac.new(WHATSAPP_APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def parse_messages(payload: dict) -> list:
+    """
+    The incoming messages of a webhook payload as {"id", "sender", "text",
+    "phone_number_id"} dicts; "text" is None for media and other types the
+    agent can't read. Delivery and read receipts are skipped.
+    """
+    messages = []
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+            for message in value.get("messages") or []:
+                kind = message.get("type")
+                if kind == "text":
+                    text = (message.get("text") or {}).get("body")
+                elif kind == "button":
+                    text = (message.get("button") or {}).get("text")
+                elif kind == "interactive":
+                    interactive = message.get("interactive") or {}
+                    text = (interactive.get("button_reply") or interactive.get("list_reply") or {}).get("title")
+                else:
+                    text = None
+                messages.append({
+                    "id": message.get("id"),
+                    "sender": message.get("from"),
+                    "text": text.strip() if text and text.strip() else None,
+                    "phone_number_id": phone_number_id,
+                })
+    return messages
+
+def split_text(text: str, limit: int = MAX_TEXT_LENGTH) -> list:
+    """Splits a reply into messages of at most `limit` characters, at line breaks when possible."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        cut = cut if cut > 0 else limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    return parts + [text] if text else parts
+
+class MessageDeduplicator:
+    """Remembers message ids for `ttl` seconds (at most `max_entries`) to drop webhook redeliveries."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen = OrderedDict()  # message id -> first seen at
+        self._lock = threading.Lock()
+
+    def seen(self, message_id: str) -> bool:
+        """True if `message_id` was already seen; otherwise records it and returns False."""
+        now = time.time()
+        with self._lock:
+            while self._seen and (now - next(iter(self._seen.values())) > self.ttl or len(self._seen) >= self.max_entries):
+                self._seen.popitem(last=False)
+            if message_id in self._seen:
+                return True
+            self._seen[message_id] = now
+        # With several workers the first delivery may have reached another one
+        if SHARED_STATE_BACKEND != "local":
+            try:
+                return not get_shared_state().claim(f"whatsapp:{message_id}", self.ttl)
+            except Exception as e:
+                logger.warning(f"Shared dedup of {message_id} failed, treating it as new: {e}")
+        return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+class CloudApiSender:
+    """Sends text replies with the WhatsApp Cloud API (POST {api_url}/{phone_number_id}/messages)."""
+
+    def __init__(self, api_url: str, token: str, retries: int):
+        self.api_url = api_url
+        self.retries = retries
+        self._client = httpx.Client(
+            timeout=httpx.Timeout(10, connect=5),
+            headers={"Authorization": f"Bearer {token}"} if token else {},
+        )
+
+    def _post(self, url: str, payload: dict) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._client.post(url, json=payload)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    return
+                error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+
+    def send(self, to: str, text: str, phone_number_id: str) -> None:
+        url = f"{self.api_url}/{phone_number_id}/messages"
+        for part in split_text(text):
+            self._post(url, {
+                "messaging_product": "whatsapp",
+                "recipient_type": "individual",
+                "to": to,
+                "type": "text",
+                "text": {"preview_url": False, "body": part},
+            })
+
+class LogSender:
+    """Logs replies instead of sending them, for local runs without a WhatsApp number."""
+
+    def send(self, to: str, text: str, phone_number_id: str) -> None:
+        logger.info(f"WhatsApp reply to {to}: {text}")
+
+def create_sender():
+    if WHATSAPP_SENDER == "cloud":
+        return CloudApiSender(WHATSAPP_API_URL, WHATSAPP_TOKEN, WHATSAPP_SEND_RETRIES)
+    if WHATSAPP_SENDER == "log":
+        return LogSender()
+    raise ValueError(f"Unknown WHATSAPP_SENDER: {WHATSAPP_SENDER}")
+
+class WhatsAppDispatcher:
+    """
+    Turns webhook messages into replies. Messages from one sender arriving less
+    than `window` seconds apart (for at most `max_window` seconds) are joined
+    into one agent run, and a sender never has two runs at once, so replies
+    keep their order and a burst of short messages costs one run. Batches go
+    to `workers` threads through a queue of `queue_size`; when it is full the
+    sender gets BUSY_REPLY. `handler(text, conversation_id)` produces the
+    reply and `sender.send(to, text, phone_number_id)` delivers it.
+    """
+
+    def __init__(self, handler, sender_factory, workers: int, queue_size: int, window: float, max_window: float):
+        self.workers = workers
+        self.window = window
+        self.max_window = max_window
+        self._handler = handler
+        self._sender_factory = sender_factory
+        self._sender = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}  # sender -> batch being collected
+        self._busy = set()  # senders with a batch queued or running
+        self._cond = threading.Condition()
+        self._started = False
+        self._stats = {"messages": 0, "batches": 0, "coalesced": 0, "rejected": 0, "replied": 0, "failed": 0}
+        self._latency_total = 0.0
+
+    @property
+    def sender(self):
+        if self._sender is None:
+            self._sender = self._sender_factory()
+        return self._sender
+
+    @sender.setter
+    def sender(self, sender) -> None:
+        self._sender = sender
+
+    def _start(self) -> None:
+        threading.Thread(target=self._schedule, name="whatsapp-scheduler", daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"whatsapp-worker-{i}", daemon=True).start()
+        self._started = True
+
+    def submit(self, message: dict) -> None:
+        """Adds a message to its sender's batch. Never blocks on the agent."""
+        now = time.time()
+        with self._cond:
+            if not self._started:
+                self._start()
+            self._stats["messages"] += 1
+            batch = self._pending.get(message["sender"])
+            if batch is None:
+                batch = self._pending[message["sender"]] = {
+                    "sender": message["sender"],
+                    "phone_number_id": message["phone_number_id"],
+                    "texts": [],
+                    "received_at": now,
+                }
+            else:
+                self._stats["coalesced"] += 1
+                whatsapp_messages.labels("coalesced").inc()
+            batch["texts"].append(message["text"])
+            batch["due_at"] = min(now + self.window, batch["received_at"] + self.max_window)
+            self._cond.notify()
+
+    def _schedule(self) -> None:
+        """Moves batches whose window closed (and whose sender has no run in progress) to the queue."""
+        while True:
+            rejected = []
+            with self._cond:
+                now = time.time()
+                ready = [batch for sender, batch in self._pending.items()
+                         if sender not in self._busy and batch["due_at"] <= now]
+                for batch in ready:
+                    del self._pending[batch["sender"]]
+                    try:
+                        self._queue.put_nowait(batch)
+                        self._busy.add(batch["sender"])
+                        self._stats["batches"] += 1
+                    except queue.Full:
+                        self._stats["rejected"] += 1
+                        rejected.append(batch)
+                whatsapp_queue_depth.set(self._queue.qsize())
+                waiting = [batch["due_at"] for sender, batch in self._pending.items() if sender not in self._busy]
+                timeout = max(min(waiting) - time.time(), 0) if waiting else None
+                if not rejected:
+                    self._cond.wait(timeout)
+            for batch in rejected:
+                whatsapp_messages.labels("rejected").inc(len(batch["texts"]))
+                logger.warning(f"WhatsApp queue full, {len(batch['texts'])} messages from {batch['sender']} rejected")
+                self._reply(batch, BUSY_REPLY, "rejected")
+
+    def _work(self) -> None:
+        while True:
+            batch = self._queue.get()
+            whatsapp_queue_depth.set(self._queue.qsize())
+            texts = [text for text in batch["texts"] if text]
+            try:
+                if texts:
+                    reply, status = str(self._handler("\n".join(texts), f"whatsapp-{batch['sender']}")), "ok"
+                else:
+                    reply, status = UNSUPPORTED_REPLY, "unsupported"
+            except Exception as e:
+                logger.error(f"WhatsApp run for {batch['sender']} failed: {e}")
+                reply, status = ERROR_REPLY, "failed"
+            self._reply(batch, reply, status)
+            with self._cond:
+                self._busy.discard(batch["sender"])
+                # Messages that arrived during the run are flushed once their window closes
+                self._cond.notify()
+
+    def _reply(self, batch: dict, text: str, status: str) -> None:
+        try:
+            self.sender.send(batch["sender"], text, batch["phone_number_id"])
+        except Exception as e:
+            logger.error(f"Could not send WhatsApp reply to {batch['sender']}: {e}")
+            status = "send_failed"
+        latency = time.time() - batch["received_at"]
+        whatsapp_reply_seconds.labels(status).observe(latency)
+        with self._cond:
+            self._stats["replied" if status in ("ok", "unsupported") else "failed"] += 1
+            self._latency_total += latency
+
+    def stats(self) -> dict:
+        with self._cond:
+            replies = self._stats["replied"] + self._stats["failed"]
+            return {
+                **self._stats,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "collecting": len(self._pending),
+                "running": len(self._busy),
+                "reply_seconds_avg": self._latency_total / replies if replies else 0.0,
+            }
+
+deduplicator = MessageDeduplicator(WHATSAPP_DEDUP_SIZE, WHATSAPP_DEDUP_TTL)
+dispatcher = WhatsAppDispatcher(
+    run_chat,
+    create_sender,
+    workers=WHATSAPP_WORKERS,
+    queue_size=WHATSAPP_QUEUE_SIZE,
+    window=WHATSAPP_COALESCE_SECONDS,
+    max_window=WHATSAPP_COALESCE_MAX_SECONDS,
+)
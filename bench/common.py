@@ -0,0 +1,32 @@
+"""Latency statistics shared by the benchmark scripts."""
+import math
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    """p50/p95/p99/max in milliseconds and throughput for a list of latencies in seconds."""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        "per_second": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+def print_table(rows: dict, rate_label: str = "req/s") -> None:
+    """Prints {name: summarize() result} as an aligned table."""
+    width = max([len(name) for name in rows] + [4])
+    print(f"{'name':<{width}}  {'count':>6}  {'errors':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'max ms':>9}  {rate_label:>9}")
+    for name, row in rows.items():
+        print(
+            f"{name:<{width}}  {row['count']:>6}  {row['errors']:>6}  {row['p50_ms']:>9.2f}  {row['p95_ms']:>9.2f}"
+            f"  {row['p99_ms']:>9.2f}  {row['max_ms']:>9.2f}  {row['per_second']:>9.2f}"
+        )
@@ -0,0 +1,212 @@
+"""
+Load test: replays a JSONL workload against the API at a fixed concurrency and
+reports p50/p95/p99 latency and requests per second, per endpoint and overall.
+
+Each workload line is one request:
+    {"method": "POST", "path": "/chat/", "json": {"query": "...", "conversation_id": "bench-{worker}"}}
+    {"method": "GET", "path": "/classes/"}
+    {"method": "POST", "path": "/documents/upload", "file": {"name": "notice_{n}.txt", "content": "..."}}
+Lines are replayed in order, cycling, until --requests have been sent. "{worker}"
+and "{n}" in strings become the worker number and the request number; /chat
+bodies get the API key added.
+
+By default the API is started with uvicorn in a scratch directory (fresh
+database, vector store and conversations), wired to the mock LLM and embedding
+servers of bench/mock_servers.py, so no HF token is needed:
+    python bench/load_test.py --requests 200 --concurrency 8 --llm-latency-ms 400
+
+--url benchmarks a server that is already running instead. Exits with status 1
+when a --max-* threshold is exceeded.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from common import summarize, print_table
+from mock_servers import start_mock_server, add_arguments, config_from_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def load_workload(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def fill(value, variables: dict):
+    """Substitutes {worker} and {n} in every string of a workload item."""
+    if isinstance(value, str):
+        for key, replacement in variables.items():
+            value = value.replace("{" + key + "}", str(replacement))
+        return value
+    if isinstance(value, dict):
+        return {k: fill(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [fill(v, variables) for v in value]
+    return value
+
+def send(session: requests.Session, base_url: str, item: dict, api_key: str, timeout: float) -> requests.Response:
+    method = item.get("method", "GET")
+    url = base_url + item["path"]
+    if "file" in item:
+        files = {"file": (item["file"]["name"], item["file"]["content"].encode("utf-8"))}
+        return session.request(method, url, files=files, timeout=timeout)
+    body = item.get("json")
+    if body is not None and item["path"].startswith("/chat"):
+        body = {"api_key": api_key, **body}
+    # Reads the whole body, so /chat/stream is timed until the last event
+    return session.request(method, url, json=body, timeout=timeout)
+
+def run_load(base_url: str, workload: list, total: int, concurrency: int, api_key: str, timeout: float) -> dict:
+    results = {}
+    errors = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(worker_id: int):
+        session = requests.Session()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            item = fill(workload[n % len(workload)], {"worker": worker_id, "n": n})
+            name = f"{item.get('method', 'GET')} {item['path']}"
+            start = time.perf_counter()
+            try:
+                ok = send(session, base_url, item, api_key, timeout).status_code < 400
+            except requests.RequestException:
+                ok = False
+            latency = time.perf_counter() - start
+            with lock:
+                results.setdefault(name, []).append(latency)
+                if not ok:
+                    errors[name] = errors.get(name, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for worker_id in range(concurrency):
+            executor.submit(worker, worker_id)
+    elapsed = time.perf_counter() - start
+
+    report = {name: summarize(latencies, elapsed, errors.get(name, 0)) for name, latencies in sorted(results.items())}
+    report["all"] = summarize([l for latencies in results.values() for l in latencies], elapsed, sum(errors.values()))
+    return report
+
+def start_api(workdir: str, mock_url: str, api_key: str, extra_env: dict, workers: int = 1) -> tuple:
+    """Starts uvicorn with `workers` worker processes and `workdir` as working directory. Returns (process, base url)."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "LLM_MODEL_ID": mock_url,
+        "EMBEDDING_BACKEND": "remote",
+        "EMBEDDING_API_URL": mock_url + "/embeddings",
+        "HF_TOKEN": os.environ.get("HF_TOKEN", "mock"),
+        "API_KEY": api_key,
+        "WARMUP_MODE": "blocking",
+        "WEB_CONCURRENCY": str(workers),
+        **extra_env,
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers)],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+def wait_ready(base_url: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + "/health/ready", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{base_url} was not ready after {timeout}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=os.path.join(REPO_ROOT, "bench", "workload.jsonl"))
+    parser.add_argument("--requests", type=int, default=200, help="total requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--url", help="benchmark this running server instead of starting one")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "bench"))
+    parser.add_argument("--docs", default=os.path.join(REPO_ROOT, "data"),
+                        help="PDF/TXT files copied into the scratch data directory before start")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the started server, e.g. --env AGENT_POOL_SIZE=8")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if the overall p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if more than this fraction of requests fail")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    workload = load_workload(args.workload)
+    mock_config = config_from_args(args)
+    proc = workdir = mock_server = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            mock_server = start_mock_server(mock_config)
+            mock_url = f"http://127.0.0.1:{mock_server.server_port}"
+            workdir = tempfile.mkdtemp(prefix="gym-bench-")
+            os.makedirs(os.path.join(workdir, "data"))
+            if os.path.isdir(args.docs):
+                for name in os.listdir(args.docs):
+                    if os.path.splitext(name)[1].lower() in (".pdf", ".txt"):
+                        shutil.copy(os.path.join(args.docs, name), os.path.join(workdir, "data", name))
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            proc, base_url = start_api(workdir, mock_url, args.api_key, extra_env)
+        started = time.perf_counter()
+        wait_ready(base_url, args.ready_timeout)
+        print(f"Server ready in {time.perf_counter() - started:.1f}s, sending {args.requests} requests "
+              f"with concurrency {args.concurrency}")
+
+        report = run_load(base_url, workload, args.requests, args.concurrency, args.api_key, args.timeout)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if mock_server is not None:
+            mock_server.shutdown()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(report)
+    if mock_server is not None:
+        print(f"Mock servers: {mock_config.stats}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": report, "mock": mock_config.stats}, f, indent=2)
+
+    overall = report["all"]
+    failed = False
+    if args.max_p95_ms is not None and overall["p95_ms"] > args.max_p95_ms:
+        print(f"FAIL: p95 {overall['p95_ms']}ms > {args.max_p95_ms}ms")
+        failed = True
+    if args.max_error_rate is not None and overall["count"] and overall["errors"] / overall["count"] > args.max_error_rate:
+        print(f"FAIL: error rate {overall['errors'] / overall['count']:.3f} > {args.max_error_rate}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Microbenchmarks of the building blocks of a /chat request, in-process:
+  - retrieval: retrieve() in vector, keyword and hybrid mode, and retrieve_many() batches
+  - sql: the sql_engine tool with a cold and a warm result cache
+  - conversation: load (cold and cached), append and replace on the sqlite and jsonl stores
+
+Runs in a scratch directory against the mock embedding server of
+bench/mock_servers.py, so nothing in the repo's data/ or chroma_db/ is touched:
+    python bench/micro_bench.py --chunks 2000 --iterations 200 --embed-latency-ms 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from common import summarize, print_table
+from mock_servers import start_mock_server, add_arguments, config_from_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "yoga pilates spin hiit boxing sauna pool locker towel membership fee cancellation refund guest "
+    "instructor schedule morning evening weekend holiday parking shower family student discount card"
+).split()
+QUERIES = [
+    "cancellation fee for classes", "guest pass policy", "locker rules", "sauna opening hours",
+    "student discount on membership", "weekend pool schedule", "refund after cancelling", "parking for members",
+]
+
+def timed(iterations: int, fn) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        call_start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+def write_corpus(path: str, chunks: int) -> None:
+    rng = random.Random(0)
+    with open(path, "w") as f:
+        for i in range(chunks):
+            # ~400 characters, so each paragraph becomes one chunk of the 500-character splitter
+            words = " ".join(rng.choice(WORDS) for _ in range(60))
+            f.write(f"Rule {i}: {words}.\n\n")
+
+def bench_retrieval(args, report: dict) -> None:
+    import db.retrieval as retrieval
+    from db.rag_store import get_vector_store, ingest_file
+
+    write_corpus("data/corpus.txt", args.chunks)
+    start = time.perf_counter()
+    ingest_file("data/corpus.txt")
+    print(f"Ingested {args.chunks} chunks in {time.perf_counter() - start:.1f}s")
+    store = get_vector_store()
+
+    for mode in ("vector", "keyword", "hybrid"):
+        retrieval.RETRIEVAL_MODE = mode
+        report[f"retrieve {mode}"] = timed(args.iterations, lambda i: retrieval.retrieve(store, QUERIES[i % len(QUERIES)]))
+    batch = QUERIES[:5]
+    report["retrieve_many hybrid x5"] = timed(args.iterations, lambda i: retrieval.retrieve_many(store, batch))
+
+def bench_sql(args, report: dict) -> None:
+    from db import init_db
+    import tools.sql_tool as sql_tool
+
+    init_db()
+    queries = [
+        "SELECT * FROM gym_classes",
+        "SELECT class_name, start_time FROM gym_classes WHERE instructor_name = 'Sarah Johnson'",
+        "SELECT COUNT(*) FROM gym_classes WHERE duration_mins > 45",
+    ]
+
+    def cold(i):
+        sql_tool._result_cache.clear()
+        sql_tool.sql_engine(queries[i % len(queries)])
+
+    report["sql_engine cold"] = timed(args.iterations, cold)
+    report["sql_engine cached"] = timed(args.iterations, lambda i: sql_tool.sql_engine(queries[i % len(queries)]))
+
+def bench_conversations(args, report: dict) -> None:
+    from api.utils.conversation import SQLiteConversationStore, JsonlConversationStore
+
+    message = {"role": "user", "content": "What time is the yoga class tomorrow morning? " * 4}
+    history = [message] * args.history
+    stores = {
+        "sqlite": SQLiteConversationStore("data/bench_conversations.db", cache_size=1024, ttl_seconds=0),
+        "jsonl": JsonlConversationStore("data/bench_conversations", cache_size=1024, ttl_seconds=0),
+    }
+    for name, store in stores.items():
+        ids = [f"{name}-{i}" for i in range(args.iterations)]
+        report[f"{name} replace ({args.history} msgs)"] = timed(args.iterations, lambda i: store.replace(ids[i], history))
+        report[f"{name} append (2 msgs)"] = timed(args.iterations, lambda i: store.append(ids[i], [message, message]))
+        store._cache.clear()
+        report[f"{name} load cold"] = timed(args.iterations, lambda i: store.load(ids[i]))
+        report[f"{name} load cached"] = timed(args.iterations, lambda i: store.load(ids[i]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["retrieval", "sql", "conversation"], action="append",
+                        help="run only these benchmarks (repeatable)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=1000, help="chunks in the retrieval corpus")
+    parser.add_argument("--history", type=int, default=20, help="messages per conversation")
+    parser.add_argument("--json", help="also write the report to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+    selected = args.only or ["retrieval", "sql", "conversation"]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    mock_server = start_mock_server(config_from_args(args))
+    os.environ["EMBEDDING_BACKEND"] = "remote"
+    os.environ["EMBEDDING_API_URL"] = f"http://127.0.0.1:{mock_server.server_port}/embeddings"
+    os.environ.setdefault("HF_TOKEN", "mock")
+    # The app's modules create data/, chroma_db/ and the SQLite files relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="gym-microbench-")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    sys.path.insert(0, REPO_ROOT)
+    print(f"Working directory: {workdir}")
+
+    report = {}
+    if "retrieval" in selected:
+        bench_retrieval(args, report)
+    if "sql" in selected:
+        bench_sql(args, report)
+    if "conversation" in selected:
+        bench_conversations(args, report)
+    mock_server.shutdown()
+
+    print_table(report, rate_label="ops/s")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Local stand-ins for the HF Inference API, with configurable latency.
+
+One HTTP server answers both:
+  - POST .../chat/completions  OpenAI-style chat completions. Point the API at it
+    with LLM_MODEL_ID=http://127.0.0.1:8900 (agent/llm.py accepts a URL as model id).
+    The first call of a run asks for one tool (sql_engine for schedule questions,
+    retriever otherwise); once an observation is in the messages it calls
+    final_answer. Calls without tools (history summaries) get plain text.
+  - POST .../embeddings        feature-extraction, as HuggingFaceInferenceAPIEmbeddings
+    calls it. Point the API at it with EMBEDDING_API_URL=http://127.0.0.1:8900/embeddings.
+    Vectors are deterministic per text (384 dims, L2-normalized).
+  - POST .../messages          the WhatsApp Cloud API send endpoint. Point the API at it with
+    WHATSAPP_API_URL=http://127.0.0.1:8900; GET /messages lists the replies received.
+
+Run standalone:
+    python bench/mock_servers.py --port 8900 --llm-latency-ms 400 --embed-latency-ms 30
+"""
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 384
+SCHEDULE_WORDS = ("class", "clase", "schedule", "horario", "instructor", "yoga", "pilates", "hiit", "spin", "time", "hora")
+
+class MockConfig:
+    def __init__(self, llm_latency_ms: float = 400, llm_ms_per_token: float = 0, embed_latency_ms: float = 30,
+                 embed_ms_per_text: float = 1, jitter: float = 0.2, error_rate: float = 0.0):
+        self.llm_latency_ms = llm_latency_ms
+        self.llm_ms_per_token = llm_ms_per_token
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_ms_per_text = embed_ms_per_text
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = {"chat_calls": 0, "embedding_calls": 0, "embedded_texts": 0, "whatsapp_messages": 0, "errors": 0}
+        self.messages = []  # WhatsApp replies: {"to", "text", "received_at"}
+        self.lock = threading.Lock()
+
+    def sleep(self, ms: float) -> None:
+        time.sleep(max(0.0, ms * (1 + random.uniform(-self.jitter, self.jitter))) / 1000)
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += n
+
+def text_of(content) -> str:
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+def embed(text: str) -> list:
+    seed = hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIM)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+def chat_reply(body: dict) -> tuple:
+    """Returns (message, finish_reason) for a chat completion request."""
+    messages = body.get("messages", [])
+    texts = [text_of(m.get("content")) for m in messages]
+    if not body.get("tools"):
+        return {"role": "assistant", "content": "The member asked about classes and gym policies."}, "stop"
+
+    if any("Observation:" in text for text in texts[1:]):
+        name, arguments = "final_answer", {"answer": "Yoga Flow is at 09:00 with Sarah Johnson."}
+    else:
+        task = texts[-1].lower() if texts else ""
+        if any(word in task for word in SCHEDULE_WORDS):
+            name, arguments = "sql_engine", {"query": "SELECT class_name, start_time FROM gym_classes LIMIT 10"}
+        else:
+            name, arguments = "retriever", {"queries": [task[-200:] or "gym policies"]}
+    tool_call = {
+        "id": f"call_{uuid.uuid4().hex[:8]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+    return {"role": "assistant", "content": None, "tool_calls": [tool_call]}, "tool_calls"
+
+def make_handler(config: MockConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, payload) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with config.lock:
+                    return self.send_json(200, dict(config.stats))
+            if self.path.rstrip("/") == "/messages":
+                with config.lock:
+                    return self.send_json(200, list(config.messages))
+            self.send_json(200, {"status": "ok"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if random.random() < config.error_rate:
+                config.count("errors")
+                return self.send_json(503, {"error": "mock overloaded"})
+
+            if self.path.endswith("/chat/completions"):
+                config.count("chat_calls")
+                message, finish_reason = chat_reply(body)
+                prompt_tokens = sum(len(text_of(m.get("content")).split()) for m in body.get("messages", [])) * 4 // 3
+                completion_tokens = 24
+                config.sleep(config.llm_latency_ms + config.llm_ms_per_token * completion_tokens)
+                return self.send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model") or "mock",
+                    "system_fingerprint": "mock",
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+            if "embeddings" in self.path or "feature-extraction" in self.path:
+                inputs = body.get("inputs", [])
+                texts = [inputs] if isinstance(inputs, str) else list(inputs)
+                config.count("embedding_calls")
+                config.count("embedded_texts", len(texts))
+                config.sleep(config.embed_latency_ms + config.embed_ms_per_text * len(texts))
+                vectors = [embed(text) for text in texts]
+                return self.send_json(200, vectors[0] if isinstance(inputs, str) else vectors)
+
+            if self.path.endswith("/messages"):
+                config.count("whatsapp_messages")
+                with config.lock:
+                    config.messages.append({
+                        "to": body.get("to"),
+                        "text": (body.get("text") or {}).get("body"),
+                        "received_at": time.time(),
+                    })
+                return self.send_json(200, {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                    "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+                })
+
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+    return Handler
+
+def start_mock_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts the server on a daemon thread and returns it; its URL is http://host:server.server_port."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-server", daemon=True).start()
+    return server
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="base latency of a chat completion")
+    parser.add_argument("--llm-ms-per-token", type=float, default=0, help="extra latency per generated token")
+    parser.add_argument("--embed-latency-ms", type=float, default=30, help="base latency of an embedding call")
+    parser.add_argument("--embed-ms-per-text", type=float, default=1, help="extra latency per embedded text")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latencies vary by up to this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a 503")
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        llm_latency_ms=args.llm_latency_ms,
+        llm_ms_per_token=args.llm_ms_per_token,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_ms_per_text=args.embed_ms_per_text,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = start_mock_server(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM:        LLM_MODEL_ID=http://{args.host}:{server.server_port}")
+    print(f"Mock embeddings: EMBEDDING_API_URL=http://{args.host}:{server.server_port}/embeddings")
+    print(f"Mock WhatsApp:   WHATSAPP_API_URL=http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
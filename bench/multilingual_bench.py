@@ -0,0 +1,173 @@
+"""
+Measures what querying the retriever in Spanish saves, on a small set of
+Spanish questions about English policy documents:
+
+  - retrieval: hit rate (the passage answering the question in the top k) and
+    latency of the English collection (all-MiniLM-L6-v2) queried with the
+    English translation, as the agent had to, and with the Spanish question
+    as is, against a multilingual collection queried in Spanish
+  - with --agent: agent steps, LLM calls, retriever calls, input tokens and
+    latency per question with each collection, the agent switching its prompt
+    and tool description to the collection's language
+
+Both collections are built in a scratch directory, the multilingual one with
+the same re-index job as POST /documents/reindex. Results only mean something
+with real models, e.g. EMBEDDING_BACKEND=local (or an HF_TOKEN) and, for
+--agent, an LLM_MODEL_ID:
+    EMBEDDING_BACKEND=local python bench/multilingual_bench.py --k 3 --agent
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from common import summarize, print_table
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (passage, Spanish question, English translation), one passage per document
+BENCHMARK_SET = [
+    ("Members must cancel a class booking at least 24 hours in advance. Late cancellations and no-shows are charged a 5 euro fee.",
+     "¿Cuánto cuesta cancelar una clase tarde?", "late class cancellation fee"),
+    ("Lockers are free for members during their visit. Padlocks can be bought at reception; lockers are emptied every night at closing time.",
+     "¿Puedo dejar mis cosas en la taquilla por la noche?", "leave belongings in locker overnight"),
+    ("The gym opens from 6:30 to 23:00 on weekdays and from 8:00 to 21:00 on weekends and public holidays.",
+     "¿A qué hora abrís los domingos?", "opening hours on Sundays"),
+    ("Members may bring a guest up to twice a month. Guests pay a 10 euro day pass and must show an identity document.",
+     "¿Puedo traer a un amigo al gimnasio?", "bring a guest to the gym"),
+    ("Memberships can be frozen for one to three months per year for medical reasons or travel, with a written request two weeks ahead.",
+     "Me voy de viaje dos meses, ¿puedo congelar mi cuota?", "freeze membership while travelling"),
+    ("Students under 26 with a valid student card get a 20 percent discount on the monthly membership.",
+     "¿Hay descuento para estudiantes?", "student discount"),
+    ("Towels are not provided. Members must bring their own towel and use it on every machine and mat.",
+     "¿Tenéis toallas o tengo que traer la mía?", "are towels provided"),
+    ("The sauna is for adults only, with sessions of at most 15 minutes. Swimwear is mandatory in the sauna.",
+     "¿Cuánto tiempo puedo estar en la sauna?", "maximum sauna session time"),
+    ("Parking in the underground car park is free for members for up to two hours; show your membership card at the exit.",
+     "¿Es gratis aparcar en el parking?", "free parking for members"),
+    ("Children aged 14 and 15 can train only with a parent or guardian present. From 16 they can train alone with signed parental consent.",
+     "¿Mi hijo de 15 años puede entrenar solo?", "can a 15 year old train alone"),
+    ("Monthly fees are charged by direct debit on the first working day of the month. A returned payment adds a 3 euro charge.",
+     "¿Qué día se cobra la mensualidad?", "when is the monthly fee charged"),
+    ("To cancel a membership, submit the cancellation form at reception or by email before the 20th for it to apply the next month.",
+     "¿Cómo me doy de baja del gimnasio?", "how to cancel membership"),
+]
+
+def write_corpus(directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for i, (passage, _, _) in enumerate(BENCHMARK_SET):
+        with open(os.path.join(directory, f"policy_{i:02d}.txt"), "w", encoding="utf-8") as f:
+            f.write(passage + "\n")
+
+def expected_source(i: int) -> str:
+    return os.path.normpath(os.path.join("data", f"policy_{i:02d}.txt"))
+
+def evaluate_retrieval(k: int, iterations: int) -> dict:
+    from db.rag_store import get_vector_store
+    from db.retrieval import retrieve
+    store = get_vector_store()
+    report = {}
+    for language, column in (("en", 2), ("es", 1)):
+        hits, latencies = 0, []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for i, item in enumerate(BENCHMARK_SET):
+                call_start = time.perf_counter()
+                docs = retrieve(store, item[column], k)
+                latencies.append(time.perf_counter() - call_start)
+                hits += any(doc.metadata.get("source") == expected_source(i) for doc in docs)
+        report[language] = {
+            **summarize(latencies, time.perf_counter() - start),
+            "hit_rate": hits / (len(BENCHMARK_SET) * iterations),
+        }
+    return report
+
+def evaluate_agent() -> dict:
+    from smolagents.memory import ActionStep
+    from agent.agent import create_agent
+    totals = {"steps": 0, "llm_calls": 0, "retriever_calls": 0, "input_tokens": 0, "errors": 0}
+    latencies = []
+    for _, question, _ in BENCHMARK_SET:
+        agent = create_agent()
+        start = time.perf_counter()
+        try:
+            agent.run(question)
+        except Exception as e:
+            print(f"  {question}: {e}")
+            totals["errors"] += 1
+        latencies.append(time.perf_counter() - start)
+        steps = [step for step in agent.memory.steps if isinstance(step, ActionStep)]
+        totals["steps"] += len(steps)
+        totals["llm_calls"] += sum(1 for step in steps if step.model_output_message is not None)
+        totals["retriever_calls"] += sum(
+            1 for step in steps for call in (step.tool_calls or []) if call.name == "retriever"
+        )
+        totals["input_tokens"] += agent.monitor.get_total_token_counts()["input"]
+    n = len(BENCHMARK_SET)
+    return {
+        **{f"{key}_avg": value / n for key, value in totals.items() if key != "errors"},
+        **summarize(latencies, sum(latencies), totals["errors"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3, help="chunks per query (RETRIEVAL_K)")
+    parser.add_argument("--iterations", type=int, default=5, help="passes over the questions for retrieval latency")
+    parser.add_argument("--agent", action="store_true", help="also run the agent on every question (needs an LLM)")
+    parser.add_argument("--model", help="multilingual embedding model, defaults to MULTILINGUAL_EMBEDDING_MODEL")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    # Paths in db/ are relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="gym-multilingual-")
+    print(f"Working directory: {workdir}")
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(workdir)
+    write_corpus("data")
+    sys.path.insert(0, REPO_ROOT)
+    from db.db import init_db
+    from db.embeddings import EMBEDDING_MODEL, MULTILINGUAL_EMBEDDING_MODEL
+    from db.rag_store import get_vector_store, activate_collection
+    from db.reindex import new_job, reindex
+    init_db()
+
+    start = time.perf_counter()
+    english = get_vector_store()._collection.name
+    job = reindex(new_job(args.model or MULTILINGUAL_EMBEDDING_MODEL))
+    if job["status"] != "succeeded":
+        sys.exit(f"Re-index failed: {job['error']}")
+    print(f"Built both collections in {time.perf_counter() - start:.1f}s")
+
+    collections = {EMBEDDING_MODEL: english, job["model"]: job["collection"]}
+    retrieval, agent = {}, {}
+    for model, name in collections.items():
+        activate_collection(name)
+        retrieval[model] = evaluate_retrieval(args.k, args.iterations)
+        if args.agent:
+            agent[model] = evaluate_agent()
+
+    rows = {
+        "english, translated": retrieval[EMBEDDING_MODEL]["en"],
+        "english, spanish": retrieval[EMBEDDING_MODEL]["es"],
+        "multilingual, spanish": retrieval[job["model"]]["es"],
+    }
+    print_table({f"retrieve {label}": result for label, result in rows.items()}, rate_label="queries/s")
+    print(f"\n{'hit rate @' + str(args.k):<24}" + "".join(f"{label:>24}" for label in rows))
+    print(f"{'':<24}" + "".join(f"{result['hit_rate']:>24.0%}" for result in rows.values()))
+    if agent:
+        columns = ("steps_avg", "llm_calls_avg", "retriever_calls_avg", "input_tokens_avg", "p50_ms", "errors")
+        print(f"\n{'agent':<24}" + "".join(f"{column:>20}" for column in columns))
+        for model, result in agent.items():
+            label = "multilingual" if model != EMBEDDING_MODEL else "english"
+            print(f"{label:<24}" + "".join(f"{result[column]:>20.1f}" for column in columns))
+        english_result, multilingual_result = agent[EMBEDDING_MODEL], agent[job["model"]]
+        print(f"\nSaved per question: {english_result['steps_avg'] - multilingual_result['steps_avg']:.2f} steps, "
+              f"{english_result['input_tokens_avg'] - multilingual_result['input_tokens_avg']:.0f} input tokens, "
+              f"{english_result['p50_ms'] - multilingual_result['p50_ms']:.0f} ms p50")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"config": vars(args), "retrieval": retrieval, "agent": agent}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Checks that throughput scales with the number of uvicorn workers in the shared
+deployment mode. For each worker count it starts, in a scratch directory, a
+Chroma server (chroma run, standing in for the shared vector service) and the
+API with WEB_CONCURRENCY workers using it and the sqlite shared state, replays
+the load test workload and reports requests per second.
+
+After each load run it checks that the workers agree, with a new connection
+per request so they land on different workers:
+  - an uploaded document's ingestion job can be polled through any worker,
+    and every worker's search finds it
+  - every worker serves the same /classes ETag, and a new one after a class
+    is added through one of them
+  - the workers received each other's events, without handler errors
+
+Uses the mock LLM and embedding servers of bench/mock_servers.py:
+    python bench/scale_bench.py --workers 1,2,4 --requests 400 --concurrency 32
+Exits with status 1 when a check fails or --min-speedup is not reached.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import subprocess
+import requests
+from common import print_table
+from mock_servers import start_mock_server, add_arguments, config_from_args
+from load_test import REPO_ROOT, free_port, load_workload, run_load, start_api
+
+def start_chroma(path: str, timeout: float = 60) -> tuple:
+    """Starts a Chroma server persisting to `path`. Returns (process, port)."""
+    port = free_port()
+    command = [shutil.which("chroma") or "chroma", "run", "--path", path, "--port", str(port)]
+    # Run from the scratch directory, where it writes chroma.log
+    proc = subprocess.Popen(command, cwd=os.path.dirname(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/v2/heartbeat", timeout=1).ok:
+                return proc, port
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise TimeoutError(f"Chroma server was not up after {timeout}s")
+
+def fresh_get(url: str, **kwargs) -> requests.Response:
+    # A new connection per request, so the kernel hands it to any of the workers
+    return requests.get(url, headers={"Connection": "close"}, timeout=30, **kwargs)
+
+def wait_workers(base_url: str, workers: int, timeout: float) -> set:
+    """Waits until `workers` distinct worker processes report their warm-up done. Returns their pids."""
+    ready = set()
+    deadline = time.time() + timeout
+    while time.time() < deadline and len(ready) < workers:
+        try:
+            worker = fresh_get(base_url + "/health/worker").json()
+            if worker["warmup"] in ("ready", "off"):
+                ready.add(worker["pid"])
+            elif worker["warmup"] == "failed":
+                raise RuntimeError(f"Worker {worker['pid']} failed to warm up")
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    if len(ready) < workers:
+        raise TimeoutError(f"Only {len(ready)} of {workers} workers were ready after {timeout}s")
+    return ready
+
+def worker_stats(base_url: str, workers: int, attempts: int = 200) -> dict:
+    """The latest /health/worker of every worker reached in `attempts` requests, by pid."""
+    stats = {}
+    for _ in range(attempts):
+        worker = fresh_get(base_url + "/health/worker").json()
+        stats[worker["pid"]] = worker
+        if len(stats) == workers:
+            break
+    return stats
+
+def check_document(base_url: str, rounds: int, settle: float) -> dict:
+    token = f"zq{uuid.uuid4().hex[:10]}"
+    content = f"Scale check {token}: the rooftop terrace opens on {token} day."
+    upload = requests.post(base_url + "/documents/upload", files={"file": (f"{token}.txt", content.encode())}, timeout=30)
+    upload.raise_for_status()
+    job_url = base_url + upload.json()["status_url"]
+    missing, deadline = 0, time.time() + 60
+    while time.time() < deadline:
+        response = fresh_get(job_url)
+        if response.status_code == 404:
+            missing += 1
+        elif response.json()["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    job_status = response.json().get("status") if response.ok else None
+    time.sleep(settle)  # every worker polls the bus by then
+    found = 0
+    for _ in range(rounds):
+        response = requests.post(base_url + "/documents/search", json={"queries": [token], "k": 3},
+                                 headers={"Connection": "close"}, timeout=30)
+        found += response.ok and any(token in doc["content"] for doc in response.json()["documents"].values())
+    return {"job_status": job_status, "job_not_found": missing, "search_found": f"{found}/{rounds}",
+            "ok": job_status == "succeeded" and missing == 0 and found == rounds}
+
+def check_classes(base_url: str, rounds: int, settle: float) -> dict:
+    before = {fresh_get(base_url + "/classes/").headers.get("ETag") for _ in range(rounds)}
+    new_class = {
+        "class_id": 90000 + int(time.time()) % 10000, "class_name": "Scale check", "instructor_name": "Bench",
+        "day_of_week": 1, "start_time": "06:15", "duration_mins": 30,
+    }
+    requests.post(base_url + "/classes/", json=new_class, timeout=30).raise_for_status()
+    time.sleep(settle)
+    after = {fresh_get(base_url + "/classes/").headers.get("ETag") for _ in range(rounds)}
+    return {"etags_before": len(before), "etags_after": len(after),
+            "ok": len(before) == 1 and len(after) == 1 and before != after}
+
+def run_workers(workers: int, args, workload: list, mock_url: str, extra_env: dict) -> dict:
+    workdir = tempfile.mkdtemp(prefix="gym-scale-")
+    chroma = proc = None
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        if os.path.isdir(args.docs):
+            for name in os.listdir(args.docs):
+                if os.path.splitext(name)[1].lower() in (".pdf", ".txt"):
+                    shutil.copy(os.path.join(args.docs, name), os.path.join(workdir, "data", name))
+        chroma, chroma_port = start_chroma(os.path.join(workdir, "chroma_server"))
+        env = {"CHROMA_HOST": "127.0.0.1", "CHROMA_PORT": str(chroma_port), "SHARED_STATE_BACKEND": "sqlite", **extra_env}
+        proc, base_url = start_api(workdir, mock_url, args.api_key, env, workers=workers)
+        started = time.perf_counter()
+        pids = wait_workers(base_url, workers, args.ready_timeout)
+        print(f"{workers} worker(s) ready in {time.perf_counter() - started:.1f}s (pids {sorted(pids)})")
+
+        report = run_load(base_url, workload, args.requests, args.concurrency, args.api_key, args.timeout)
+        settle = args.bus_poll_seconds * 3
+        rounds = max(8, workers * 4)
+        checks = {"document": check_document(base_url, rounds, settle), "classes": check_classes(base_url, rounds, settle)}
+        stats = worker_stats(base_url, workers)
+        checks["bus"] = {
+            "workers_seen": len(stats),
+            "published": sum(worker["published"] for worker in stats.values()),
+            "received": sum(worker["received"] for worker in stats.values()),
+            "handler_errors": sum(worker["handler_errors"] for worker in stats.values()),
+        }
+        checks["bus"]["ok"] = checks["bus"]["handler_errors"] == 0 and (workers == 1 or checks["bus"]["received"] > 0)
+        return {"load": report, "checks": checks}
+    finally:
+        for process in (proc, chroma):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to compare")
+    parser.add_argument("--workload", default=os.path.join(REPO_ROOT, "bench", "workload.jsonl"))
+    parser.add_argument("--requests", type=int, default=400, help="requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "bench"))
+    parser.add_argument("--docs", default=os.path.join(REPO_ROOT, "data"),
+                        help="PDF/TXT files copied into each scratch data directory")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the API, e.g. --env AGENT_POOL_SIZE=8")
+    parser.add_argument("--bus-poll-seconds", type=float, default=0.5, help="BUS_POLL_SECONDS of the API")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--min-speedup", type=float, help="fail if the most workers give less than this speedup over the fewest")
+    parser.add_argument("--json", help="also write the report to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.workers.split(",")]
+    workload = load_workload(args.workload)
+    extra_env = {"BUS_POLL_SECONDS": str(args.bus_poll_seconds), **dict(item.split("=", 1) for item in args.env)}
+    mock_config = config_from_args(args)
+    mock_server = start_mock_server(mock_config)
+    results = {}
+    try:
+        for workers in counts:
+            results[workers] = run_workers(workers, args, workload, f"http://127.0.0.1:{mock_server.server_port}", extra_env)
+    finally:
+        mock_server.shutdown()
+
+    print()
+    print_table({f"{workers} worker(s)": result["load"]["all"] for workers, result in results.items()})
+    baseline = results[counts[0]]["load"]["all"]["per_second"]
+    print(f"\n{'workers':<10}{'speedup':>10}  checks")
+    failed = False
+    for workers, result in results.items():
+        speedup = result["load"]["all"]["per_second"] / baseline if baseline else 0.0
+        result["speedup"] = round(speedup, 2)
+        checks = result["checks"]
+        failed |= not all(check["ok"] for check in checks.values())
+        print(f"{workers:<10}{speedup:>9.2f}x  " + ", ".join(
+            f"{name} {'ok' if check['ok'] else 'FAILED ' + json.dumps(check)}" for name, check in checks.items()
+        ))
+    if args.min_speedup is not None and results[counts[-1]]["speedup"] < args.min_speedup:
+        print(f"FAIL: {counts[-1]} workers gave {results[counts[-1]]['speedup']}x < {args.min_speedup}x")
+        failed = True
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results, "mock": mock_config.stats}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Startup-time benchmark.
+
+Measures, in fresh processes:
+  - how long `import main` takes
+  - how long uvicorn takes until /health/live answers
+  - how long until /health/ready answers 200 (warm-up finished)
+
+Run from the repo root:
+    python bench/startup_bench.py --runs 3 --max-live-seconds 5
+
+Exits with status 1 when a --max-* threshold is exceeded, so it can gate CI.
+"""
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import statistics
+import subprocess
+import requests
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_import() -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def time_server(timeout: float) -> dict:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    result = {"live": None, "ready": None}
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if result["live"] is None and requests.get(f"http://127.0.0.1:{port}/health/live", timeout=1).ok:
+                    result["live"] = time.perf_counter() - start
+                if result["live"] is not None:
+                    response = requests.get(f"http://127.0.0.1:{port}/health/ready", timeout=1)
+                    if response.ok:
+                        result["ready"] = time.perf_counter() - start
+                        break
+                    if response.json().get("status") == "failed":
+                        result["ready_error"] = response.json().get("error")
+                        break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--max-import-seconds", type=float)
+    parser.add_argument("--max-live-seconds", type=float)
+    parser.add_argument("--max-ready-seconds", type=float)
+    args = parser.parse_args()
+
+    imports, lives, readies = [], [], []
+    for _ in range(args.runs):
+        imports.append(time_import())
+        server = time_server(args.timeout)
+        if server["live"] is not None:
+            lives.append(server["live"])
+        if server["ready"] is not None:
+            readies.append(server["ready"])
+        elif "ready_error" in server:
+            print(f"warm-up failed: {server['ready_error']}", file=sys.stderr)
+
+    report = {
+        "runs": args.runs,
+        "import_seconds": statistics.median(imports),
+        "live_seconds": statistics.median(lives) if lives else None,
+        "ready_seconds": statistics.median(readies) if readies else None,
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    for key, limit in [("import_seconds", args.max_import_seconds),
+                       ("live_seconds", args.max_live_seconds),
+                       ("ready_seconds", args.max_ready_seconds)]:
+        if limit is not None and (report[key] is None or report[key] > limit):
+            print(f"{key} = {report[key]} exceeds {limit}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    # Make `import main` work when run as `python bench/startup_bench.py`
+    sys.path.insert(0, os.getcwd())
+    main()
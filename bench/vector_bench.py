@@ -0,0 +1,151 @@
+"""
+Compares the Chroma and mmap vector backends (VECTOR_BACKEND) on the same corpus:
+load time, search latency (p50/p95/p99 over precomputed query vectors, so
+embedding time is left out), resident memory and how many of Chroma's
+approximate top-k the exact mmap search agrees with.
+
+Each backend is measured in a fresh process after the corpus is ingested once
+into a scratch directory with the mock embedding server of bench/mock_servers.py:
+    python bench/vector_bench.py --chunks 5000 --iterations 500 --k 20
+
+RSS is split into anonymous memory (private to each worker) and file-backed
+memory (page cache, shared between workers mapping the same files).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from common import summarize, print_table
+from mock_servers import MockConfig, start_mock_server, embed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def memory_mb() -> dict:
+    """Current RSS of this process split as /proc/self/status reports it (Linux only)."""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = round(int(value.split()[0]) / 1024, 1)
+    return {"rss_mb": fields.get("VmRSS"), "anon_mb": fields.get("RssAnon"), "file_mb": fields.get("RssFile")}
+
+def measure(backend: str, args) -> dict:
+    """Runs in the child process, with the scratch directory as working directory."""
+    os.environ["VECTOR_BACKEND"] = backend
+    sys.path.insert(0, REPO_ROOT)
+    import db.retrieval as retrieval
+    from db.rag_store import get_vector_store
+    from db.mmap_store import get_vector_index
+
+    baseline = memory_mb()
+    start = time.perf_counter()
+    store = get_vector_store()
+    if backend == "mmap":
+        get_vector_index(store)
+    else:
+        store._collection.count()
+    load_seconds = time.perf_counter() - start
+
+    queries = [f"Rule {i} query about lockers and cancellation" for i in range(args.queries)]
+    vectors = [embed(query) for query in queries]
+    if backend == "mmap":
+        index = get_vector_index(store)
+        search = lambda i: index.search([vectors[i % len(vectors)]], args.k)[0]
+    else:
+        search = lambda i: store._collection.query(
+            query_embeddings=[vectors[i % len(vectors)]], n_results=args.k, include=[]
+        )["ids"][0]
+    # Keeps the output of the first pass over the queries for the overlap comparison
+    results = [search(i) for i in range(len(vectors))]
+    latencies = []
+    wall = time.perf_counter()
+    for i in range(args.iterations):
+        call_start = time.perf_counter()
+        search(i)
+        latencies.append(time.perf_counter() - call_start)
+    report = summarize(latencies, time.perf_counter() - wall)
+    fetch_start = time.perf_counter()
+    retrieval.fetch_documents(store, results[0])
+    return {
+        **report,
+        "load_ms": round(load_seconds * 1000, 1),
+        "fetch_ms": round((time.perf_counter() - fetch_start) * 1000, 2),
+        "baseline": baseline,
+        "memory": memory_mb(),
+        "results": results,
+    }
+
+def run_child(backend: str, workdir: str, env: dict, args) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--child", backend,
+               "--k", str(args.k), "--iterations", str(args.iterations), "--queries", str(args.queries)]
+    output = subprocess.run(command, cwd=workdir, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=3000, help="chunks in the corpus")
+    parser.add_argument("--iterations", type=int, default=500, help="searches per backend")
+    parser.add_argument("--queries", type=int, default=50, help="distinct query vectors")
+    parser.add_argument("--k", type=int, default=20, help="results per search (RETRIEVAL_CANDIDATES)")
+    parser.add_argument("--dtype", default="float32", choices=["float16", "float32"], help="MMAP_DTYPE")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args)))
+        return
+
+    mock_server = start_mock_server(MockConfig(embed_latency_ms=0, embed_ms_per_text=0, jitter=0))
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([REPO_ROOT, BENCH_DIR, os.environ.get("PYTHONPATH", "")]),
+        "EMBEDDING_BACKEND": "remote",
+        "EMBEDDING_API_URL": f"http://127.0.0.1:{mock_server.server_port}/embeddings",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "HF_TOKEN": os.environ.get("HF_TOKEN", "mock"),
+        "MMAP_DTYPE": args.dtype,
+    }
+    workdir = tempfile.mkdtemp(prefix="gym-vectorbench-")
+    print(f"Working directory: {workdir}")
+    os.makedirs(os.path.join(workdir, "data"))
+    sys.path.insert(0, BENCH_DIR)
+    from micro_bench import write_corpus
+    write_corpus(os.path.join(workdir, "data", "corpus.txt"), args.chunks)
+
+    # Ingest once (Chroma is the source of truth), then snapshot it for the mmap backend
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from db.rag_store import get_vector_store; from db.mmap_store import get_vector_index; "
+                               "get_vector_index(get_vector_store())"],
+        cwd=workdir, env={**env, "VECTOR_BACKEND": "mmap"}, check=True, capture_output=True,
+    )
+    print(f"Ingested {args.chunks} chunks and took the snapshot in {time.perf_counter() - start:.1f}s")
+
+    results = {backend: run_child(backend, workdir, env, args) for backend in ("chroma", "mmap")}
+    mock_server.shutdown()
+
+    overlaps = [
+        len(set(chroma_ids) & set(mmap_ids)) / max(len(chroma_ids), 1)
+        for chroma_ids, mmap_ids in zip(results["chroma"].pop("results"), results["mmap"].pop("results"))
+    ]
+    print_table({f"search {backend}": result for backend, result in results.items()}, rate_label="searches/s")
+    print(f"\n{'backend':<10}{'load ms':>10}{'fetch ms':>10}{'rss MB':>10}{'anon MB':>10}{'file MB':>10}")
+    for backend, result in results.items():
+        memory = result["memory"]
+        print(f"{backend:<10}{result['load_ms']:>10}{result['fetch_ms']:>10}"
+              f"{memory['rss_mb']:>10}{memory['anon_mb']:>10}{memory['file_mb']:>10}")
+    print(f"\nmmap results also in Chroma's top {args.k}: {np.mean(overlaps):.1%} "
+          f"(Chroma's HNSW search is approximate, mmap is exact)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results, "overlap": float(np.mean(overlaps))}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,11 @@
-from .db import engine, gym_classes
-from .rag_store import vector_store, add_document
+from .db import (
+    engine, read_engine, gym_classes, class_occurrences, gym_classes_version, mark_gym_classes_changed,
+    generate_occurrences, ensure_occurrences, init_db,
+)
+from .rag_store import get_vector_store, add_document, ingest_file, sync_directory
 
-__all__ = ['engine', 'gym_classes', 'vector_store', 'add_document'] 
\ No newline at end of file
+__all__ = [
+    'engine', 'read_engine', 'gym_classes', 'class_occurrences', 'gym_classes_version', 'mark_gym_classes_changed',
+    'generate_occurrences', 'ensure_occurrences', 'init_db',
+    'get_vector_store', 'add_document', 'ingest_file', 'sync_directory'
+] 
\ No newline at end of file
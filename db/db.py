@@ -1,5 +1,15 @@
 import os
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, insert, text
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import (
+    create_engine, event, inspect, MetaData, Table, Column, Integer, String, ForeignKey,
+    CheckConstraint, UniqueConstraint, Index, insert, select, text,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .shared_state import get_shared_state, publish, subscribe, file_lock
+
+logger = logging.getLogger(__name__)
 
 # Ensure the data directory exists
 os.makedirs("data", exist_ok=True)
@@ -8,54 +18,270 @@ db_path = "data/gym_classes.db"
 engine = create_engine(f"sqlite:///{db_path}")
 metadata_obj = MetaData()
 
+@event.listens_for(engine, "connect")
+def _set_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA foreign_keys = ON")
+    # WAL lets the read-only connections keep reading during writes, and with
+    # synchronous=NORMAL a commit no longer waits for an fsync of the main file.
+    dbapi_connection.execute("PRAGMA journal_mode = WAL")
+    dbapi_connection.execute("PRAGMA synchronous = NORMAL")
+
+# Recurring weekly slots. day_of_week follows SQLite's strftime('%w'): 0 = Sunday
+# ... 6 = Saturday, NULL = every day. start_time is zero-padded "HH:MM", so string
+# comparisons order correctly and range queries can use the indexes.
 gym_classes = Table(
     "gym_classes",
     metadata_obj,
     Column("class_id", Integer, primary_key=True),
-    Column("instructor_name", String(32), primary_key=True),
-    Column("class_name", String(32)),
-    Column("start_time", String(5)),  # Format: "HH:MM"
-    Column("duration_mins", Integer),
+    Column("class_name", String(64), nullable=False),
+    Column("instructor_name", String(64), nullable=False),
+    Column("location", String(64), nullable=False, server_default="Main"),
+    Column("day_of_week", Integer),
+    Column("start_time", String(5), nullable=False),
+    Column("duration_mins", Integer, nullable=False),
+    Column("capacity", Integer),
+    CheckConstraint("day_of_week BETWEEN 0 AND 6", name="ck_gym_classes_day"),
+    CheckConstraint("start_time GLOB '[0-2][0-9]:[0-5][0-9]'", name="ck_gym_classes_start_time"),
+    CheckConstraint("duration_mins > 0", name="ck_gym_classes_duration"),
+    Index("ix_gym_classes_day_time", "day_of_week", "start_time"),
+    Index("ix_gym_classes_location_day_time", "location", "day_of_week", "start_time"),
+    Index("ix_gym_classes_instructor", "instructor_name"),
+    Index("ix_gym_classes_class_name", "class_name"),
+    Index("ix_gym_classes_start_time", "start_time"),  # keyset pagination of GET /classes
+)
+
+# Dated instances of the weekly slots for the next OCCURRENCE_DAYS days, generated
+# by generate_occurrences(). starts_at/ends_at are local "YYYY-MM-DD HH:MM".
+class_occurrences = Table(
+    "class_occurrences",
+    metadata_obj,
+    Column("occurrence_id", Integer, primary_key=True),
+    Column("class_id", Integer, ForeignKey("gym_classes.class_id", ondelete="CASCADE"), nullable=False),
+    Column("starts_at", String(16), nullable=False),
+    Column("ends_at", String(16), nullable=False),
+    Column("capacity", Integer),
+    Column("booked", Integer, nullable=False, server_default="0"),
+    Column("status", String(16), nullable=False, server_default="scheduled"),  # scheduled or cancelled
+    UniqueConstraint("class_id", "starts_at", name="uq_class_occurrences_class_start"),
+    Index("ix_class_occurrences_starts_at", "starts_at"),
 )
 
-metadata_obj.create_all(engine)
+# Days ahead for which occurrences are kept generated
+OCCURRENCE_DAYS = int(os.getenv("OCCURRENCE_DAYS", "14"))
+DEFAULT_LOCATION = "Main"
+DEFAULT_CAPACITY = 20
+
+# Separate pooled engine for agent-written queries. Connections are read-only
+# and keep up to `cached_statements` prepared statements each.
+read_engine = create_engine(
+    f"sqlite:///{db_path}",
+    pool_size=int(os.getenv("SQL_POOL_SIZE", "5")),
+    connect_args={"check_same_thread": False, "cached_statements": 256},
+)
+
+@event.listens_for(read_engine, "connect")
+def _set_query_only(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA query_only = ON")
+
+# Bumped on every write to gym_classes so caches of its contents can tell they are stale.
+# The counter is shared by the workers (db/shared_state.py); each keeps the last value it
+# saw, so reading it costs nothing, and learns of the others' writes from "classes" events.
+_gym_classes_version = None
+_version_lock = threading.Lock()
+
+def gym_classes_version() -> int:
+    global _gym_classes_version
+    if _gym_classes_version is None:
+        with _version_lock:
+            if _gym_classes_version is None:
+                _gym_classes_version = get_shared_state().get("gym_classes")
+    return _gym_classes_version
 
-# Insert initial rows if the table is empty.
+def mark_gym_classes_changed() -> None:
+    global _gym_classes_version
+    version = get_shared_state().incr("gym_classes")
+    with _version_lock:
+        _gym_classes_version = max(_gym_classes_version or 0, version)
+    publish("classes", {"version": version})
+
+def _on_classes_changed(payload: dict) -> None:
+    global _gym_classes_version
+    with _version_lock:
+        _gym_classes_version = max(_gym_classes_version or 0, payload["version"])
+
+subscribe("classes", _on_classes_changed)
+
+def normalize_time(value: str) -> str:
+    """"9:05" -> "09:05". Raises ValueError if it isn't a valid time of day."""
+    return datetime.strptime(value.strip(), "%H:%M").strftime("%H:%M")
+
+def day_of_week(day: date) -> int:
+    """SQLite's strftime('%w') numbering: 0 = Sunday."""
+    return (day.weekday() + 1) % 7
+
+# Rows init_db() inserts when the table is empty.
 initial_rows = [
     {
         "class_id": 1,
         "instructor_name": "Sarah Johnson",
         "class_name": "Yoga Flow",
+        "location": DEFAULT_LOCATION,
+        "day_of_week": None,
         "start_time": "09:00",
         "duration_mins": 60,
+        "capacity": DEFAULT_CAPACITY,
     },
     {
         "class_id": 2,
         "instructor_name": "Mike Peters",
         "class_name": "HIIT",
+        "location": DEFAULT_LOCATION,
+        "day_of_week": None,
         "start_time": "10:30",
         "duration_mins": 45,
+        "capacity": DEFAULT_CAPACITY,
     },
     {
         "class_id": 3,
         "instructor_name": "Emma Davis",
         "class_name": "Spin Class",
+        "location": DEFAULT_LOCATION,
+        "day_of_week": None,
         "start_time": "17:00",
         "duration_mins": 45,
+        "capacity": DEFAULT_CAPACITY,
     },
     {
         "class_id": 4,
         "instructor_name": "James Wilson",
         "class_name": "Pilates",
+        "location": DEFAULT_LOCATION,
+        "day_of_week": None,
         "start_time": "18:30",
         "duration_mins": 60,
+        "capacity": DEFAULT_CAPACITY,
     },
 ]
 
-with engine.connect() as connection:
-    count = connection.execute(text("SELECT COUNT(*) FROM gym_classes")).scalar()
-    if count == 0:
-        for row in initial_rows:
-            stmt = insert(gym_classes).values(**row)
-            with engine.begin() as transaction:
-                transaction.execute(stmt) 
\ No newline at end of file
+def migrate_legacy_schema(connection) -> int:
+    """
+    Converts a gym_classes table from the original schema (composite key on
+    class_id + instructor_name, unpadded times, no day/location/capacity) to the
+    current one. Rows become daily slots at the default location; a class_id
+    shared by several instructors keeps it for the first and gets new ids for
+    the rest. Returns the number of rows migrated (0 if nothing to do).
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns("gym_classes")}
+    if "location" in columns:
+        return 0
+    connection.execute(text("ALTER TABLE gym_classes RENAME TO gym_classes_legacy"))
+    # The renamed table keeps its index names; drop them before create_all reuses them
+    for index in inspect(connection).get_indexes("gym_classes_legacy"):
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+    metadata_obj.create_all(connection)
+    legacy = [dict(row._mapping) for row in connection.execute(text(
+        "SELECT class_id, instructor_name, class_name, start_time, duration_mins FROM gym_classes_legacy ORDER BY class_id"
+    ))]
+    next_id = max((row["class_id"] for row in legacy), default=0) + 1
+    used = set()
+    rows = []
+    for row in legacy:
+        class_id = row["class_id"]
+        if class_id in used:
+            class_id, next_id = next_id, next_id + 1
+        used.add(class_id)
+        rows.append({
+            **row,
+            "class_id": class_id,
+            "start_time": normalize_time(row["start_time"]),
+            "location": DEFAULT_LOCATION,
+            "day_of_week": None,
+            "capacity": DEFAULT_CAPACITY,
+        })
+    if rows:
+        connection.execute(insert(gym_classes), rows)
+    connection.execute(text("DROP TABLE gym_classes_legacy"))
+    logger.info(f"Migrated {len(rows)} classes to the weekly schedule schema")
+    return len(rows)
+
+_occurrences_generated_on = None
+
+def generate_occurrences(days: int = OCCURRENCE_DAYS, start: date = None) -> int:
+    """
+    Creates the class_occurrences of every weekly slot from `start` (today)
+    for `days` days. Existing scheduled, unbooked ones take the slot's current
+    duration and capacity, others are left untouched, and scheduled ones whose
+    slot no longer exists are deleted. Returns the number created or updated.
+    """
+    global _occurrences_generated_on
+    start = start or date.today()
+    with engine.begin() as connection:
+        slots = [dict(row._mapping) for row in connection.execute(select(gym_classes))]
+        rows = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            weekday = day_of_week(day)
+            for slot in slots:
+                if slot["day_of_week"] is not None and slot["day_of_week"] != weekday:
+                    continue
+                starts_at = datetime.combine(day, datetime.strptime(slot["start_time"], "%H:%M").time())
+                rows.append({
+                    "class_id": slot["class_id"],
+                    "starts_at": starts_at.strftime("%Y-%m-%d %H:%M"),
+                    "ends_at": (starts_at + timedelta(minutes=slot["duration_mins"])).strftime("%Y-%m-%d %H:%M"),
+                    "capacity": slot["capacity"],
+                })
+        changed = 0
+        if rows:
+            stmt = sqlite_insert(class_occurrences)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[class_occurrences.c.class_id, class_occurrences.c.starts_at],
+                set_={"ends_at": stmt.excluded.ends_at, "capacity": stmt.excluded.capacity},
+                # Cancelled or booked occurrences keep what members were told
+                where=(class_occurrences.c.status == "scheduled") & (class_occurrences.c.booked == 0) & (
+                    (class_occurrences.c.ends_at != stmt.excluded.ends_at)
+                    | class_occurrences.c.capacity.is_distinct_from(stmt.excluded.capacity)
+                ),
+            )
+            changed = connection.execute(stmt, rows).rowcount
+        # Occurrences of slots that were moved to another day or time
+        connection.execute(text(
+            "DELETE FROM class_occurrences WHERE status = 'scheduled' AND booked = 0 AND starts_at >= :start "
+            "AND NOT EXISTS (SELECT 1 FROM gym_classes c WHERE c.class_id = class_occurrences.class_id "
+            "AND substr(class_occurrences.starts_at, 12, 5) = c.start_time "
+            "AND (c.day_of_week IS NULL OR c.day_of_week = CAST(strftime('%w', class_occurrences.starts_at) AS INTEGER)))"
+        ), {"start": start.isoformat()})
+    _occurrences_generated_on = start
+    if changed:
+        mark_gym_classes_changed()
+    return changed
+
+def ensure_occurrences() -> None:
+    """Extends the generated occurrences once a day, so the horizon never runs out."""
+    if _occurrences_generated_on != date.today():
+        generate_occurrences()
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_db() -> None:
+    """Creates (or migrates) the tables, seeds them if empty and generates occurrences. Safe to call more than once."""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        # Workers starting together would otherwise race to create and seed the tables
+        with file_lock(db_path + ".init.lock"):
+            with engine.begin() as connection:
+                if inspect(connection).has_table("gym_classes"):
+                    migrate_legacy_schema(connection)
+                metadata_obj.create_all(connection)
+                # create_all skips the indexes of tables that already exist
+                for table in metadata_obj.sorted_tables:
+                    for index in table.indexes:
+                        index.create(connection, checkfirst=True)
+                count = connection.execute(text("SELECT COUNT(*) FROM gym_classes")).scalar()
+                if count == 0:
+                    connection.execute(insert(gym_classes), initial_rows)
+            generate_occurrences()
+        _initialized = True
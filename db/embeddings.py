@@ -0,0 +1,293 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+from telemetry import span, set_attributes
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Default target of a re-index (db/reindex.py): same size as all-MiniLM-L6-v2 but trained
+# on 50+ languages, so Spanish queries match English and Spanish documents alike
+MULTILINGUAL_EMBEDDING_MODEL = os.getenv(
+    "MULTILINGUAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+# "remote" calls the HuggingFace Inference API, "local" runs the model in-process.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote").lower()
+# Endpoint of the remote backend; unset uses the public Inference API
+# (bench/mock_servers.py provides a local stand-in).
+EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL") or None
+# "torch" or "onnx" (the latter needs `sentence-transformers[onnx]`).
+EMBEDDING_LOCAL_RUNTIME = os.getenv("EMBEDDING_LOCAL_RUNTIME", "torch").lower()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "2"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.db")
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+
+class LocalEmbeddings(Embeddings):
+    """
+    Runs a sentence-transformers model on CPU inside the API process.
+    Vectors are L2-normalized like the ones the Inference API returns for the
+    same model, so an existing Chroma collection stays valid.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, num_threads: int, runtime: str = "torch"):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local requires sentence-transformers: `pip install -r requirements-local.txt`"
+            ) from e
+
+        torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        if runtime == "onnx":
+            self._model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        else:
+            self._model = SentenceTransformer(model_name, device="cpu")
+        # One encode at a time keeps CPU use within `num_threads`.
+        self._lock = threading.Lock()
+        logger.info(f"Loaded local embedding model {model_name} ({runtime}, {num_threads} threads)")
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        with self._lock:
+            vectors = self._model.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class EmbeddingCache:
+    """
+    Content-addressed store of embedding vectors in SQLite. Keys hash the
+    model name with the normalized text, values are float32 blobs. Once the
+    stored vectors exceed `max_bytes`, the least recently used ones are deleted
+    until the cache is back under 90% of the limit.
+    """
+
+    # Hits update last_used in batches, at most this often or once this many are pending;
+    # a touch lost on exit only makes that entry look older to the eviction.
+    TOUCH_FLUSH_SECONDS = 30
+    TOUCH_FLUSH_KEYS = 500
+    # Other workers insert into the same file, so the stored size is re-read at least this often
+    SIZE_CHECK_SECONDS = 60
+
+    def __init__(self, path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last hit, not yet written
+        self._touches_flushed = time.time()
+        # Stored bytes as of the last read from the database plus this process's inserts since
+        self._bytes = self._stored_bytes()
+        self._size_checked = time.time()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def _flush_touches(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(t, key) for key, t in self._touched.items()]
+            )
+            self._conn.commit()
+            self._touched.clear()
+        self._touches_flushed = time.time()
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys that are cached."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            self._touched.update(dict.fromkeys(found, now))
+            if len(self._touched) >= self.TOUCH_FLUSH_KEYS or now - self._touches_flushed >= self.TOUCH_FLUSH_SECONDS:
+                self._flush_touches()
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(unique) - len(found)
+        return found
+
+    def put_many(self, model_name: str, items) -> None:
+        """Stores (key, vector) pairs and evicts old entries if over the size limit."""
+        now = time.time()
+        rows = [(key, model_name, array("f", vector).tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                # Another thread may have stored the same text meanwhile; keep its row.
+                inserted = self._conn.execute("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", row).rowcount
+                self._bytes += len(row[2]) * inserted
+            if self._bytes > self.max_bytes or now - self._size_checked >= self.SIZE_CHECK_SECONDS:
+                self._bytes = self._stored_bytes()
+                self._size_checked = now
+                if self._bytes > self.max_bytes:
+                    # Pending touches first, so recently hit entries are not evicted
+                    self._flush_touches()
+                    self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._bytes -= size
+                self._stats["evictions"] += 1
+        self._bytes = self._stored_bytes()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "path": self.path,
+                "entries": entries,
+                "bytes": stored,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Checks the embedding cache before calling the wrapped backend, for both documents and queries."""
+
+    def __init__(self, backend: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.backend = backend
+        self.model_name = model_name
+        self.cache = cache
+
+    def _embed(self, texts, embed_missing):
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        set_attributes({"embeddings.cache_hits": len(texts) - len(missing), "embeddings.cache_misses": len(missing)})
+        if missing:
+            with span("embeddings.backend", {"embeddings.model": self.model_name, "embeddings.texts": len(missing)}):
+                vectors = embed_missing(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._embed(list(texts), self.backend.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], lambda texts: [self.backend.embed_query(texts[0])])[0]
+
+class TracedEmbeddings(Embeddings):
+    """Wraps an embedding client with a span per call."""
+
+    def __init__(self, backend: Embeddings, model_name: str):
+        self.backend = backend
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        # Backends such as the Inference API reject an empty batch
+        if not texts:
+            return []
+        with span("embeddings.embed_documents", {"embeddings.model": self.model_name, "embeddings.texts": len(texts)}):
+            return self.backend.embed_documents(texts)
+
+    def embed_query(self, text):
+        with span("embeddings.embed_query", {"embeddings.model": self.model_name}):
+            return self.backend.embed_query(text)
+
+_embedding_cache = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, int(EMBEDDING_CACHE_MAX_MB * 1024 * 1024))
+    return _embedding_cache
+
+_embeddings = {}
+_embeddings_lock = threading.Lock()
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL) -> Embeddings:
+    """
+    Returns the process-wide embedding client for `model_name`, built on first
+    use with the backend selected by EMBEDDING_BACKEND and wrapped in the
+    embedding cache unless EMBEDDING_CACHE_ENABLED is false, then in a tracing span.
+    """
+    with _embeddings_lock:
+        if model_name not in _embeddings:
+            if EMBEDDING_BACKEND == "local":
+                backend = LocalEmbeddings(
+                    model_name,
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    num_threads=EMBEDDING_THREADS,
+                    runtime=EMBEDDING_LOCAL_RUNTIME,
+                )
+            elif EMBEDDING_BACKEND == "remote":
+                backend = HuggingFaceInferenceAPIEmbeddings(
+                    api_key=os.getenv("HF_TOKEN"),
+                    model_name=model_name,
+                    api_url=EMBEDDING_API_URL
+                )
+            else:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+            if EMBEDDING_CACHE_ENABLED:
+                backend = CachedEmbeddings(backend, model_name, get_embedding_cache())
+            _embeddings[model_name] = TracedEmbeddings(backend, model_name)
+        return _embeddings[model_name]
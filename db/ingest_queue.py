@@ -0,0 +1,122 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .rag_store import ingest_file
+from .shared_state import SHARED_STATE_BACKEND, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Jobs queued or running at once before uploads are refused
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "32"))
+# Finished jobs kept around for GET /documents/jobs/{id}
+INGEST_JOB_HISTORY = 1000
+# With several workers, how long a job stays visible to the workers that did not run it
+SHARED_JOB_TTL_SECONDS = 24 * 3600
+
+class IngestQueueFull(Exception):
+    """Raised when too many ingestion jobs are already pending."""
+
+class IngestQueue:
+    """
+    Runs document ingestion on a small worker pool so uploads return at once.
+    Each job is a dict with its status (queued, running, succeeded, failed),
+    progress and, when done, the ingest_file() result or the error. With
+    several workers, jobs are also saved to the shared state on every status
+    change, so they can be polled through any worker.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, on_complete=None, on_accept=None) -> dict:
+        """
+        Queues ingestion of `file_path` and returns the job. `on_accept()` runs
+        once the job is accepted, before it can start; `on_complete(result)`
+        runs in the worker after a successful ingestion.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise IngestQueueFull(f"{self._pending} ingestion jobs already pending")
+            if on_accept is not None:
+                on_accept()
+            self._pending += 1
+            job = {
+                "id": uuid.uuid4().hex,
+                "file": file_path,
+                "status": "queued",
+                "progress": {"stage": "queued", "chunks_seen": 0, "chunks_added": 0},
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > INGEST_JOB_HISTORY:
+                oldest = next(iter(self._jobs.values()))
+                if oldest["status"] in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._share(job)
+        self._executor.submit(self._run, job, on_complete)
+        return dict(job)
+
+    def _share(self, job: dict) -> None:
+        if SHARED_STATE_BACKEND == "local":
+            return
+        try:
+            get_shared_state().set_value(f"ingest_job:{job['id']}", job, SHARED_JOB_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not share ingestion job {job['id']}: {e}")
+
+    def _run(self, job: dict, on_complete) -> None:
+        def progress(stage, chunks_seen, chunks_added):
+            job["progress"] = {"stage": stage, "chunks_seen": chunks_seen, "chunks_added": chunks_added}
+
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        self._share(job)
+        try:
+            result = ingest_file(job["file"], progress=progress)
+            job["result"] = result
+            job["status"] = "succeeded"
+            job["progress"]["stage"] = "done"
+            if on_complete is not None:
+                on_complete(result)
+        except Exception as e:
+            logger.error(f"Ingestion job {job['id']} for {job['file']} failed: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            job["finished_at"] = time.time()
+            self._share(job)
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id: str):
+        """The job, from this worker or, if another worker runs it, from the shared state."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if SHARED_STATE_BACKEND == "local":
+            return None
+        return get_shared_state().get_value(f"ingest_job:{job_id}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"pending": self._pending, "max_pending": self.max_pending, "jobs": counts}
+
+ingest_queue = IngestQueue(workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING)
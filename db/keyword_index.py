@@ -0,0 +1,109 @@
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from .shared_state import subscribe
+
+_token_pattern = re.compile(r"\w+")
+
+def tokenize(text: str) -> list:
+    """Lowercases, strips accents and splits into word tokens, so "Pilates" matches "pilates" and "cancelación" "cancelacion"."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in _token_pattern.findall(text) if len(token) > 1]
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring over the chunks of the vector store."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # term -> {chunk_id: term frequency}
+        self._lengths = {}  # chunk_id -> number of tokens
+        self._terms = {}  # chunk_id -> its distinct terms, so removal only touches its postings
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, ids, texts) -> None:
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._lengths:
+                    self._remove(chunk_id)
+                tokens = tokenize(text)
+                counts = Counter(tokens)
+                for term, count in counts.items():
+                    self._postings[term][chunk_id] = count
+                self._terms[chunk_id] = tuple(counts)
+                self._lengths[chunk_id] = len(tokens)
+                self._total_length += len(tokens)
+
+    def remove(self, ids) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def _remove(self, chunk_id) -> None:
+        length = self._lengths.pop(chunk_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._terms.pop(chunk_id):
+            postings = self._postings[term]
+            postings.pop(chunk_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int) -> list:
+        """Returns up to `k` (chunk_id, score) pairs, best first."""
+        with self._lock:
+            n = len(self._lengths)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+_indexes = {}  # collection name -> BM25Index
+_index_lock = threading.Lock()
+
+def get_keyword_index(store) -> BM25Index:
+    """Returns the shared index of the store's collection, building it from every chunk in it on first use."""
+    name = store._collection.name
+    if name not in _indexes:
+        with _index_lock:
+            if name not in _indexes:
+                index = BM25Index()
+                records = store._collection.get(include=["documents"])
+                index.add(records["ids"], records["documents"])
+                _indexes[name] = index
+    return _indexes[name]
+
+def index_chunks(store, ids, texts) -> None:
+    """Called by ingestion after chunks are added. Before the index is built this is a no-op, it is built from the collection."""
+    index = _indexes.get(store._collection.name)
+    if index is not None:
+        index.add(ids, texts)
+
+def unindex_chunks(store, ids) -> None:
+    index = _indexes.get(store._collection.name)
+    if index is not None:
+        index.remove(ids)
+
+def drop_keyword_index(name: str) -> None:
+    """Forgets the index of a deleted collection, or of one another worker changed (rebuilt on next use)."""
+    with _index_lock:
+        _indexes.pop(name, None)
+
+subscribe("documents", lambda payload: drop_keyword_index(payload["collection"]))
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from .shared_state import file_lock, subscribe
+
+logger = logging.getLogger(__name__)
+
+# Where the snapshots live (one subdirectory per collection), next to the Chroma files they mirror
+MMAP_DIRECTORY = os.getenv("MMAP_DIRECTORY", os.path.join("chroma_db", "mmap_index"))
+# float32 is scored in place with one matrix product. float16 halves the file and the
+# shared page cache, but every search converts the matrix to float32 (several times slower).
+MMAP_DTYPE = os.getenv("MMAP_DTYPE", "float32")
+# Rows scored per matrix product when vectors are stored as float16, bounding the float32 copy
+SEARCH_BLOCK_ROWS = 16384
+
+class MmapVectorIndex:
+    """
+    Exact cosine-similarity index over a memory-mapped matrix of normalized
+    vectors, with chunk ids, texts and metadata in a JSONL file alongside.
+
+    Files in `directory`:
+      - info.json: {"generation", "dim", "dtype"}, replaced atomically by snapshot()
+      - vectors-<generation>.bin: rows of `dim` values, append-only
+      - meta-<generation>.jsonl: one {"id", "text", "metadata"} line per row, or
+        {"delete": id} for a removed chunk, append-only
+
+    The matrix is opened read-only with np.memmap, so every worker process
+    searching the same files shares one copy in the page cache. Appends from
+    one process are picked up by the others on their next search; writers
+    go through write_lock() so only one process writes at a time.
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+        self._info = None
+        self._info_mtime = None
+        self._matrix = None  # np.memmap of shape (rows, dim), or None when empty
+        self._ids = []
+        self._records = {}  # chunk id -> (row, text, metadata)
+        self._deleted = bytearray()  # 1 per removed or replaced row
+        self._mask = np.zeros(0, dtype=bool)  # self._deleted as an array, rebuilt by _refresh()
+        self._meta_offset = 0
+
+    def _path(self, kind: str, generation=None) -> str:
+        generation = self._info["generation"] if generation is None else generation
+        extension = "bin" if kind == "vectors" else "jsonl"
+        return os.path.join(self.directory, f"{kind}-{generation}.{extension}")
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, "info.json"))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def _refresh(self) -> None:
+        """Reloads after another process took a new snapshot, and reads rows appended since the last call."""
+        info_path = os.path.join(self.directory, "info.json")
+        mtime = os.stat(info_path).st_mtime_ns
+        if mtime != self._info_mtime:
+            with open(info_path, "r") as f:
+                self._info = json.load(f)
+            self._info_mtime = mtime
+            self.dtype = np.dtype(self._info["dtype"])
+            self._ids, self._records, self._meta_offset = [], {}, 0
+            self._deleted = bytearray()
+            self._mask = np.zeros(0, dtype=bool)
+            self._matrix = None
+
+        meta_path = self._path("meta")
+        if os.path.getsize(meta_path) == self._meta_offset:
+            return
+        with open(meta_path, "rb") as f:
+            f.seek(self._meta_offset)
+            data = f.read()
+        # A writer may be mid-line; leave the partial line for the next refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            record = json.loads(line)
+            if "delete" in record:
+                previous = self._records.pop(record["delete"], None)
+                if previous is not None:
+                    self._deleted[previous[0]] = 1
+                continue
+            row = len(self._ids)
+            previous = self._records.get(record["id"])
+            if previous is not None:
+                self._deleted[previous[0]] = 1
+            self._ids.append(record["id"])
+            self._records[record["id"]] = (row, record["text"], record.get("metadata") or {})
+            self._deleted.append(0)
+        self._meta_offset += len(complete)
+        self._mask = np.frombuffer(bytes(self._deleted), dtype=bool)
+
+        rows = len(self._ids)
+        dim = self._info["dim"]
+        self._matrix = np.memmap(self._path("vectors"), dtype=self.dtype, mode="r", shape=(rows, dim)) if rows else None
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def snapshot(self, ids: list, texts: list, metadatas: list, vectors) -> None:
+        """Writes a fresh generation holding exactly these chunks and switches to it."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            vectors = self._normalize(vectors) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+            dim = int(vectors.shape[1]) if len(ids) else (self._info or {}).get("dim", 0)
+            old_generation = self._info["generation"] if self.exists() and self._info else None
+            generation = time.time_ns()
+            with open(self._path("vectors", generation), "wb") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            with open(self._path("meta", generation), "w", encoding="utf-8") as f:
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}, ensure_ascii=False) + "\n")
+            tmp_path = os.path.join(self.directory, "info.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"generation": generation, "dim": dim, "dtype": self.dtype.name}, f)
+            os.replace(tmp_path, os.path.join(self.directory, "info.json"))
+            self._refresh()
+            if old_generation is not None:
+                # Processes still mapping the old files keep their pages until they refresh
+                for kind in ("vectors", "meta"):
+                    try:
+                        os.remove(self._path(kind, old_generation))
+                    except FileNotFoundError:
+                        pass
+            logger.info(f"Wrote mmap vector snapshot with {len(ids)} chunks ({self.dtype.name})")
+
+    def append(self, ids: list, texts: list, metadatas: list, vectors) -> None:
+        """Adds chunks (replacing any with the same id) at the end of the current generation."""
+        if not ids:
+            return
+        with self._lock:
+            self._refresh()
+            vectors = self._normalize(vectors)
+            if self._info["dim"] == 0:
+                self.snapshot(ids, texts, metadatas, vectors)
+                return
+            if vectors.shape[1] != self._info["dim"]:
+                raise ValueError(f"Expected {self._info['dim']}-dimensional vectors, got {vectors.shape[1]}")
+            # Vectors first: readers only count rows listed in the metadata file
+            with open(self._path("vectors"), "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            with open(self._path("meta"), "a", encoding="utf-8") as f:
+                f.write("".join(
+                    json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}, ensure_ascii=False) + "\n"
+                    for chunk_id, text, metadata in zip(ids, texts, metadatas)
+                ))
+            self._refresh()
+
+    def remove(self, ids: list) -> None:
+        with self._lock:
+            self._refresh()
+            present = [chunk_id for chunk_id in ids if chunk_id in self._records]
+            if not present:
+                return
+            with open(self._path("meta"), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps({"delete": chunk_id}) + "\n" for chunk_id in present))
+            self._refresh()
+
+    def search(self, query_vectors, n: int) -> list:
+        """Ids of the `n` most similar chunks to each query, best first, from one exact scoring pass."""
+        with self._lock:
+            self._refresh()
+            matrix, deleted, ids = self._matrix, self._mask, self._ids
+        if matrix is None or not len(query_vectors):
+            return [[] for _ in query_vectors]
+        queries = self._normalize(query_vectors)
+        if matrix.dtype == np.float32:
+            scores = queries @ matrix.T
+        else:
+            scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+            for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+                block = matrix[start:start + SEARCH_BLOCK_ROWS]
+                scores[:, start:start + len(block)] = queries @ block.astype(np.float32).T
+        scores[:, deleted] = -np.inf
+        n = min(n, len(matrix) - int(deleted.sum()))
+        if n <= 0:
+            return [[] for _ in query_vectors]
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        results = []
+        for query_scores, candidates in zip(scores, top):
+            order = candidates[np.argsort(-query_scores[candidates])]
+            results.append([ids[row] for row in order])
+        return results
+
+    def get(self, ids: list) -> dict:
+        """{chunk_id: (text, metadata)} for the ids present in the index."""
+        with self._lock:
+            self._refresh()
+            return {chunk_id: self._records[chunk_id][1:] for chunk_id in ids if chunk_id in self._records}
+
+_indexes = {}  # collection name -> MmapVectorIndex
+_index_lock = threading.Lock()
+
+def index_directory(name: str) -> str:
+    """Each collection has its snapshot in a subdirectory of MMAP_DIRECTORY."""
+    return os.path.join(MMAP_DIRECTORY, name)
+
+def write_lock(name: str):
+    """Held while a process snapshots or appends to the collection's files, which several workers may share."""
+    return file_lock(os.path.join(index_directory(name), "write.lock"))
+
+def get_vector_index(store) -> MmapVectorIndex:
+    """
+    Returns the shared index of the store's collection. On first use it opens
+    the snapshot on disk, or takes a new one from the Chroma collection when
+    there is none or it holds a different number of chunks.
+    """
+    name = store._collection.name
+    if name not in _indexes:
+        with _index_lock:
+            if name not in _indexes:
+                index = MmapVectorIndex(index_directory(name), MMAP_DTYPE)
+                with write_lock(name):
+                    if not index.exists() or len(index) != store._collection.count():
+                        records = store._collection.get(include=["embeddings", "documents", "metadatas"])
+                        index.snapshot(records["ids"], records["documents"], records["metadatas"], records["embeddings"])
+                _indexes[name] = index
+    return _indexes[name]
+
+def index_vectors(store, ids, texts, metadatas, vectors) -> None:
+    """Called by ingestion after chunks are added. Before the index is opened this is a no-op, it is built from the collection."""
+    index = _indexes.get(store._collection.name)
+    if index is not None:
+        with write_lock(store._collection.name):
+            index.append(ids, texts, metadatas, vectors)
+
+def unindex_vectors(store, ids) -> None:
+    index = _indexes.get(store._collection.name)
+    if index is not None:
+        with write_lock(store._collection.name):
+            index.remove(ids)
+
+def forget_vector_index(name: str) -> None:
+    """
+    Another worker changed the collection, possibly without this index open
+    to append to; it is reopened on next use and re-snapshotted if it no
+    longer matches the collection.
+    """
+    with _index_lock:
+        _indexes.pop(name, None)
+
+subscribe("documents", lambda payload: forget_vector_index(payload["collection"]))
+
+def drop_vector_index(name: str) -> None:
+    """Forgets the index of a deleted collection and removes its files."""
+    with _index_lock:
+        _indexes.pop(name, None)
+        shutil.rmtree(index_directory(name), ignore_errors=True)
@@ -1,10 +1,21 @@
 import os
+import re
+import json
+import time
+import random
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+import chromadb
+from .embeddings import get_embeddings, EMBEDDING_MODEL
+from .keyword_index import index_chunks, unindex_chunks, drop_keyword_index
+from .mmap_store import index_vectors, unindex_vectors, drop_vector_index
+from .shared_state import WEB_CONCURRENCY, file_lock, publish
 
 # Initialize paths and create directories
 data_directory = "data"
@@ -12,6 +23,35 @@ chroma_directory = "chroma_db"
 os.makedirs(data_directory, exist_ok=True)
 os.makedirs(chroma_directory, exist_ok=True)
 
+# Records, for every ingested file, its hash, mtime and the ids of its chunks. One per
+# collection; the default collection keeps the path it had before collections.json.
+manifest_path = os.path.join(chroma_directory, "ingest_manifest.json")
+manifest_directory = os.path.join(chroma_directory, "manifests")
+# Which Chroma collection is served and the embedding model of each (see load_registry)
+registry_path = os.path.join(chroma_directory, "collections.json")
+# Lock files serializing the workers' writes to one source and to collections.json
+lock_directory = os.path.join(chroma_directory, "locks")
+supported_extensions = {".pdf", ".txt"}
+# langchain_chroma's default collection, the only one before collections.json existed
+DEFAULT_COLLECTION = "langchain"
+
+# New chunks are embedded and inserted this many at a time
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Attempts per batch when the embedding call fails (e.g. Inference API rate limits)
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "3"))
+# Where retrieval reads vectors from: chroma, or mmap (an exact-search snapshot of the
+# Chroma collection in db/mmap_store.py, kept in sync by ingestion)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Embedding model of the collection built on first start. Existing collections keep the
+# model they were embedded with; change it with a re-index (db/reindex.py).
+RETRIEVAL_EMBEDDING_MODEL = os.getenv("RETRIEVAL_EMBEDDING_MODEL", EMBEDDING_MODEL)
+# Model ids to treat as multilingual besides those with "multilingual" in their name
+MULTILINGUAL_MODELS = {m.strip() for m in os.getenv("MULTILINGUAL_MODELS", "BAAI/bge-m3").split(",") if m.strip()}
+# Chroma server shared by every worker and replica (e.g. chroma run --path chroma_db --port 8001).
+# Unset, each process opens chroma_directory itself, which is only safe with a single worker.
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
 # Initialize text splitter with simpler configuration
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500,
@@ -23,102 +63,406 @@ text_splitter = RecursiveCharacterTextSplitter(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_documents():
-    """Load all PDF and TXT documents from the data directory."""
-    documents = []
-    for file in os.listdir(data_directory):
-        file_path = os.path.join(data_directory, file)
+_manifest_lock = threading.Lock()
+_source_locks = {}
+
+if WEB_CONCURRENCY > 1 and not CHROMA_HOST:
+    logger.warning(f"WEB_CONCURRENCY={WEB_CONCURRENCY} without CHROMA_HOST: every worker writes "
+                   f"{chroma_directory} directly, which can corrupt it; run a Chroma server")
+
+def write_json(path: str, data: dict) -> None:
+    """Writes atomically so a crash never leaves the file half-written."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def collection_manifest_path(collection: str) -> str:
+    if collection == DEFAULT_COLLECTION:
+        return manifest_path
+    return os.path.join(manifest_directory, f"{collection}.json")
+
+def load_manifest(collection: str = DEFAULT_COLLECTION) -> dict:
+    path = collection_manifest_path(collection)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+def update_manifest(collection: str, source: str, entry) -> None:
+    """Sets (or removes, if `entry` is None) one source in the collection's manifest."""
+    path = collection_manifest_path(collection)
+    with _manifest_lock, file_lock(path + ".lock"):
+        manifest = load_manifest(collection)
+        if entry is None:
+            manifest.pop(source, None)
+        else:
+            manifest[source] = entry
+        os.makedirs(manifest_directory, exist_ok=True)
+        write_json(path, manifest)
+
+def is_multilingual(model_name: str) -> bool:
+    return "multilingual" in model_name.lower() or model_name in MULTILINGUAL_MODELS
+
+_registry = None
+_registry_mtime = None
+_registry_lock = threading.Lock()
+_registry_update_lock = threading.Lock()  # see registry_update()
+
+@contextmanager
+def registry_update():
+    """Held across a load_registry() / save_registry() pair, by one thread of one worker at a time."""
+    with _registry_update_lock, file_lock(os.path.join(lock_directory, "collections.lock")):
+        yield
+
+def load_registry() -> dict:
+    """
+    {"active": name, "previous": name or None, "collections": {name: {"model", "created_at", "status"}}},
+    reread whenever collections.json changes (another worker may have switched
+    collections). Stores from before the registry are the default collection,
+    embedded with EMBEDDING_MODEL.
+    """
+    global _registry, _registry_mtime
+    with _registry_lock:
+        mtime = os.stat(registry_path).st_mtime_ns if os.path.exists(registry_path) else None
+        if _registry is None or mtime != _registry_mtime:
+            if mtime is not None:
+                with open(registry_path, "r") as f:
+                    _registry = json.load(f)
+            else:
+                legacy = os.path.exists(os.path.join(chroma_directory, "chroma.sqlite3"))
+                model = EMBEDDING_MODEL if legacy else RETRIEVAL_EMBEDDING_MODEL
+                _registry = {
+                    "active": DEFAULT_COLLECTION,
+                    "previous": None,
+                    "collections": {DEFAULT_COLLECTION: {"model": model, "created_at": time.time(), "status": "ready"}},
+                }
+                # Recorded straight away: once Chroma has written its files the store would look legacy
+                write_json(registry_path, _registry)
+                mtime = os.stat(registry_path).st_mtime_ns
+            _registry_mtime = mtime
+        return json.loads(json.dumps(_registry))
+
+def save_registry(registry: dict) -> None:
+    global _registry, _registry_mtime
+    with _registry_lock:
+        write_json(registry_path, registry)
+        _registry = json.loads(json.dumps(registry))
+        _registry_mtime = os.stat(registry_path).st_mtime_ns
+
+def active_collection() -> dict:
+    """The served collection's registry entry plus its "name" and whether its model is multilingual."""
+    registry = load_registry()
+    entry = registry["collections"][registry["active"]]
+    return {"name": registry["active"], **entry, "multilingual": is_multilingual(entry["model"])}
+
+def source_lock(source: str) -> threading.Lock:
+    with _manifest_lock:
+        return _source_locks.setdefault(source, threading.Lock())
+
+def source_file_lock(source: str):
+    """Keeps two workers from ingesting the same source at once."""
+    return file_lock(os.path.join(lock_directory, hashlib.sha1(source.encode("utf-8")).hexdigest() + ".lock"))
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source: str, text: str) -> str:
+    """Chunk ids depend only on the source and the chunk text, so unchanged chunks keep their id."""
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+def get_loader(file_path: str):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        logger.info(f"Loading PDF: {file_path}")
+        return PyPDFLoader(file_path)
+    if ext == ".txt":
+        logger.info(f"Loading TXT: {file_path}")
+        return TextLoader(file_path)
+    raise ValueError("Unsupported file type")
+
+def iter_chunks(file_path: str, source: str):
+    """Loads a file page by page and yields (chunk_id, chunk), skipping repeated chunks."""
+    seen = set()
+    for page in get_loader(file_path).lazy_load():
+        for chunk in text_splitter.split_documents([page]):
+            cid = chunk_id(source, chunk.page_content)
+            if cid not in seen:
+                seen.add(cid)
+                yield cid, chunk
+
+def add_batch(store, batch: list) -> None:
+    """Embeds and inserts one batch of (chunk_id, chunk), retrying with jittered backoff."""
+    if not batch:
+        # Chroma rejects an upsert without embeddings
+        return
+    ids = [cid for cid, _ in batch]
+    texts = [chunk.page_content for _, chunk in batch]
+    metadatas = [chunk.metadata or None for _, chunk in batch]
+    for attempt in range(1, INGEST_RETRIES + 1):
         try:
-            if file.lower().endswith(".pdf"):
-                logger.info(f"Loading PDF: {file}")
-                loader = PyPDFLoader(file_path)
-                documents.extend(loader.load())
-            elif file.lower().endswith(".txt"):
-                logger.info(f"Loading TXT: {file}")
-                loader = TextLoader(file_path)
-                documents.extend(loader.load())
+            # Embedded here rather than by store.add_documents so the mmap index gets the same vectors
+            vectors = store._embedding_function.embed_documents(texts)
+            store._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+            index_chunks(store, ids, texts)
+            index_vectors(store, ids, texts, metadatas, vectors)
+            return
         except Exception as e:
-            logger.error(f"Error loading {file}: {str(e)}")
-    return documents
-
-def process_documents(documents):
-    """Split documents and remove duplicates."""
-    docs_processed = []
-    unique_texts = set()  # Changed to set for better performance
-    for doc in documents:
-        new_docs = text_splitter.split_documents([doc])
-        for new_doc in new_docs:
-            if new_doc.page_content not in unique_texts:
-                unique_texts.add(new_doc.page_content)
-                docs_processed.append(new_doc)
-    logger.info(f"Processed {len(documents)} documents into {len(docs_processed)} unique chunks")
-    return docs_processed
+            if attempt == INGEST_RETRIES:
+                raise
+            delay = 2 ** (attempt - 1) + random.random()
+            logger.warning(f"Embedding batch failed (attempt {attempt}/{INGEST_RETRIES}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
 
-def get_vector_store():
-    """Get or initialize the vector store."""
-    embeddings = HuggingFaceInferenceAPIEmbeddings(
-        api_key=os.getenv("HF_TOKEN"),
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
+def delete_chunks(store, ids: list) -> None:
+    """Deletes chunks from the collection and the indexes mirroring it."""
+    store.delete(ids=ids)
+    unindex_chunks(store, ids)
+    unindex_vectors(store, ids)
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+_chroma_client = None
+
+def chroma_client():
+    """A client of the CHROMA_HOST server, or None to open chroma_directory in process."""
+    global _chroma_client
+    if CHROMA_HOST and _chroma_client is None:
+        _chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        logger.info(f"Using the Chroma server at {CHROMA_HOST}:{CHROMA_PORT}")
+    return _chroma_client
+
+def open_collection(name: str, model_name: str) -> Chroma:
+    client = chroma_client()
+    return Chroma(
+        collection_name=name,
+        client=client,
+        persist_directory=None if client else chroma_directory,
+        embedding_function=get_embeddings(model_name),
     )
-    
-    # First try to load existing store
-    if os.path.exists(chroma_directory) and os.listdir(chroma_directory):
-        logger.info("Loading existing vector store")
-        store = Chroma(
-            persist_directory=chroma_directory,
-            embedding_function=embeddings
-        )
-        logger.info(f"Loaded vector store with {store._collection.count()} documents")
+
+def documents_changed(collection: str) -> None:
+    """Lets the other workers drop what they derived from the collection's chunks."""
+    publish("documents", {"collection": collection, "active": collection == active_collection()["name"]})
+
+def get_vector_store():
+    """
+    Returns the store of the active collection, loading or building it on
+    first use and reopening it when the registry names another collection.
+    """
+    global _vector_store
+    active = active_collection()
+    if _vector_store is None or _vector_store._collection.name != active["name"]:
+        with _vector_store_lock:
+            if _vector_store is None or _vector_store._collection.name != active["name"]:
+                _vector_store = _build_vector_store(active["name"], active["model"])
+    return _vector_store
+
+def _build_vector_store(name: str, model_name: str):
+    """Load the persisted collection, or create it from the data directory."""
+    store = open_collection(name, model_name)
+    count = store._collection.count()
+    if count or load_manifest(name):
+        logger.info(f"Loaded collection {name} ({model_name}) with {count} documents")
         return store
-    
-    # Initialize new store if it doesn't exist
-    logger.info("Creating new vector store")
-    documents = load_documents()
-    processed_docs = process_documents(documents)
-    vector_store = Chroma.from_documents(
-        processed_docs, 
-        embeddings, 
-        persist_directory=chroma_directory
-    )
-    logger.info(f"Initialized vector store with {len(processed_docs)} documents")
-    return vector_store
+
+    logger.info(f"Creating collection {name} ({model_name})")
+    results = sync_directory(data_directory, store)
+    added = sum(r["chunks_added"] for r in results)
+    if added:
+        logger.info(f"Initialized vector store with {added} chunks")
+    else:
+        logger.warning(f"No documents in {data_directory}; the collection stays empty until one is uploaded")
+    return store
+
+def new_collection_name(model_name: str) -> str:
+    """e.g. paraphrase-multilingual-minilm-l12-v2-20250301120000 (Chroma allows 3-63 of [a-z0-9._-])."""
+    slug = re.sub(r"[^a-z0-9]+", "-", model_name.split("/")[-1].lower()).strip("-")[:40]
+    return f"{slug or 'collection'}-{time.strftime('%Y%m%d%H%M%S')}"
+
+def register_collection(name: str, model_name: str) -> None:
+    """Records a collection being built, so it is listed (and cleaned up) before it is served."""
+    with registry_update():
+        registry = load_registry()
+        registry["collections"][name] = {"model": model_name, "created_at": time.time(), "status": "building"}
+        save_registry(registry)
+
+def activate_collection(name: str) -> dict:
+    """
+    Makes `name` the served collection. Every worker reopens it on its next
+    get_vector_store(), while requests already running finish on the old one.
+    The replaced collection is kept for a rollback and older ones are deleted.
+    Returns the new registry.
+    """
+    with registry_update():
+        registry = load_registry()
+        if name not in registry["collections"]:
+            raise KeyError(f"Unknown collection {name}")
+        registry["collections"][name]["status"] = "ready"
+        if registry["active"] != name:
+            registry["previous"] = registry["active"]
+            registry["active"] = name
+        stale = [
+            other for other, entry in registry["collections"].items()
+            if other not in (name, registry["previous"]) and entry["status"] != "building"
+        ]
+        save_registry(registry)
+    logger.info(f"Serving collection {name} ({registry['collections'][name]['model']})")
+    publish("collections", {"active": name})
+    for other in stale:
+        delete_collection(other)
+    return load_registry()
+
+def delete_collection(name: str) -> None:
+    """Drops a collection that is not served, with its manifest and indexes."""
+    with registry_update():
+        registry = load_registry()
+        if name == registry["active"]:
+            raise ValueError(f"{name} is the active collection")
+        registry["collections"].pop(name, None)
+        if registry.get("previous") == name:
+            registry["previous"] = None
+        save_registry(registry)
+    try:
+        client = chroma_client()
+        if client:
+            client.delete_collection(name)
+        else:
+            Chroma(collection_name=name, persist_directory=chroma_directory).delete_collection()
+    except Exception as e:
+        logger.warning(f"Could not delete collection {name}: {e}")
+    if os.path.exists(collection_manifest_path(name)):
+        os.remove(collection_manifest_path(name))
+    drop_keyword_index(name)
+    drop_vector_index(name)
+    logger.info(f"Deleted collection {name}")
+
+def ingest_file(file_path: str, store=None, progress=None) -> dict:
+    """
+    Brings the vector store in line with one file. Unchanged files are
+    skipped without being parsed; for changed files only new chunks are
+    embedded (in batches of INGEST_BATCH_SIZE) and chunks that disappeared
+    are deleted. `progress`, if given, is called as progress(stage, chunks_seen, chunks_added).
+    """
+    store = store if store is not None else get_vector_store()
+    collection = store._collection.name
+    source = os.path.normpath(file_path)
+    report = progress or (lambda stage, seen, added: None)
+    with source_lock(source), source_file_lock(source):
+        entry = load_manifest(collection).get(source)
+        stat = os.stat(file_path)
+        result = {"source": source, "chunks_added": 0, "chunks_removed": 0, "chunks_unchanged": 0}
+
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return {**result, "status": "unchanged", "chunks_unchanged": len(entry["chunk_ids"])}
+        digest = file_hash(file_path)
+        if entry and entry["hash"] == digest:
+            update_manifest(collection, source, {**entry, "mtime": stat.st_mtime, "size": stat.st_size})
+            return {**result, "status": "unchanged", "chunks_unchanged": len(entry["chunk_ids"])}
+
+        if entry is None:
+            # Stores built before the manifest existed have chunks with random ids;
+            # drop them so the file is not indexed twice.
+            legacy_ids = store._collection.get(where={"source": file_path}, include=[])["ids"]
+            if legacy_ids:
+                delete_chunks(store, legacy_ids)
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        chunk_ids = []
+        batch = []
+        added = 0
+        report("loading", 0, 0)
+        for cid, chunk in iter_chunks(file_path, source):
+            chunk_ids.append(cid)
+            if cid not in old_ids:
+                batch.append((cid, chunk))
+            if len(batch) >= INGEST_BATCH_SIZE:
+                add_batch(store, batch)
+                added += len(batch)
+                batch = []
+                report("embedding", len(chunk_ids), added)
+        if batch:
+            add_batch(store, batch)
+            added += len(batch)
+        report("embedding", len(chunk_ids), added)
+
+        removed_ids = list(old_ids - set(chunk_ids))
+        if removed_ids:
+            delete_chunks(store, removed_ids)
+
+        update_manifest(collection, source, {
+            "hash": digest,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "chunk_ids": chunk_ids,
+            "ingested_at": time.time(),
+        })
+        logger.info(f"Ingested {source}: {added} chunks added, {len(removed_ids)} removed")
+        if added or removed_ids:
+            documents_changed(collection)
+        return {
+            **result,
+            "status": "updated" if entry else "added",
+            "chunks_added": added,
+            "chunks_removed": len(removed_ids),
+            "chunks_unchanged": len(chunk_ids) - added,
+        }
+
+def remove_source(source: str, store=None) -> int:
+    """Deletes every chunk of a source that no longer exists. Returns the number removed."""
+    store = store if store is not None else get_vector_store()
+    collection = store._collection.name
+    source = os.path.normpath(source)
+    with source_lock(source), source_file_lock(source):
+        entry = load_manifest(collection).get(source)
+        if entry is None:
+            return 0
+        if entry["chunk_ids"]:
+            delete_chunks(store, entry["chunk_ids"])
+        update_manifest(collection, source, None)
+    documents_changed(collection)
+    logger.info(f"Removed {source}: {len(entry['chunk_ids'])} chunks")
+    return len(entry["chunk_ids"])
+
+def sync_directory(directory: str = data_directory, store=None) -> list:
+    """
+    Ingests every PDF/TXT file in `directory` and removes the chunks of files
+    that were deleted from it. Unchanged files cost a stat() call.
+    """
+    store = store if store is not None else get_vector_store()
+    results = []
+    present = set()
+    for file in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, file)
+        if os.path.splitext(file)[1].lower() not in supported_extensions:
+            continue
+        present.add(os.path.normpath(file_path))
+        try:
+            results.append(ingest_file(file_path, store))
+        except Exception as e:
+            logger.error(f"Error loading {file}: {str(e)}")
+            results.append({"source": os.path.normpath(file_path), "status": "failed", "error": str(e),
+                            "chunks_added": 0, "chunks_removed": 0, "chunks_unchanged": 0})
+
+    prefix = os.path.normpath(directory) + os.sep
+    for source in load_manifest(store._collection.name):
+        if source.startswith(prefix) and source not in present:
+            removed = remove_source(source, store)
+            results.append({"source": source, "status": "removed", "chunks_added": 0,
+                            "chunks_removed": removed, "chunks_unchanged": 0})
+    return results
 
 def add_document(file_path: str) -> int:
     """
-    Add a new document to the vector store.
+    Add a new document to the vector store, or re-sync it if it was added before.
     Returns the number of chunks added.
     """
     try:
-        # Load and process the new document
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext == ".pdf":
-            logger.info(f"Loading new PDF: {file_path}")
-            loader = PyPDFLoader(file_path)
-        elif ext == ".txt":
-            logger.info(f"Loading new TXT: {file_path}")
-            loader = TextLoader(file_path)
-        else:
-            raise ValueError("Unsupported file type")
-            
-        new_docs = loader.load()
-        processed_chunks = text_splitter.split_documents(new_docs)
-        
-        # Add to existing vector store
-        embeddings = HuggingFaceInferenceAPIEmbeddings(
-            api_key=os.getenv("HF_TOKEN"),
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        vector_store = Chroma(
-            persist_directory=chroma_directory,
-            embedding_function=embeddings
-        )
-        vector_store.add_documents(processed_chunks)
-        
-        logger.info(f"Added {len(processed_chunks)} new chunks to vector store")
-        return len(processed_chunks)
+        return ingest_file(file_path)["chunks_added"]
     except Exception as e:
         logger.error(f"Error adding document {file_path}: {str(e)}")
         raise
-
-# Initialize the vector store on module import
-vector_store = get_vector_store()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Re-embeds the documents into a new collection with another embedding model
+(by default MULTILINGUAL_EMBEDDING_MODEL) while the active collection keeps
+serving, then switches every worker to it.
+
+    python -m db.reindex [model]
+
+The replaced collection is kept until the next switch, so a bad model can be
+rolled back with POST /documents/collections/{name}/activate.
+"""
+import os
+import time
+import uuid
+import logging
+import argparse
+import threading
+from .embeddings import MULTILINGUAL_EMBEDDING_MODEL
+from .keyword_index import get_keyword_index
+from .mmap_store import get_vector_index
+from .rag_store import (
+    data_directory, supported_extensions, VECTOR_BACKEND, open_collection, new_collection_name,
+    register_collection, activate_collection, delete_collection, ingest_file, sync_directory,
+)
+from .retrieval import RETRIEVAL_MODE
+from .shared_state import SHARED_STATE_BACKEND, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+# With several workers the running job is shared for this long after its last progress,
+# so a worker that died mid-job blocks new re-indexes only this long
+SHARED_JOB_TTL_SECONDS = 600
+
+# Shared-state claim held by the worker running a re-index
+REINDEX_CLAIM = "reindex"
+
+class ReindexInProgress(Exception):
+    """Raised when a re-index is already running, in this worker or another."""
+
+def new_job(model_name: str) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "model": model_name,
+        "collection": new_collection_name(model_name),
+        "status": "queued",
+        "progress": {"stage": "queued", "files_done": 0, "files_total": 0, "chunks_added": 0},
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+def share_job(job: dict) -> None:
+    if SHARED_STATE_BACKEND == "local":
+        return
+    try:
+        get_shared_state().set_value("reindex_job", job, SHARED_JOB_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Could not share re-index job {job['id']}: {e}")
+
+def release_claim() -> None:
+    try:
+        get_shared_state().release(REINDEX_CLAIM)
+    except Exception as e:
+        logger.warning(f"Could not release the re-index claim: {e}")
+
+def reindex(job: dict) -> dict:
+    """
+    Runs a job from new_job(): embeds every data file into the new collection,
+    builds its keyword and mmap indexes (so the first query after the switch
+    is not the one paying for them), switches to it, then ingests the files
+    uploaded meanwhile. On failure the partial collection is deleted and the
+    active one is left untouched.
+    """
+    name, progress = job["collection"], job["progress"]
+    job.update(status="running", started_at=time.time())
+    try:
+        register_collection(name, job["model"])
+        store = open_collection(name, job["model"])
+        files = [
+            os.path.join(data_directory, file) for file in sorted(os.listdir(data_directory))
+            if os.path.splitext(file)[1].lower() in supported_extensions
+        ]
+        progress.update(stage="embedding", files_total=len(files))
+        for file_path in files:
+            progress["chunks_added"] += ingest_file(file_path, store)["chunks_added"]
+            progress["files_done"] += 1
+            share_job(job)
+
+        progress["stage"] = "indexing"
+        if RETRIEVAL_MODE in ("keyword", "hybrid"):
+            get_keyword_index(store)
+        if VECTOR_BACKEND == "mmap":
+            get_vector_index(store)
+
+        progress["stage"] = "switching"
+        activate_collection(name)
+        progress["stage"] = "catching_up"
+        caught_up = sync_directory(data_directory, store)
+        progress["chunks_added"] += sum(result["chunks_added"] for result in caught_up)
+        progress["stage"] = "done"
+        job.update(status="succeeded", finished_at=time.time())
+        logger.info(f"Re-indexed {len(files)} files into {name} ({job['model']}) "
+                    f"in {job['finished_at'] - job['started_at']:.1f}s")
+    except Exception as e:
+        logger.error(f"Re-index into {name} failed: {e}")
+        job.update(status="failed", error=str(e), finished_at=time.time())
+        if progress["stage"] not in ("catching_up", "done"):
+            delete_collection(name)
+    share_job(job)
+    return job
+
+class Reindexer:
+    """
+    Runs one re-index at a time on a background thread and keeps the last job
+    for GET /documents/collections. With several workers, the job is shared so
+    that only one of them re-indexes and all of them report it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job = None
+
+    def start(self, model_name: str, on_complete=None) -> dict:
+        """
+        Starts re-indexing into a new collection embedded with `model_name`.
+        `on_complete(job)` runs on the job's thread after a successful switch.
+        """
+        with self._lock:
+            current = self._current()
+            if current and current["status"] in ("queued", "running"):
+                raise ReindexInProgress(f"Already re-indexing into {current['collection']}")
+            # Two workers can both pass the check above; only one of them gets the claim.
+            # A job outliving the claim's TTL is still caught by the check, since it keeps
+            # refreshing the shared job
+            if not get_shared_state().claim(REINDEX_CLAIM, SHARED_JOB_TTL_SECONDS):
+                raise ReindexInProgress("Already re-indexing in another worker")
+            job = self._job = new_job(model_name)
+            share_job(job)
+
+        def run():
+            try:
+                reindex(job)
+            finally:
+                release_claim()
+            if job["status"] == "succeeded" and on_complete:
+                try:
+                    on_complete(job)
+                except Exception as e:
+                    logger.error(f"Re-index completion callback failed: {e}")
+
+        threading.Thread(target=run, name="reindex", daemon=True).start()
+        return self.get()
+
+    def get(self):
+        """A copy of the current or last job, or None."""
+        with self._lock:
+            return self._current()
+
+    def _current(self):
+        """This worker's running job, else the shared one (maybe run by another worker), else this worker's last job."""
+        own = None if self._job is None else {**self._job, "progress": dict(self._job["progress"])}
+        if SHARED_STATE_BACKEND == "local" or (own and own["status"] in ("queued", "running")):
+            return own
+        return get_shared_state().get_value("reindex_job") or own
+
+reindexer = Reindexer()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", nargs="?", default=MULTILINGUAL_EMBEDDING_MODEL, help="embedding model id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    job = reindex(new_job(args.model))
+    print(f"{job['status']}: {job['collection']} {job['progress']}" + (f" ({job['error']})" if job["error"] else ""))
@@ -0,0 +1,184 @@
+import os
+import time
+import logging
+import threading
+from langchain.docstore.document import Document
+from .keyword_index import get_keyword_index
+from .mmap_store import get_vector_index
+from .rag_store import VECTOR_BACKEND, active_collection
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# vector (Chroma only), keyword (BM25 only) or hybrid (both, fused with reciprocal-rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
+if RETRIEVAL_MODE not in RETRIEVAL_MODES:
+    # Any other value would run no search at all and every query would come back empty
+    logger.warning(f"Unknown RETRIEVAL_MODE {RETRIEVAL_MODE!r}, expected one of {', '.join(RETRIEVAL_MODES)}; using hybrid")
+    RETRIEVAL_MODE = "hybrid"
+# Chunks returned to the agent
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+# Candidates taken from each of the vector and keyword searches before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# The k constant of reciprocal-rank fusion; higher values flatten the rank weights
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+# Cross-encoder used to rerank the fused candidates, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+# (needs sentence-transformers). Empty disables reranking.
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+# Fused candidates passed to the reranker
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+
+STAGES = ("vector", "keyword", "fusion", "rerank", "total")
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "batches": 0, **{f"{stage}_seconds_total": 0.0 for stage in STAGES}}
+
+def get_reranker():
+    """Loads the cross-encoder on first use, on CPU unless told otherwise."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            from sentence_transformers import CrossEncoder
+            _reranker = CrossEncoder(RERANKER_MODEL, device=os.getenv("RERANKER_DEVICE", "cpu"))
+        return _reranker
+
+def vector_search(store, queries: list, n: int) -> list:
+    """Ids of the `n` chunks nearest to each query, best first: one embedding batch and one Chroma (or mmap) search for all."""
+    if VECTOR_BACKEND == "mmap":
+        index = get_vector_index(store)
+        if not len(index):
+            return [[] for _ in queries]
+        query_embeddings = store._embedding_function.embed_documents(queries)
+        with span("mmap.search", {"mmap.queries": len(queries), "mmap.rows": len(index)}):
+            return index.search(query_embeddings, n)
+    count = store._collection.count()
+    if count == 0:
+        return [[] for _ in queries]
+    query_embeddings = store._embedding_function.embed_documents(queries)
+    with span("chroma.query", {"chroma.queries": len(queries), "chroma.n_results": min(n, count)}):
+        results = store._collection.query(query_embeddings=query_embeddings, n_results=min(n, count), include=[])
+    return results["ids"]
+
+def keyword_search(store, query: str, n: int) -> list:
+    return [chunk_id for chunk_id, _ in get_keyword_index(store).search(query, n)]
+
+def reciprocal_rank_fusion(rankings: list, k: int = RETRIEVAL_RRF_K) -> list:
+    """Merges several ranked id lists: each id scores sum(1 / (k + rank)) over the lists it is in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def fetch_documents(store, ids: list) -> dict:
+    """Loads chunk texts and metadata from the collection as {chunk_id: Document}."""
+    if not ids:
+        return {}
+    if VECTOR_BACKEND == "mmap":
+        return {
+            chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata)
+            for chunk_id, (text, metadata) in get_vector_index(store).get(ids).items()
+        }
+    with span("chroma.get", {"chroma.ids": len(ids)}):
+        records = store._collection.get(ids=ids, include=["documents", "metadatas"])
+    return {
+        chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+    }
+
+def rerank(queries: list, results: list) -> list:
+    """Reorders each query's documents by cross-encoder score, scoring every (query, document) pair in one batch."""
+    pairs = [(query, doc.page_content) for query, docs in zip(queries, results) for doc in docs]
+    scores = iter(get_reranker().predict(pairs))
+    reranked = []
+    for docs in results:
+        doc_scores = [next(scores) for _ in docs]
+        reranked.append([doc for _, doc in sorted(zip(doc_scores, docs), key=lambda pair: pair[0], reverse=True)])
+    return reranked
+
+def retrieve_many(store, queries: list, k: int = None) -> list:
+    """
+    Returns, for each query, the `k` most relevant chunks as Documents, using
+    the stages enabled by RETRIEVAL_MODE and RERANKER_MODEL. Queries are
+    embedded, searched, fetched and reranked as one batch. Stage timings are
+    logged and added to retrieval_stats().
+    """
+    if not queries:
+        return []
+    k = k or RETRIEVAL_K
+    timings = dict.fromkeys(STAGES, 0.0)
+    start = time.perf_counter()
+    # Without a reranker only the top k of the fusion are used, so there is no point fetching more
+    candidates = max(k, RETRIEVAL_CANDIDATES if RERANKER_MODEL or RETRIEVAL_MODE == "hybrid" else k)
+
+    rankings = [[] for _ in queries]
+    if RETRIEVAL_MODE in ("vector", "hybrid"):
+        stage_start = time.perf_counter()
+        with span("retrieval.vector"):
+            for ranking, ids in zip(rankings, vector_search(store, queries, candidates)):
+                ranking.append(ids)
+        timings["vector"] = time.perf_counter() - stage_start
+    if RETRIEVAL_MODE in ("keyword", "hybrid"):
+        stage_start = time.perf_counter()
+        with span("retrieval.keyword"):
+            for ranking, query in zip(rankings, queries):
+                ranking.append(keyword_search(store, query, candidates))
+        timings["keyword"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    with span("retrieval.fusion"):
+        keep = RERANK_CANDIDATES if RERANKER_MODEL else k
+        fused = [(reciprocal_rank_fusion(lists) if len(lists) > 1 else lists[0])[:keep] for lists in rankings]
+        docs_by_id = fetch_documents(store, list(dict.fromkeys(i for ids in fused for i in ids)))
+        results = [[docs_by_id[i] for i in ids if i in docs_by_id] for ids in fused]
+    timings["fusion"] = time.perf_counter() - stage_start
+
+    if RERANKER_MODEL and any(len(docs) > 1 for docs in results):
+        stage_start = time.perf_counter()
+        with span("retrieval.rerank", {"retrieval.reranker": RERANKER_MODEL}):
+            try:
+                results = rerank(queries, results)
+            except Exception as e:
+                logger.warning(f"Reranking failed, keeping fused order: {e}")
+        timings["rerank"] = time.perf_counter() - stage_start
+
+    timings["total"] = time.perf_counter() - start
+    with _stats_lock:
+        _stats["queries"] += len(queries)
+        _stats["batches"] += 1
+        for stage, seconds in timings.items():
+            _stats[f"{stage}_seconds_total"] += seconds
+    logger.info(
+        f"Retrieved chunks for {len(queries)} queries ({RETRIEVAL_MODE}"
+        f"{' + rerank' if RERANKER_MODEL else ''}) in {timings['total'] * 1000:.1f}ms: "
+        + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items() if stage != "total")
+    )
+    return [docs[:k] for docs in results]
+
+def retrieve(store, query: str, k: int = None) -> list:
+    """Single-query form of retrieve_many()."""
+    return retrieve_many(store, [query], k)[0]
+
+def retrieval_stats() -> dict:
+    """Configuration and average time per stage and batch since startup."""
+    collection = active_collection()
+    with _stats_lock:
+        batches = _stats["batches"]
+        return {
+            "mode": RETRIEVAL_MODE,
+            "vector_backend": VECTOR_BACKEND,
+            "collection": collection["name"],
+            "embedding_model": collection["model"],
+            "reranker": RERANKER_MODEL or None,
+            "k": RETRIEVAL_K,
+            "candidates": RETRIEVAL_CANDIDATES,
+            "queries": _stats["queries"],
+            "batches": batches,
+            **{
+                f"{stage}_ms_avg": _stats[f"{stage}_seconds_total"] * 1000 / batches if batches else 0.0
+                for stage in STAGES
+            },
+        }
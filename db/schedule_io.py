@@ -0,0 +1,146 @@
+"""
+Bulk import and export of the weekly class schedule as CSV or JSON.
+
+    python -m db.schedule_io export --format csv > schedule.csv
+    python -m db.schedule_io import schedule.csv [--replace]
+
+Both formats use the gym_classes columns. day_of_week is 0 (Sunday) to 6
+(Saturday), a day name ("tuesday", "martes") or empty for a daily class.
+"""
+import io
+import csv
+import sys
+import json
+import logging
+import argparse
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from .db import (
+    engine, gym_classes, init_db, mark_gym_classes_changed, generate_occurrences,
+    normalize_time, DEFAULT_LOCATION, DEFAULT_CAPACITY,
+)
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [column.name for column in gym_classes.columns]
+
+DAY_NAMES = {
+    "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6,
+    "domingo": 0, "lunes": 1, "martes": 2, "miercoles": 3, "miércoles": 3, "jueves": 4, "viernes": 5,
+    "sabado": 6, "sábado": 6,
+}
+
+def parse_day(value):
+    """0-6, a day name or empty (every day) -> int or None."""
+    if value is None or str(value).strip() == "":
+        return None
+    value = str(value).strip().lower()
+    if value in DAY_NAMES:
+        return DAY_NAMES[value]
+    day = int(value)
+    if not 0 <= day <= 6:
+        raise ValueError(f"day_of_week must be between 0 (Sunday) and 6, got {day}")
+    return day
+
+def normalize_row(row: dict) -> dict:
+    """Validates one imported row and fills in defaults. Raises ValueError if it is invalid."""
+    missing = [name for name in ("class_id", "class_name", "instructor_name", "start_time", "duration_mins")
+               if row.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    duration = int(row["duration_mins"])
+    if duration <= 0:
+        raise ValueError("duration_mins must be positive")
+    capacity = row.get("capacity")
+    return {
+        "class_id": int(row["class_id"]),
+        "class_name": str(row["class_name"]).strip(),
+        "instructor_name": str(row["instructor_name"]).strip(),
+        "location": str(row.get("location") or DEFAULT_LOCATION).strip(),
+        "day_of_week": parse_day(row.get("day_of_week")),
+        "start_time": normalize_time(str(row["start_time"])),
+        "duration_mins": duration,
+        "capacity": DEFAULT_CAPACITY if capacity in (None, "") else int(capacity),
+    }
+
+def parse_classes(data: str, format: str) -> list:
+    """CSV text (with a header row) or a JSON list of objects -> list of raw row dicts."""
+    if format == "csv":
+        return list(csv.DictReader(io.StringIO(data)))
+    if format == "json":
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get("classes", [])
+        if not isinstance(rows, list):
+            raise ValueError("JSON schedule must be a list of classes")
+        return rows
+    raise ValueError(f"Unknown format {format!r}, expected csv or json")
+
+def upsert_classes(rows: list, replace: bool = False) -> int:
+    """
+    Inserts or updates (by class_id) normalized rows in one transaction.
+    With replace, classes not in `rows` are deleted. Returns the rows written.
+    """
+    with engine.begin() as connection:
+        if replace:
+            connection.execute(delete(gym_classes).where(
+                gym_classes.c.class_id.not_in([row["class_id"] for row in rows])
+            ))
+        if rows:
+            stmt = insert(gym_classes)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[gym_classes.c.class_id],
+                set_={name: stmt.excluded[name] for name in COLUMNS if name != "class_id"},
+            )
+            connection.execute(stmt, rows)
+    mark_gym_classes_changed()
+    generate_occurrences()
+    return len(rows)
+
+def import_classes(data: str, format: str, replace: bool = False) -> int:
+    """Parses, validates and upserts a schedule. Raises ValueError naming the first invalid row."""
+    rows = []
+    for number, row in enumerate(parse_classes(data, format), start=1):
+        try:
+            rows.append(normalize_row(row))
+        except (ValueError, TypeError) as error:
+            raise ValueError(f"Row {number}: {error}") from error
+    count = upsert_classes(rows, replace)
+    logger.info(f"Imported {count} classes ({format}{', replacing the schedule' if replace else ''})")
+    return count
+
+def export_classes(format: str) -> str:
+    """The whole schedule as CSV or JSON, ordered by location, day and time."""
+    with engine.connect() as connection:
+        rows = [dict(row._mapping) for row in connection.execute(
+            select(gym_classes).order_by(gym_classes.c.location, gym_classes.c.day_of_week, gym_classes.c.start_time)
+        )]
+    if format == "json":
+        return json.dumps(rows, indent=2, ensure_ascii=False)
+    if format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+    raise ValueError(f"Unknown format {format!r}, expected csv or json")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write the schedule to stdout")
+    export_parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    import_parser = subparsers.add_parser("import", help="upsert classes from a file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "json"], help="defaults to the file extension")
+    import_parser.add_argument("--replace", action="store_true", help="delete classes missing from the file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if args.command == "export":
+        sys.stdout.write(export_classes(args.format))
+    else:
+        format = args.format or ("json" if args.path.lower().endswith(".json") else "csv")
+        with open(args.path, "r", encoding="utf-8") as f:
+            print(f"Imported {import_classes(f.read(), format, args.replace)} classes")
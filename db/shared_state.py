@@ -0,0 +1,353 @@
+"""
+State shared by the worker processes when the API runs with several uvicorn
+workers (WEB_CONCURRENCY) or replicas:
+
+  - counters, e.g. the gym_classes version that the sql_engine cache, the
+    router and the /classes ETags are keyed on
+  - values with a TTL, e.g. ingestion jobs polled through any worker
+  - claims: the first worker to claim a key within a TTL wins, e.g. to answer
+    a redelivered WhatsApp message once whichever worker receives it
+  - an invalidation bus: a worker that writes (documents, classes, a
+    conversation turn) publishes an event, and every other worker runs the
+    handlers subscribed to its topic within BUS_POLL_SECONDS, e.g. to clear
+    its answer cache or drop its keyword index
+
+SHARED_STATE_BACKEND=local keeps both in the process (a single worker),
+sqlite in one WAL database for the workers of one host, and redis
+(REDIS_URL, pip install redis) for replicas on several hosts.
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# uvicorn's default --workers; more than one needs state shared between them
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "local").lower()
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "data/shared_state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# How often each worker reads the events published by the others
+BUS_POLL_SECONDS = float(os.getenv("BUS_POLL_SECONDS", "0.5"))
+# Events older than this are pruned; every worker has long read them by then
+EVENT_RETENTION_SECONDS = 600
+REDIS_PREFIX = "gym:"
+
+# Tells this process's own events apart from those of the other workers
+PROCESS_ID = uuid.uuid4().hex
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive lock on `path` held across processes (and threads, each lock
+    being its own open file). Guards read-modify-write cycles on files that
+    several workers share, such as the ingest manifests.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class LocalSharedState:
+    """A single worker: counters in memory and nobody to publish to."""
+
+    def __init__(self):
+        self._counters = defaultdict(int)
+        self._claims = {}  # key -> expires at
+        self._values = {}  # key -> (value, expires at)
+        self._lock = threading.Lock()
+        self._store_id = uuid.uuid4().hex[:8]
+
+    def store_id(self) -> str:
+        return self._store_id
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def incr(self, name: str) -> int:
+        with self._lock:
+            self._counters[name] += 1
+            return self._counters[name]
+
+    def set_value(self, key: str, value, ttl: float) -> None:
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl)
+
+    def get_value(self, key: str):
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, 0))
+            return value if expires_at > time.time() else None
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._claims.get(key, 0) > now:
+                return False
+            self._claims[key] = now + ttl
+            return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._claims.pop(key, None)
+
+    def publish(self, topic: str, payload) -> None:
+        pass
+
+    def last_event(self):
+        return 0
+
+    def events_after(self, cursor) -> tuple:
+        return [], cursor
+
+class SQLiteSharedState:
+    """Counters and an event log in one SQLite database (WAL mode) on the host's disk."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS idx_claims_expires ON claims (expires_at);
+                CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS idx_kv_expires ON kv (expires_at);
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    payload TEXT,
+                    origin TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('store_id', ?)", (uuid.uuid4().hex[:8],))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def store_id(self) -> str:
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+
+    def get(self, name: str) -> int:
+        row = self._connect().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, name: str) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1 RETURNING value",
+                (name,),
+            ).fetchall()[0][0]
+
+    def set_value(self, key: str, value, ttl: float) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + ttl))
+
+    def get_value(self, key: str):
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM claims WHERE key = ? AND expires_at < ?", (key, now))
+            return conn.execute("INSERT OR IGNORE INTO claims VALUES (?, ?)", (key, now + ttl)).rowcount == 1
+
+    def release(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM claims WHERE key = ?", (key,))
+
+    def publish(self, topic: str, payload) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO events (topic, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+                (topic, json.dumps(payload), PROCESS_ID, now),
+            )
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - EVENT_RETENTION_SECONDS,))
+            conn.execute("DELETE FROM claims WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+
+    def last_event(self):
+        return self._connect().execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+
+    def events_after(self, cursor) -> tuple:
+        """Events published after `cursor` as [(topic, payload, origin)], and the new cursor."""
+        rows = self._connect().execute(
+            "SELECT seq, topic, payload, origin FROM events WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        if not rows:
+            return [], cursor
+        return [(topic, json.loads(payload), origin) for _, topic, payload, origin in rows], rows[-1][0]
+
+class RedisSharedState:
+    """Counters as Redis keys and the event log as a capped Redis stream, shared by replicas on several hosts."""
+
+    def __init__(self, url: str):
+        import redis  # optional dependency: pip install redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._redis.set(REDIS_PREFIX + "store_id", uuid.uuid4().hex[:8], nx=True)
+
+    def store_id(self) -> str:
+        return self._redis.get(REDIS_PREFIX + "store_id")
+
+    def get(self, name: str) -> int:
+        return int(self._redis.get(REDIS_PREFIX + "counter:" + name) or 0)
+
+    def incr(self, name: str) -> int:
+        return self._redis.incr(REDIS_PREFIX + "counter:" + name)
+
+    def set_value(self, key: str, value, ttl: float) -> None:
+        self._redis.set(REDIS_PREFIX + "value:" + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def get_value(self, key: str):
+        value = self._redis.get(REDIS_PREFIX + "value:" + key)
+        return json.loads(value) if value is not None else None
+
+    def claim(self, key: str, ttl: float) -> bool:
+        return bool(self._redis.set(REDIS_PREFIX + "claim:" + key, 1, nx=True, ex=max(int(ttl), 1)))
+
+    def release(self, key: str) -> None:
+        self._redis.delete(REDIS_PREFIX + "claim:" + key)
+
+    def publish(self, topic: str, payload) -> None:
+        self._redis.xadd(
+            REDIS_PREFIX + "events",
+            {"topic": topic, "payload": json.dumps(payload), "origin": PROCESS_ID},
+            maxlen=10000, approximate=True,
+        )
+
+    def last_event(self):
+        entries = self._redis.xrevrange(REDIS_PREFIX + "events", count=1)
+        return entries[0][0] if entries else "0-0"
+
+    def events_after(self, cursor) -> tuple:
+        streams = self._redis.xread({REDIS_PREFIX + "events": cursor}, count=1000)
+        if not streams:
+            return [], cursor
+        entries = streams[0][1]
+        return [
+            (fields["topic"], json.loads(fields["payload"]), fields["origin"]) for _, fields in entries
+        ], entries[-1][0]
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+def get_shared_state():
+    global _shared_state
+    if _shared_state is None:
+        with _shared_state_lock:
+            if _shared_state is None:
+                if SHARED_STATE_BACKEND == "local":
+                    _shared_state = LocalSharedState()
+                elif SHARED_STATE_BACKEND == "sqlite":
+                    _shared_state = SQLiteSharedState(SHARED_STATE_PATH)
+                elif SHARED_STATE_BACKEND == "redis":
+                    _shared_state = RedisSharedState(REDIS_URL)
+                else:
+                    raise ValueError(f"Unknown SHARED_STATE_BACKEND: {SHARED_STATE_BACKEND}")
+    return _shared_state
+
+_store_id = None
+
+def store_id() -> str:
+    """
+    Random id of the shared state, the same in every worker. ETags combine it
+    with counters, which restart from 0 when the state is reset (with the local
+    backend, on every restart).
+    """
+    global _store_id
+    if _store_id is None:
+        _store_id = get_shared_state().store_id()
+    return _store_id
+
+_handlers = defaultdict(list)  # topic -> [handler(payload)]
+_listener = None
+_bus_stats = {"published": 0, "received": 0, "handler_errors": 0, "poll_errors": 0, "last_poll_at": None}
+
+def subscribe(topic: str, handler) -> None:
+    """Runs `handler(payload)` on this worker whenever another worker publishes `topic`."""
+    _handlers[topic].append(handler)
+
+def publish(topic: str, payload=None) -> None:
+    """
+    Tells the other workers about a write already made here. Failures are
+    logged, not raised: the write succeeded and their caches catch up on
+    the next change or expiry.
+    """
+    if SHARED_STATE_BACKEND == "local":
+        return
+    try:
+        get_shared_state().publish(topic, payload)
+        _bus_stats["published"] += 1
+    except Exception as e:
+        logger.error(f"Could not publish {topic} event: {e}")
+
+def dispatch(events: list) -> None:
+    for topic, payload, origin in events:
+        if origin == PROCESS_ID:
+            continue
+        _bus_stats["received"] += 1
+        for handler in _handlers.get(topic, []):
+            try:
+                handler(payload)
+            except Exception as e:
+                _bus_stats["handler_errors"] += 1
+                logger.error(f"Handler for {topic} event failed: {e}")
+
+def start_listener() -> None:
+    """Starts the thread applying the other workers' events. A no-op with the local backend or if already running."""
+    global _listener
+    if SHARED_STATE_BACKEND == "local" or _listener is not None:
+        return
+    state = get_shared_state()
+    cursor = state.last_event()  # caches start empty, earlier events don't concern them
+
+    def listen():
+        nonlocal cursor
+        while True:
+            time.sleep(BUS_POLL_SECONDS)
+            try:
+                events, cursor = state.events_after(cursor)
+                _bus_stats["last_poll_at"] = time.time()
+            except Exception as e:
+                _bus_stats["poll_errors"] += 1
+                logger.warning(f"Polling shared state events failed: {e}")
+                continue
+            dispatch(events)
+
+    _listener = threading.Thread(target=listen, name="shared-state-bus", daemon=True)
+    _listener.start()
+    logger.info(f"Listening for {SHARED_STATE_BACKEND} shared state events (worker {os.getpid()})")
+
+def shared_state_stats() -> dict:
+    return {
+        "backend": SHARED_STATE_BACKEND,
+        "web_concurrency": WEB_CONCURRENCY,
+        "pid": os.getpid(),
+        "listening": _listener is not None,
+        "poll_seconds": BUS_POLL_SECONDS,
+        "topics": sorted(_handlers),
+        **_bus_stats,
+    }
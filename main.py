@@ -1,15 +1,46 @@
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Load environment variables before any other imports
 load_dotenv()
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from api.routes import router as api_router
+from api.utils.warmup import start_warm_up
+from api.utils.conversation import migrate_legacy_conversations
+from db import init_db
+from db.shared_state import start_listener
+from telemetry import setup_tracing, span, set_attributes
 
-app = FastAPI(title="Gym Agent API")
+setup_tracing()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Creating/seeding SQLite takes milliseconds; the vector store and agent are
+    # built by the warm-up (see WARMUP_MODE) or on first use.
+    await run_in_threadpool(init_db)
+    await run_in_threadpool(migrate_legacy_conversations)
+    # With several workers, applies the others' writes to this one's caches
+    start_listener()
+    await run_in_threadpool(start_warm_up)
+    yield
+
+app = FastAPI(title="Gym Agent API", lifespan=lifespan)
 app.include_router(api_router)
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Named after the route template once routing is done, so /documents/jobs/{job_id}
+    # is one span name (and one histogram series) however many job ids are requested.
+    with span("HTTP", {"http.method": request.method, "http.target": request.url.path}) as request_span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        request_span.update_name(f"{request.method} {route.path if route else 'unmatched'}")
+        set_attributes({"http.status_code": response.status_code})
+        return response
+
 @app.get("/")
 async def root():
     return {
@@ -18,4 +49,4 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
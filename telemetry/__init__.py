@@ -0,0 +1,4 @@
+from .tracing import setup_tracing, span, set_attributes
+from .metrics import render as render_metrics
+
+__all__ = ['setup_tracing', 'span', 'set_attributes', 'render_metrics']
@@ -0,0 +1,37 @@
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Every finished span is recorded here, labelled by span name (e.g. "POST /chat/",
+# "agent.step", "llm.generate", "tool.retriever", "embeddings.backend").
+span_duration = Histogram(
+    "gym_agent_span_duration_seconds",
+    "Duration of traced operations",
+    ["span", "status"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+llm_tokens = Histogram(
+    "gym_agent_llm_tokens",
+    "Tokens per LLM call",
+    ["direction"],
+    buckets=(16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+
+# WhatsApp webhook (api/utils/whatsapp.py)
+whatsapp_messages = Counter(
+    "gym_agent_whatsapp_messages",
+    "WhatsApp webhook messages by outcome",
+    ["outcome"],  # received, duplicate, unsupported, coalesced, rejected
+)
+whatsapp_queue_depth = Gauge(
+    "gym_agent_whatsapp_queue_depth",
+    "Coalesced WhatsApp message batches waiting for a worker",
+)
+whatsapp_reply_seconds = Histogram(
+    "gym_agent_whatsapp_reply_seconds",
+    "Time from receiving the first message of a batch to sending the reply",
+    ["status"],
+    buckets=(0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120),
+)
+
+def render() -> tuple:
+    """Returns (body, content type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
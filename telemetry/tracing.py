@@ -0,0 +1,75 @@
+import os
+import sys
+import logging
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from .metrics import span_duration, llm_tokens
+
+logger = logging.getLogger(__name__)
+
+# none (metrics only), console (stdout), file (one JSON span per line in TRACING_FILE)
+# or otlp (needs `pip install opentelemetry-exporter-otlp-proto-http`, configured with
+# the standard OTEL_EXPORTER_OTLP_ENDPOINT, default http://localhost:4318)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "data/traces.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "gym-agents")
+
+tracer = trace.get_tracer("gym-agents")
+
+class MetricsSpanProcessor(SpanProcessor):
+    """Feeds the duration (and token counts, for LLM calls) of every finished span to the Prometheus histograms."""
+
+    def on_end(self, span) -> None:
+        status = "error" if span.status.status_code == trace.StatusCode.ERROR else "ok"
+        span_duration.labels(span.name, status).observe((span.end_time - span.start_time) / 1e9)
+        for direction in ("input", "output"):
+            tokens = span.attributes.get(f"llm.{direction}_tokens")
+            if tokens is not None:
+                llm_tokens.labels(direction).observe(tokens)
+
+def build_exporter():
+    if TRACING_EXPORTER == "none":
+        return None
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter(out=sys.stdout)
+    if TRACING_EXPORTER == "file":
+        os.makedirs(os.path.dirname(TRACING_FILE) or ".", exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a", buffering=1),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+_configured = False
+
+def setup_tracing() -> None:
+    """Installs the tracer provider. Spans started before this (or in scripts that never call it) are no-ops."""
+    global _configured
+    if _configured:
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(MetricsSpanProcessor())
+    exporter = build_exporter()
+    if exporter is not None:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _configured = True
+    logger.info(f"Tracing enabled (exporter: {TRACING_EXPORTER})")
+
+def span(name: str, attributes: dict = None):
+    """Context manager starting a child span of the current one. None-valued attributes are dropped."""
+    return tracer.start_as_current_span(
+        name, attributes={key: value for key, value in (attributes or {}).items() if value is not None}
+    )
+
+def set_attributes(attributes: dict) -> None:
+    """Adds attributes to the current span."""
+    current = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            current.set_attribute(key, value)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The app keeps its data in relative paths (data/, chroma_db/) created at import;
+# run the tests from a scratch directory so they don't touch the checkout's.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="gym-agents-tests-"))
@@ -0,0 +1,25 @@
+from api.utils.answer_cache import AnswerCache, is_time_dependent
+
+def make_cache(version):
+    return AnswerCache(lambda text: None, max_entries=8, ttl=3600, threshold=0.9, data_version=lambda: version[0])
+
+def test_put_after_clear_is_dropped():
+    cache = make_cache([1])
+    stamp = cache.stamp()
+    cache.clear("documents changed")
+    cache.put("what are the opening hours", "7 to 22", stamp=stamp)
+    assert cache.lookup("what are the opening hours")[0] is None
+    assert cache.stats()["stale_puts"] == 1
+
+def test_data_version_change_expires_entries():
+    version = [1]
+    cache = make_cache(version)
+    cache.put("what are the opening hours", "7 to 22", stamp=cache.stamp())
+    assert cache.lookup("what are the opening hours")[0] == "7 to 22"
+    version[0] = 2  # e.g. the daily occurrence rollover
+    assert cache.lookup("what are the opening hours")[0] is None
+
+def test_time_dependent_questions():
+    assert is_time_dependent("Is the gym open now?")
+    assert is_time_dependent("¿Cuál es la próxima clase de yoga?")
+    assert not is_time_dependent("What are the opening hours?")
@@ -0,0 +1,40 @@
+from datetime import date
+from sqlalchemy import select, update
+from db.db import engine, init_db, gym_classes, class_occurrences, generate_occurrences
+
+def occurrences(class_id: int) -> list:
+    with engine.connect() as connection:
+        return [dict(row._mapping) for row in connection.execute(
+            select(class_occurrences).where(class_occurrences.c.class_id == class_id).order_by(class_occurrences.c.starts_at)
+        )]
+
+def test_regenerating_updates_duration_and_capacity():
+    init_db()
+    with engine.connect() as connection:
+        class_id = connection.execute(select(gym_classes.c.class_id).limit(1)).scalar()
+    occurrences_before = occurrences(class_id)
+    assert occurrences_before
+
+    booked, cancelled = occurrences_before[0], occurrences_before[1]
+    with engine.begin() as connection:
+        connection.execute(update(class_occurrences).where(
+            class_occurrences.c.occurrence_id == booked["occurrence_id"]).values(booked=3))
+        connection.execute(update(class_occurrences).where(
+            class_occurrences.c.occurrence_id == cancelled["occurrence_id"]).values(status="cancelled"))
+        connection.execute(update(gym_classes).where(gym_classes.c.class_id == class_id).values(
+            duration_mins=90, capacity=7))
+
+    assert generate_occurrences(start=date.today()) > 0
+
+    after = {row["occurrence_id"]: row for row in occurrences(class_id)}
+    for before in occurrences_before:
+        row = after[before["occurrence_id"]]
+        if before["occurrence_id"] in (booked["occurrence_id"], cancelled["occurrence_id"]):
+            assert (row["ends_at"], row["capacity"]) == (before["ends_at"], before["capacity"])
+        else:
+            start_minutes = int(row["starts_at"][11:13]) * 60 + int(row["starts_at"][14:16]) + 90
+            assert row["ends_at"][11:] == f"{start_minutes // 60 % 24:02d}:{start_minutes % 60:02d}"
+            assert row["capacity"] == 7
+
+    # Nothing left to change
+    assert generate_occurrences(start=date.today()) == 0
@@ -0,0 +1,42 @@
+import threading
+import pytest
+from db import reindex
+from db.shared_state import SQLiteSharedState
+
+@pytest.fixture
+def workers(monkeypatch, tmp_path):
+    """Two reindexers sharing one SQLite state, as two workers on a host would."""
+    state = SQLiteSharedState(str(tmp_path / "shared.db"))
+    release = threading.Event()
+    finished = []
+
+    def fake_reindex(job):
+        release.wait(5)
+        job["status"] = "succeeded"
+        finished.append(job["id"])
+        return job
+
+    monkeypatch.setattr(reindex, "SHARED_STATE_BACKEND", "sqlite")
+    monkeypatch.setattr(reindex, "get_shared_state", lambda: state)
+    monkeypatch.setattr(reindex, "new_collection_name", lambda model: f"docs_{model}")
+    monkeypatch.setattr(reindex, "reindex", fake_reindex)
+    # Not publishing the job lets both workers pass the shared-job check, as in the race
+    monkeypatch.setattr(reindex, "share_job", lambda job: None)
+    return reindex.Reindexer(), reindex.Reindexer(), release, finished
+
+def test_only_one_worker_claims_the_reindex(workers):
+    first, second, release, finished = workers
+    first.start("model-a")
+    with pytest.raises(reindex.ReindexInProgress):
+        second.start("model-b")
+    release.set()
+
+def test_claim_is_released_when_the_job_ends(workers):
+    first, second, release, finished = workers
+    done = threading.Event()
+    release.set()
+    first.start("model-a", on_complete=lambda job: done.set())
+    assert done.wait(5)
+
+    second.start("model-b")
+    assert second.get()["model"] == "model-b"
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import delete, insert, update
+import agent.router as router
+from agent.router import IntentRouter
+from db.db import engine, init_db, gym_classes, class_occurrences, mark_gym_classes_changed, generate_occurrences
+
+def unavailable(*args):
+    raise RuntimeError("no embeddings in tests")
+
+@pytest.fixture
+def intent_router():
+    init_db()
+    return IntentRouter(unavailable, unavailable, {"schedule", "faq"}, threshold=0.6, margin=0.05)
+
+def test_rule_match_wins_over_embeddings(intent_router):
+    intent_router._scores = lambda query: {"schedule": 0.1, "faq": 0.1, "other": 0.9}
+    assert intent_router.classify("cuándo es pilates")[:2] == ("schedule", "rule")
+
+def test_action_requests_go_to_the_agent(intent_router):
+    for query in ["quiero cancelar mi reserva de yoga de mañana", "can you close my account please",
+                  "I can't open the app", "is the pool open tomorrow",
+                  "book me a spot in yoga tomorrow and tell me the cancellation policy"]:
+        assert intent_router.classify(query)[0] is None, query
+
+def test_schedule_answer_is_capped(intent_router, monkeypatch):
+    monkeypatch.setattr(router, "ROUTER_MAX_CLASSES", 2)
+    answer = intent_router.answer_schedule("qué clases hay")
+    assert len([line for line in answer.splitlines() if line.startswith("- ")]) == 2
+    assert "Mostrando 2 de" in answer
+
+def test_cancelled_occurrences_are_left_out(intent_router):
+    tomorrow = date.today() + timedelta(days=1)
+    with engine.begin() as connection:
+        connection.execute(delete(gym_classes).where(gym_classes.c.class_id == 777))
+        connection.execute(insert(gym_classes).values(
+            class_id=777, class_name="Aquagym", instructor_name="Nora", start_time="12:00", duration_mins=45))
+    mark_gym_classes_changed()
+    generate_occurrences()
+    assert "Aquagym" in intent_router.answer_schedule("qué clases hay mañana")
+
+    with engine.begin() as connection:
+        connection.execute(update(class_occurrences).where(
+            class_occurrences.c.class_id == 777, class_occurrences.c.starts_at == f"{tomorrow.isoformat()} 12:00"
+        ).values(status="cancelled"))
+    assert "Aquagym" not in intent_router.answer_schedule("qué clases hay mañana")
+    assert "Aquagym" in intent_router.answer_schedule("qué clases hay hoy")
@@ -0,0 +1,30 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api.routes import document_routes
+from db.ingest_queue import IngestQueue
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    monkeypatch.setattr(document_routes, "ingest_queue", IngestQueue(workers=1, max_pending=0))
+    app = FastAPI()
+    app.include_router(document_routes.router)
+    return TestClient(app)
+
+def test_full_queue_leaves_data_untouched(client):
+    with open(os.path.join("data", "rules.txt"), "w") as f:
+        f.write("old rules")
+
+    response = client.post("/documents/upload", files={"file": ("rules.txt", b"new rules")})
+    assert response.status_code == 429
+
+    assert os.listdir("data") == ["rules.txt"]
+    with open(os.path.join("data", "rules.txt")) as f:
+        assert f.read() == "old rules"
+
+    response = client.post("/documents/upload", files={"file": ("schedule.txt", b"monday")})
+    assert response.status_code == 429
+    assert os.listdir("data") == ["rules.txt"]
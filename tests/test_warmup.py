@@ -0,0 +1,74 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import agent.agent
+import agent.router
+import db.keyword_index
+import db.rag_store
+from api.routes import health_routes
+from api.utils import warmup
+
+class FakePool:
+    def acquire(self):
+        return object()
+
+    def release(self, agent):
+        pass
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(warmup, "state", {
+        "status": "pending", "started_at": None, "finished_at": None, "attempts": 0, "components": {}, "error": None,
+    })
+    monkeypatch.setattr(db.keyword_index, "get_keyword_index", lambda store: None)
+    monkeypatch.setattr(agent.router.intent_router, "prepare", lambda: None)
+    monkeypatch.setattr(agent.agent, "agent_pool", FakePool())
+    app = FastAPI()
+    app.include_router(health_routes.router)
+    return TestClient(app)
+
+def test_ready_when_warm_up_is_off(client, monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_MODE", "off")
+    assert client.get("/health/ready").status_code == 503
+
+    warmup.start_warm_up()
+
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "off"
+
+def test_failed_warm_up_is_retried_until_ready(client, monkeypatch):
+    calls = []
+
+    def flaky_vector_store():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("embedding API unavailable")
+
+    monkeypatch.setattr(db.rag_store, "get_vector_store", flaky_vector_store)
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 0.01)
+
+    assert warmup.warm_up() is False
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "failed"
+    assert "embedding API unavailable" in response.json()["error"]
+
+    warmup.retry_warm_up()
+
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["attempts"] == 3
+    assert response.json()["error"] is None
+
+def test_no_retry_when_disabled(client, monkeypatch):
+    def failing_vector_store():
+        raise ConnectionError("embedding API unavailable")
+
+    monkeypatch.setattr(db.rag_store, "get_vector_store", failing_vector_store)
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 0)
+
+    warmup.warm_up_until_ready()
+
+    assert warmup.state["status"] == "failed"
+    assert warmup.state["attempts"] == 1
@@ -0,0 +1,134 @@
+"""
+Rendering of tool observations. Every observation is sent back to the LLM on
+each later step of a run, so outputs are kept compact and within a token budget.
+"""
+import io
+import os
+import csv
+import json
+import logging
+import threading
+import tiktoken
+from telemetry import set_attributes
+
+logger = logging.getLogger(__name__)
+
+# csv (header + one line per row) or json (one object per row, no indentation)
+SQL_OUTPUT_FORMAT = os.getenv("SQL_OUTPUT_FORMAT", "csv")
+# Max tokens of one sql_engine / retriever observation; longer ones are cut with a notice
+SQL_MAX_TOKENS = int(os.getenv("SQL_MAX_TOKENS", "800"))
+RETRIEVER_MAX_TOKENS = int(os.getenv("RETRIEVER_MAX_TOKENS", "1200"))
+# Shortest shared text counted as the splitter's chunk_overlap when merging adjacent chunks
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 100
+
+_encoding = None
+_stats_lock = threading.Lock()
+_stats = {}  # tool name -> {"calls", "tokens", "truncated"}
+
+def get_encoding():
+    """tiktoken's cl100k_base, or False if it can't be loaded (then tokens are estimated)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating tokens: {e}")
+            _encoding = False
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken's cl100k_base, falling back to ~4 chars per token if it can't load."""
+    encoding = get_encoding()
+    if encoding is False:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+def cap_tokens(text: str, max_tokens: int, notice: str) -> tuple:
+    """
+    Cuts `text` to at most `max_tokens` tokens, at the last line break when
+    there is one, and appends `notice`. Returns (text, truncated).
+    """
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    cut = truncate_tokens(text, max(max_tokens - count_tokens(notice) - 1, 0))
+    if "\n" in cut:
+        cut = cut[:cut.rfind("\n")]
+    return f"{cut}\n{notice}", True
+
+def render_rows(rows: list, format: str = SQL_OUTPUT_FORMAT) -> str:
+    """SQL result rows (dicts) as CSV with a header line, or as one compact JSON object per line."""
+    if not rows:
+        return "(no rows)"
+    if format == "json":
+        return "\n".join(json.dumps(row, ensure_ascii=False, default=str) for row in rows)
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(rows[0].keys())
+    writer.writerows([["" if value is None else value for value in row.values()] for row in rows])
+    return output.getvalue().rstrip("\n")
+
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest end of `left` that `right` starts with (between MIN and MAX_OVERLAP_CHARS), or 0."""
+    for size in range(min(MAX_OVERLAP_CHARS, len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def merge_overlapping(docs: list) -> list:
+    """
+    Joins chunks of the same source that the splitter's chunk_overlap made
+    share text (the end of one is the start of the other) and drops chunks
+    contained in another. Keeps the order of first appearance.
+    """
+    merged = []
+    for doc in docs:
+        text = doc.page_content.strip()
+        source = doc.metadata.get("source")
+        for i, (other_source, other_text, metadata) in enumerate(merged):
+            if other_source != source:
+                continue
+            if text in other_text:
+                break
+            if other_text in text:
+                merged[i] = (source, text, metadata)
+                break
+            size = overlap_length(other_text, text)
+            if size:
+                merged[i] = (source, other_text + text[size:], metadata)
+                break
+            size = overlap_length(text, other_text)
+            if size:
+                merged[i] = (source, text + other_text[size:], metadata)
+                break
+        else:
+            merged.append((source, text, doc.metadata))
+    return [(text, metadata) for _, text, metadata in merged]
+
+def record_output(tool: str, text: str, truncated: bool) -> int:
+    """Logs and accumulates the tokens one tool observation adds to the prompt. Returns the count."""
+    tokens = count_tokens(text)
+    with _stats_lock:
+        stats = _stats.setdefault(tool, {"calls": 0, "tokens": 0, "truncated": 0})
+        stats["calls"] += 1
+        stats["tokens"] += tokens
+        stats["truncated"] += int(truncated)
+    set_attributes({"tool.output_tokens": tokens, "tool.output_truncated": truncated})
+    logger.info(f"{tool} observation: {tokens} tokens{' (truncated)' if truncated else ''}")
+    return tokens
+
+def tool_output_stats() -> dict:
+    """Per tool: calls, total and average observation tokens, and how many were truncated."""
+    with _stats_lock:
+        return {
+            tool: {**stats, "tokens_avg": stats["tokens"] / stats["calls"] if stats["calls"] else 0.0}
+            for tool, stats in _stats.items()
+        }
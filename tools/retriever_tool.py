@@ -1,30 +1,66 @@
 from smolagents import Tool
-from langchain_chroma import Chroma
+from db.rag_store import get_vector_store, active_collection
+from db.retrieval import retrieve_many
+from tools.formatting import merge_overlapping, cap_tokens, record_output, RETRIEVER_MAX_TOKENS
 
 class RetrieverTool(Tool):
     name = "retriever"
-    description = (
-        "Uses semantic search to retrieve parts of documentation that could be most relevant. "
-        "It contains documents related to gym policies, rules, membership, and amenities information."
-        "You should query this tool in English!"
+    base_description = (
+        "Uses semantic and keyword search to retrieve parts of documentation that could be most relevant. "
+        "It contains documents related to gym policies, rules, membership, and amenities information. "
+        "{language}"
+        "When you need several facts, pass all the queries in one call instead of calling the tool several times."
     )
     inputs = {
-        "query": {
-            "type": "string",
+        "queries": {
+            "type": "array",
+            "items": {"type": "string"},
             "description": (
-                "The query to perform. Provide information aligned with your target documents. "
+                "The queries to perform, one per fact you need. Provide information aligned with your target documents. "
                 "Use the affirmative form rather than a question."
             ),
         }
     }
     output_type = "string"
 
-    def __init__(self, vector_store: Chroma, **kwargs):
-        super().__init__(**kwargs)
-        self.vector_store = vector_store
+    @property
+    def multilingual(self) -> bool:
+        """Whether the served collection's embedding model matches queries across languages."""
+        return active_collection()["multilingual"]
 
-    def forward(self, query: str) -> str:
-        docs = self.vector_store.similarity_search(query, k=3)
-        return "\nRetrieved documents:\n" + "".join(
-            [f"\n\n===== Document {i} =====\n{doc.page_content}" for i, doc in enumerate(docs)]
-        ) 
\ No newline at end of file
+    @property
+    def description(self) -> str:
+        # Read on every model call, so it follows a switch to another collection
+        if self.multilingual:
+            language = "Query it in the user's language (Spanish or English work equally well), do not translate. "
+        else:
+            language = "You should query this tool in English! "
+        return self.base_description.format(language=language)
+
+    def forward(self, queries: list) -> str:
+        if isinstance(queries, str):
+            queries = [queries]
+        results = retrieve_many(get_vector_store(), [q for q in queries if q.strip()])
+        passages = merge_overlapping(list(unique_documents(results).values()))
+        if not passages:
+            output, truncated = "No matching documents.", False
+        else:
+            output, truncated = cap_tokens(
+                "\n\n".join(f"[{i}] {text}" for i, (text, _) in enumerate(passages, start=1)),
+                RETRIEVER_MAX_TOKENS,
+                "(Further passages omitted to fit the token budget. Ask a more specific query if needed.)",
+            )
+        record_output(self.name, output, truncated)
+        return output
+
+def unique_documents(results: list) -> dict:
+    """
+    Merges the per-query results into {chunk_id: Document}, each chunk once,
+    taking the best hit of every query before the second best of any.
+    """
+    docs = {}
+    for rank in range(max((len(r) for r in results), default=0)):
+        for result in results:
+            if rank < len(result):
+                docs.setdefault(result[rank].id, result[rank])
+    return docs
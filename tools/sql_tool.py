@@ -1,27 +1,127 @@
 from smolagents import tool
-import json
-from sqlalchemy import create_engine, text
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from db.db import read_engine, gym_classes_version, ensure_occurrences
+from telemetry import span, set_attributes
+from tools.formatting import render_rows, cap_tokens, record_output, SQL_MAX_TOKENS
+
+# Rows returned to the agent; the rendered rows are also capped at SQL_MAX_TOKENS (tools/formatting.py)
+SQL_ROW_LIMIT = int(os.getenv("SQL_ROW_LIMIT", "50"))
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "2"))
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "256"))
+
+# Results keyed on (gym_classes version, normalized SQL). A write to the table
+# bumps the version, so stale entries stop matching and age out of the LRU.
+_result_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_string_literal = re.compile(r"('(?:[^']|'')*')")
+# Queries whose result changes without a write: the clock ('now', CURRENT_DATE,
+# date() with no arguments...) or random(). They always run and are never cached.
+_volatile_sql = re.compile(
+    r"'now'|\bcurrent_(date|time|timestamp)\b|\b(random|randomblob)\s*\("
+    r"|\b(date|time|datetime|julianday|unixepoch)\s*\(\s*\)",
+    re.IGNORECASE,
+)
+
+def normalize_sql(query: str) -> str:
+    """Collapses whitespace and drops trailing semicolons, leaving string literals untouched."""
+    parts = _string_literal.split(query.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    )
+
+def is_volatile_sql(query: str) -> bool:
+    """Whether the query reads the clock or random(), so its result can't be reused."""
+    return bool(_volatile_sql.search(query))
+
+def _run_query(query: str) -> tuple:
+    """Runs the query and renders it. Returns (output, truncated)."""
+    deadline = time.monotonic() + SQL_TIMEOUT_SECONDS
+    with span("sql.query", {"db.statement": query[:1000]}), read_engine.connect() as con:
+        # SQLite calls the handler every 1000 VM instructions; a non-zero
+        # return aborts the statement.
+        raw_connection = con.connection.dbapi_connection
+        raw_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        try:
+            result_set = con.execute(text(query))
+            rows = result_set.fetchmany(SQL_ROW_LIMIT + 1) if result_set.returns_rows else []
+        except OperationalError as error:
+            if "interrupted" in str(error):
+                raise TimeoutError(f"Query took longer than {SQL_TIMEOUT_SECONDS}s and was cancelled") from error
+            raise
+        finally:
+            raw_connection.set_progress_handler(None, 1000)
+        set_attributes({"db.rows": len(rows)})
+
+    results = [dict(row._mapping) for row in rows[:SQL_ROW_LIMIT]]
+    output, truncated = cap_tokens(
+        render_rows(results), SQL_MAX_TOKENS,
+        "(Output cut to fit the token budget. Select fewer columns or use a narrower WHERE clause.)",
+    )
+    if len(rows) > SQL_ROW_LIMIT and not truncated:
+        output += f"\n(Only the first {SQL_ROW_LIMIT} rows are shown. Use a narrower WHERE clause or a LIMIT.)"
+    return output, truncated or len(rows) > SQL_ROW_LIMIT
 
 @tool
 def sql_engine(query: str) -> str:
     """
-    Executes SQL queries on the gym_classes table.
-    The table has the following columns:
-      - class_id: INTEGER
-      - instructor_name: VARCHAR(32)
-      - class_name: VARCHAR(32)
-      - start_time: VARCHAR(5)
+    Executes read-only SQL queries (SQLite) on the gym schedule.
+    gym_classes holds the recurring weekly slots:
+      - class_id: INTEGER PRIMARY KEY
+      - class_name: VARCHAR(64)
+      - instructor_name: VARCHAR(64)
+      - location: VARCHAR(64)
+      - day_of_week: INTEGER, 0 = Sunday ... 6 = Saturday, NULL = every day
+      - start_time: VARCHAR(5), zero-padded 'HH:MM'
       - duration_mins: INTEGER
+      - capacity: INTEGER
+    class_occurrences holds the dated classes of the next two weeks:
+      - occurrence_id: INTEGER PRIMARY KEY
+      - class_id: INTEGER, references gym_classes
+      - starts_at, ends_at: VARCHAR(16), local 'YYYY-MM-DD HH:MM'
+      - capacity, booked: INTEGER
+      - status: 'scheduled' or 'cancelled'
+    Indexed columns: class_occurrences.starts_at, gym_classes (day_of_week, start_time),
+    (location, day_of_week, start_time), instructor_name and class_name. Compare them
+    directly (no functions around the column) so the lookups use the indexes, e.g.
+    classes in the next two hours:
+      SELECT c.class_name, o.starts_at, c.instructor_name FROM class_occurrences o
+      JOIN gym_classes c USING (class_id) WHERE o.status = 'scheduled'
+      AND o.starts_at BETWEEN strftime('%Y-%m-%d %H:%M', 'now', 'localtime')
+      AND strftime('%Y-%m-%d %H:%M', 'now', 'localtime', '+2 hours') ORDER BY o.starts_at
+    or a weekday's classes: WHERE day_of_week = 2 OR day_of_week IS NULL (Tuesday).
 
     Args:
         query: A valid SQL query to execute.
     Returns:
-        A JSON-formatted string of the query results.
+        The result rows, as CSV with a header line.
     """
-    engine_local = create_engine("sqlite:///data/gym_classes.db")
-    results = []
-    with engine_local.connect() as con:
-        result_set = con.execute(text(query))
-        for row in result_set:
-            results.append(dict(row._mapping))
-    return json.dumps(results, indent=2) 
\ No newline at end of file
+    # Before the cache key, so a new day's occurrences bump the version first
+    ensure_occurrences()
+    cacheable = not is_volatile_sql(query)
+    key = (gym_classes_version(), normalize_sql(query))
+    with _cache_lock:
+        if cacheable and key in _result_cache:
+            _result_cache.move_to_end(key)
+            set_attributes({"sql.cache_hit": True})
+            output, truncated = _result_cache[key]
+            record_output("sql_engine", output, truncated)
+            return output
+
+    set_attributes({"sql.cache_hit": False})
+    output, truncated = _run_query(query)
+
+    if cacheable:
+        with _cache_lock:
+            _result_cache[key] = (output, truncated)
+            while len(_result_cache) > SQL_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+    record_output("sql_engine", output, truncated)
+    return output